@@ -87,6 +87,19 @@ DATABASES = {
 }
 '''
 
+# Caché compartida entre los procesos del servidor; los resúmenes cacheados se invalidan
+# incrementando versiones (ver usuarios/cache.py), por lo que todos los workers deben verla
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+# Broker de los avisos de traslados (ver inventario/notificaciones.py). Debe ser compartido por todos
+# los procesos del servidor; inventario.notificaciones.BrokerMemoria solo sirve en pruebas.
+NOTIFICACIONES_BROKER = 'inventario.notificaciones.BrokerBaseDatos'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
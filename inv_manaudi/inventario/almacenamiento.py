@@ -0,0 +1,60 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+class AlmacenamientoDeduplicado(FileSystemStorage):
+    """
+    Guarda cada contenido una sola vez bajo su hash SHA-256.
+
+    Al subir un archivo se calcula el hash mientras se copia por bloques a un temporal; si el
+    contenido ya existe se descarta la copia y se devuelve el nombre del existente. Las filas que
+    apuntan a cada archivo se cuentan en ArchivoSoporte (ver inventario.signals), que lo borra
+    cuando deja de tener referencias.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo lo decide _save a partir del contenido
+        return name
+
+    def _save(self, name, content):
+        from .models import ArchivoSoporte
+
+        directorio = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(directorio), exist_ok=True)
+
+        resumen = hashlib.sha256()
+        tamano = 0
+        descriptor, temporal = tempfile.mkstemp(dir=self.path(directorio), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as destino:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for bloque in content.chunks():
+                    resumen.update(bloque)
+                    destino.write(bloque)
+                    tamano += len(bloque)
+
+            resumen = resumen.hexdigest()
+            archivo, _ = ArchivoSoporte.objects.get_or_create(hash=resumen, defaults={
+                'nombre': posixpath.join(directorio, resumen[:2], resumen + extension),
+                'tamano': tamano,
+            })
+            ruta = self.path(archivo.nombre)
+            if not os.path.exists(ruta):
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                # El temporal está en el mismo sistema de archivos: el reemplazo es atómico
+                os.replace(temporal, ruta)
+                if self.file_permissions_mode is not None:
+                    os.chmod(ruta, self.file_permissions_mode)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return archivo.nombre
+
+
+almacenamiento_documentos = AlmacenamientoDeduplicado()
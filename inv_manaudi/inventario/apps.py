@@ -5,3 +5,5 @@ class InventarioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inventario'
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1,7 +1,7 @@
 from django import forms
 from productos.models import Producto
 from usuarios.models import Sucursal
-from .models import MovimientoInventario, Traslado
+from .models import MovimientoInventario, Traslado, TrasladoDocumento
 
 
 class MovimientoInventarioForm(forms.ModelForm):
@@ -66,6 +66,23 @@ class MovimientoInventarioForm(forms.ModelForm):
         return documento_respaldo
 
 
+class MovimientoLoteLineaForm(forms.Form):
+    """Valida una línea de un lote de movimientos; sucursal y producto llegan como ids."""
+    sucursal = forms.IntegerField()
+    producto = forms.IntegerField()
+    tipo_movimiento = forms.ChoiceField(choices=MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+    tipo_documento = forms.ChoiceField(choices=MovimientoInventario.TIPO_DOCUMENTO_CHOICES)
+    cantidad = forms.IntegerField()
+    comentario = forms.CharField(required=False)
+    documento_respaldo = forms.CharField(error_messages={'required': 'El # de documento de respaldo es obligatorio.'})
+
+    def clean_cantidad(self):
+        cantidad = self.cleaned_data.get('cantidad')
+        if cantidad <= 0:
+            raise forms.ValidationError("La cantidad debe ser un número positivo.")
+        return cantidad
+
+
 class TrasladoForm(forms.ModelForm):
     class Meta:
         model = Traslado
@@ -109,6 +126,97 @@ class TrasladoForm(forms.ModelForm):
         return documento_respaldo
 
 
+class TrasladoDocumentoForm(forms.ModelForm):
+    class Meta:
+        model = TrasladoDocumento
+        fields = ['sucursal_origen', 'sucursal_destino', 'tipo_documento', 'documento_respaldo', 'documento_soporte']
+        widgets = {
+            'sucursal_origen': forms.Select(attrs={'class': 'form-control'}),
+            'sucursal_destino': forms.Select(attrs={'class': 'form-control'}),
+            'tipo_documento': forms.Select(attrs={'class': 'form-control'}),
+            'documento_respaldo': forms.Textarea(attrs={'class': 'form-control', 'rows': 1}),
+            'documento_soporte': forms.FileInput(attrs={'class': 'form-control'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+
+        if empresa:
+            self.fields['sucursal_origen'].queryset = Sucursal.objects.filter(empresa=empresa)
+            self.fields['sucursal_destino'].queryset = Sucursal.objects.filter(empresa=empresa)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('sucursal_origen') == cleaned_data.get('sucursal_destino'):
+            raise forms.ValidationError("La sucursal de origen y destino no pueden ser la misma.")
+        return cleaned_data
+
+    def clean_documento_respaldo(self):
+        documento_respaldo = self.cleaned_data.get('documento_respaldo')
+        if not documento_respaldo:
+            raise forms.ValidationError("El documento de respaldo es obligatorio.")
+        return documento_respaldo
+
+
+class TrasladoLineaForm(forms.Form):
+    producto = forms.ModelChoiceField(
+        queryset=Producto.objects.none(),
+        widget=forms.Select(attrs={'class': 'form-control select2'})
+    )
+    cantidad_entregada = forms.IntegerField(widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1}))
+
+    def __init__(self, *args, **kwargs):
+        empresa = kwargs.pop('empresa', None)
+        super().__init__(*args, **kwargs)
+
+        if empresa:
+            self.fields['producto'].queryset = Producto.objects.filter(empresa=empresa)
+
+    def clean_cantidad_entregada(self):
+        cantidad_entregada = self.cleaned_data.get('cantidad_entregada')
+        if cantidad_entregada <= 0:
+            raise forms.ValidationError("La cantidad entregada debe ser un número positivo.")
+        return cantidad_entregada
+
+
+class BaseTrasladoLineaFormSet(forms.BaseFormSet):
+    def clean(self):
+        if any(self.errors):
+            return
+        productos = [form.cleaned_data['producto'] for form in self.forms if form.cleaned_data]
+        if len(productos) != len(set(productos)):
+            raise forms.ValidationError("Cada producto solo puede aparecer en una línea del documento.")
+
+
+TrasladoLineaFormSet = forms.formset_factory(
+    TrasladoLineaForm, formset=BaseTrasladoLineaFormSet, extra=1, min_num=1, validate_min=True
+)
+
+
+class ConfirmarDocumentoForm(forms.Form):
+    """Un campo de cantidad recibida por cada línea pendiente del documento."""
+
+    def __init__(self, *args, **kwargs):
+        self.lineas = kwargs.pop('lineas')
+        super().__init__(*args, **kwargs)
+
+        for linea in self.lineas:
+            self.fields[f'recibida_{linea.pk}'] = forms.IntegerField(
+                min_value=0,
+                initial=linea.cantidad_entregada,
+                label=f'{linea.producto.codigo} - {linea.producto.nombre}',
+                widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 0}),
+                error_messages={'min_value': 'La cantidad recibida no puede ser negativa.'}
+            )
+
+    def filas(self):
+        return [(linea, self[f'recibida_{linea.pk}']) for linea in self.lineas]
+
+    def cantidades_recibidas(self):
+        return {linea.pk: self.cleaned_data[f'recibida_{linea.pk}'] for linea in self.lineas}
+
+
 class ConfirmarRecepcionForm(forms.ModelForm):
     class Meta:
         model = Traslado
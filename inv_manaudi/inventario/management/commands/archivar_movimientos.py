@@ -0,0 +1,50 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventario.models import MovimientoInventarioArchivado
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Mueve al archivo los movimientos de los meses anteriores al indicado y deja su resumen mensual'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--antes-de',
+            required=True,
+            help='Mes YYYY-MM; se archivan los movimientos anteriores al inicio de ese mes',
+        )
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=5000,
+            help='Movimientos por transacción (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mes = datetime.strptime(options['antes_de'], '%Y-%m').date()
+        except ValueError:
+            raise CommandError('El mes debe tener el formato YYYY-MM.')
+
+        # El mes en curso sigue recibiendo movimientos y no se puede archivar
+        if mes > timezone.localdate().replace(day=1):
+            raise CommandError('Solo se pueden archivar meses cerrados.')
+        limite = timezone.make_aware(datetime.combine(mes, time.min))
+
+        empresas = Empresa.objects.all()
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            total = MovimientoInventarioArchivado.objects.archivar(empresa, limite, options['tamano_bloque'])
+            self.stdout.write(self.style.SUCCESS(
+                f"  [OK] {empresa.nombre}: {total} movimientos archivados antes de {mes:%Y-%m}"
+            ))
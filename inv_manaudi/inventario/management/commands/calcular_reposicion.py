@@ -0,0 +1,94 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.reposicion import aplicar_reposicion, calcular_reposicion
+from productos.models import Producto
+from usuarios.models import Empresa, Sucursal
+
+
+class Command(BaseCommand):
+    help = 'Calcula el stock mínimo y la cantidad de reposición sugeridos a partir del historial de salidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=90,
+            help='Días de historial de salidas considerados (default: 90)',
+        )
+        parser.add_argument(
+            '--nivel-servicio',
+            type=float,
+            default=0.95,
+            help='Probabilidad de no quedar sin stock durante el plazo de reposición (default: 0.95)',
+        )
+        parser.add_argument(
+            '--plazo',
+            type=float,
+            default=7,
+            help='Plazo de reposición en días para sucursales sin traslados recibidos (default: 7)',
+        )
+        parser.add_argument(
+            '--revision',
+            type=int,
+            default=7,
+            help='Días de consumo que se reponen por encima del stock mínimo (default: 7)',
+        )
+        parser.add_argument(
+            '--salida',
+            help='Ruta de un reporte CSV con las filas que cambian',
+        )
+        parser.add_argument(
+            '--aplicar',
+            action='store_true',
+            help='Guarda los valores sugeridos en Inventario (sin esta opción solo se informan)',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.order_by('pk')
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        archivo = open(options['salida'], 'w', newline='', encoding='utf-8') if options['salida'] else None
+        try:
+            if archivo:
+                writer = csv.writer(archivo)
+                writer.writerow(['Empresa', 'Sucursal', 'Código', 'Producto', 'Stock', 'En tránsito',
+                                 'Consumo diario', 'Stock mínimo actual', 'Stock mínimo sugerido',
+                                 'Reposición sugerida'])
+            for empresa in empresas:
+                inicio = time.monotonic()
+                resultado = calcular_reposicion(empresa, options['dias'], options['nivel_servicio'],
+                                                options['plazo'], options['revision'])
+                cambios = (resultado['stock_minimo_sugerido'] != resultado['stock_minimo']) \
+                    | (resultado['reposicion_sugerida'] != resultado['cantidad_reposicion'])
+                mensaje = (f"  [OK] {empresa.nombre}: {len(resultado['ids'])} filas, {int(cambios.sum())} con cambios, "
+                           f"{int((resultado['reposicion_sugerida'] > 0).sum())} a reponer")
+
+                if archivo:
+                    indices = cambios.nonzero()[0]
+                    sucursales = Sucursal.objects.in_bulk(set(resultado['sucursales'][indices].tolist()))
+                    productos = Producto.objects.in_bulk(set(resultado['productos'][indices].tolist()))
+                    for i in indices:
+                        producto = productos[int(resultado['productos'][i])]
+                        writer.writerow([
+                            empresa.nombre, sucursales[int(resultado['sucursales'][i])].nombre, producto.codigo,
+                            producto.nombre, resultado['cantidad'][i], resultado['en_transito'][i],
+                            round(float(resultado['consumo_diario'][i]), 2), resultado['stock_minimo'][i],
+                            resultado['stock_minimo_sugerido'][i], resultado['reposicion_sugerida'][i],
+                        ])
+
+                if options['aplicar']:
+                    mensaje += f", {aplicar_reposicion(resultado)} actualizadas"
+                self.stdout.write(self.style.SUCCESS(f"{mensaje} ({time.monotonic() - inicio:.1f} s)"))
+        finally:
+            if archivo:
+                archivo.close()
+                self.stdout.write(self.style.SUCCESS(f"  [OK] Reporte generado en {options['salida']}"))
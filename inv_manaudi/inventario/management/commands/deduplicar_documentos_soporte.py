@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from inventario.almacenamiento import almacenamiento_documentos
+from inventario.models import ArchivoSoporte
+from inventario.signals import MODELOS_CON_DOCUMENTO
+
+
+class Command(BaseCommand):
+    help = ('Pasa los documentos de soporte existentes al almacenamiento deduplicado, recalcula las '
+            'referencias y borra las copias repetidas')
+
+    def handle(self, *args, **options):
+        nombres = set()
+        for modelo in MODELOS_CON_DOCUMENTO:
+            nombres.update(modelo.objects.exclude(documento_soporte__isnull=True).exclude(documento_soporte='')
+                           .values_list('documento_soporte', flat=True).distinct())
+        existentes = set(ArchivoSoporte.objects.filter(nombre__in=nombres).values_list('nombre', flat=True))
+        almacenado_inicial = ArchivoSoporte.objects.aggregate(total=Sum('tamano'))['total'] or 0
+
+        migrados = faltantes = liberados = 0
+        for nombre in sorted(nombres - existentes):
+            if not almacenamiento_documentos.exists(nombre):
+                self.stdout.write(self.style.WARNING(f"  [!] No se encontró {nombre}"))
+                faltantes += 1
+                continue
+            tamano = almacenamiento_documentos.size(nombre)
+            with almacenamiento_documentos.open(nombre) as archivo:
+                nuevo = almacenamiento_documentos.save(nombre, archivo)
+            with transaction.atomic():
+                for modelo in MODELOS_CON_DOCUMENTO:
+                    modelo.objects.filter(documento_soporte=nombre).update(documento_soporte=nuevo)
+            almacenamiento_documentos.delete(nombre)
+            migrados += 1
+            liberados += tamano
+
+        # Las referencias se recalculan desde las filas, lo que también corrige contadores desviados
+        referencias = Counter()
+        for modelo in MODELOS_CON_DOCUMENTO:
+            for fila in modelo.objects.exclude(documento_soporte__isnull=True).exclude(documento_soporte='') \
+                    .values('documento_soporte').annotate(total=Count('pk')).order_by():
+                referencias[fila['documento_soporte']] += fila['total']
+
+        archivos = list(ArchivoSoporte.objects.all())
+        for archivo in archivos:
+            archivo.referencias = referencias[archivo.nombre]
+        ArchivoSoporte.objects.bulk_update(archivos, ['referencias'], batch_size=1000)
+        borrados, _ = ArchivoSoporte.objects.depurar()
+
+        # Bytes de los originales borrados menos lo que ocupan ahora los contenidos únicos nuevos
+        almacenado_final = ArchivoSoporte.objects.aggregate(total=Sum('tamano'))['total'] or 0
+        liberados += almacenado_inicial - almacenado_final
+
+        self.stdout.write(self.style.SUCCESS(f"  [OK] {migrados} archivos migrados ({faltantes} no encontrados)"))
+        self.stdout.write(self.style.SUCCESS(f"  [OK] {borrados} archivos sin referencias eliminados"))
+        self.stdout.write(self.style.SUCCESS(
+            f"  [OK] {ArchivoSoporte.objects.count()} archivos únicos, {liberados / 1024 / 1024:.1f} MB liberados"))
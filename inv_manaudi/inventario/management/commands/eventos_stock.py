@@ -0,0 +1,71 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventario.models import EventoStock
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = ('Exporta como líneas JSON los cambios de stock posteriores a un cursor, o depura los eventos '
+            'antiguos con --depurar-dias')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa cuyos eventos se exportan',
+        )
+        parser.add_argument(
+            '--despues',
+            type=int,
+            default=0,
+            help='Último seq ya procesado; se exportan los siguientes (default: 0)',
+        )
+        parser.add_argument(
+            '--limite',
+            type=int,
+            default=10000,
+            help='Cantidad máxima de eventos a exportar (default: 10000)',
+        )
+        parser.add_argument(
+            '--salida',
+            help='Ruta del archivo de salida (default: salida estándar)',
+        )
+        parser.add_argument(
+            '--depurar-dias',
+            type=int,
+            help='Elimina los eventos con más de estos días de antigüedad en lugar de exportar',
+        )
+
+    def handle(self, *args, **options):
+        if options['depurar_dias'] is not None:
+            eliminados = EventoStock.objects.depurar(timezone.now() - timedelta(days=options['depurar_dias']))
+            self.stdout.write(self.style.SUCCESS(f"  [OK] {eliminados} eventos eliminados"))
+            return
+
+        if not options['empresa']:
+            raise CommandError('Debe indicar --empresa para exportar eventos.')
+        empresa = Empresa.objects.filter(pk=options['empresa']).first()
+        if empresa is None:
+            raise CommandError(f"No existe la empresa {options['empresa']}.")
+
+        eventos = EventoStock.objects.leer(empresa, options['despues'], options['limite'])
+        lineas = (json.dumps({
+            'seq': evento['seq'], 'sucursal': evento['sucursal_id'], 'producto': evento['producto_id'],
+            'delta': evento['delta'], 'saldo': evento['saldo'], 'fecha': evento['fecha'].isoformat(),
+        }) for evento in eventos)
+
+        if not options['salida']:
+            for linea in lineas:
+                self.stdout.write(linea)
+            return
+
+        with open(options['salida'], 'w', encoding='utf-8') as archivo:
+            for linea in lineas:
+                archivo.write(linea + '\n')
+        ultimo = eventos[-1]['seq'] if eventos else options['despues']
+        self.stdout.write(self.style.SUCCESS(
+            f"  [OK] {len(eventos)} eventos exportados a {options['salida']}, último seq {ultimo}"))
@@ -0,0 +1,46 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventario.models import InventarioSnapshot
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Congela el stock por sucursal y producto en un corte de período (por defecto, el cierre del mes anterior)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha',
+            help='Fecha de corte YYYY-MM-DD; el snapshot incluye los movimientos anteriores a esa fecha '
+                 '(default: primer día del mes actual)',
+        )
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+
+    def handle(self, *args, **options):
+        if options['fecha']:
+            try:
+                dia = datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('La fecha debe tener el formato YYYY-MM-DD.')
+        else:
+            dia = timezone.localdate().replace(day=1)
+
+        fecha_corte = timezone.make_aware(datetime.combine(dia, time.min))
+        if fecha_corte > timezone.now():
+            raise CommandError('La fecha de corte no puede estar en el futuro.')
+
+        empresas = Empresa.objects.all()
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            filas = InventarioSnapshot.objects.generar(empresa, fecha_corte)
+            self.stdout.write(self.style.SUCCESS(
+                f"  [OK] {empresa.nombre}: {filas} registros congelados al {dia:%Y-%m-%d}"
+            ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from inventario.models import Inventario, MovimientoInventario, Traslado
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Completa la columna empresa de Inventario, MovimientoInventario y Traslado a partir del producto'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=5000,
+            help='Filas actualizadas por sentencia UPDATE (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        for modelo in (Inventario, MovimientoInventario, Traslado):
+            total = 0
+            for empresa in Empresa.objects.all():
+                pendientes = modelo.objects.filter(empresa__isnull=True, producto__empresa=empresa)
+                while True:
+                    # Bloques acotados para no bloquear la tabla con una sola actualización larga
+                    pks = list(pendientes.values_list('pk', flat=True)[:options['tamano_bloque']])
+                    if not pks:
+                        break
+                    total += modelo.objects.filter(pk__in=pks).update(empresa=empresa)
+            self.stdout.write(self.style.SUCCESS(f"  [OK] {modelo._meta.verbose_name_plural}: {total} filas actualizadas"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventario.models import PropuestaTraslado
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Calcula propuestas de traslado entre sucursales para cubrir faltantes de stock mínimo con excedentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.order_by('pk')
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            inicio = time.monotonic()
+            propuestas = PropuestaTraslado.objects.generar(empresa)
+            unidades = sum(propuesta.cantidad for propuesta in propuestas)
+            self.stdout.write(self.style.SUCCESS(
+                f"  [OK] {empresa.nombre}: {len(propuestas)} propuestas, {unidades} unidades "
+                f"({time.monotonic() - inicio:.1f} s)"))
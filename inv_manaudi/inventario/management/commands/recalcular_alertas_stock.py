@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventario.models import AlertaStock, Inventario
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla AlertaStock comparando cantidad y stock mínimo de cada fila de inventario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=5000,
+            help='Filas de inventario revisadas por transacción (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.order_by('pk')
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            ultimo = 0
+            while True:
+                with transaction.atomic():
+                    bloque = list(Inventario.objects.select_for_update().filter(empresa=empresa, pk__gt=ultimo)
+                                  .order_by('pk')[:options['tamano_bloque']])
+                    if not bloque:
+                        break
+                    AlertaStock.objects.sincronizar(bloque)
+                ultimo = bloque[-1].pk
+            alertas = AlertaStock.objects.filter(empresa=empresa)
+            self.stdout.write(self.style.SUCCESS(
+                f"  [OK] {empresa.nombre}: {alertas.filter(tipo='bajo').count()} con stock bajo, "
+                f"{alertas.filter(tipo='agotado').count()} agotados"))
@@ -0,0 +1,96 @@
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from inventario.models import Inventario
+from productos.models import Producto
+from usuarios.models import Sucursal
+
+
+def _discrepancias_sucursal(sucursal_id, tamano_bloque):
+    """Tarea del pool: cada proceso abre su propia conexión y la cierra al terminar."""
+    try:
+        return sucursal_id, list(Inventario.objects.discrepancias(sucursal_id, tamano_bloque))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Compara el stock de Inventario con el saldo de MovimientoInventario y genera un reporte de diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Número de procesos en paralelo, uno por sucursal a la vez (default: núcleos disponibles)',
+        )
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=1000,
+            help='Productos por consulta al calcular saldos (default: 1000)',
+        )
+        parser.add_argument(
+            '--salida',
+            help='Ruta del reporte CSV (default: reconciliacion_inventario_<fecha>.csv)',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Registra movimientos de ajuste para que el saldo de movimientos coincida con el stock',
+        )
+
+    def handle(self, *args, **options):
+        sucursales = Sucursal.objects.select_related('empresa').order_by('pk')
+        if options['empresa']:
+            sucursales = sucursales.filter(empresa_id=options['empresa'])
+        sucursales = {sucursal.pk: sucursal for sucursal in sucursales}
+
+        resultados = {}
+        if options['procesos'] > 1 and len(sucursales) > 1:
+            # Las conexiones abiertas no pueden compartirse con los procesos hijos
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['procesos'],
+                                     mp_context=multiprocessing.get_context('fork')) as pool:
+                tareas = [pool.submit(_discrepancias_sucursal, pk, options['tamano_bloque']) for pk in sucursales]
+                for tarea in as_completed(tareas):
+                    sucursal_id, discrepancias = tarea.result()
+                    resultados[sucursal_id] = discrepancias
+        else:
+            for pk in sucursales:
+                resultados[pk] = list(Inventario.objects.discrepancias(pk, options['tamano_bloque']))
+
+        producto_ids = {producto_id for discrepancias in resultados.values() for producto_id, _, _ in discrepancias}
+        productos = Producto.objects.in_bulk(producto_ids)
+
+        salida = options['salida'] or f'reconciliacion_inventario_{timezone.localtime():%Y%m%d_%H%M%S}.csv'
+        with open(salida, 'w', newline='', encoding='utf-8') as archivo:
+            writer = csv.writer(archivo)
+            writer.writerow(['Empresa', 'Sucursal', 'Código', 'Producto', 'Stock', 'Saldo Movimientos', 'Diferencia'])
+            for sucursal_id in sorted(resultados):
+                sucursal = sucursales[sucursal_id]
+                for producto_id, cantidad, saldo in resultados[sucursal_id]:
+                    producto = productos[producto_id]
+                    writer.writerow([sucursal.empresa.nombre, sucursal.nombre, producto.codigo, producto.nombre,
+                                     cantidad, saldo, cantidad - saldo])
+
+        for sucursal_id in sorted(resultados):
+            discrepancias = resultados[sucursal_id]
+            mensaje = f"  [OK] {sucursales[sucursal_id].nombre}: {len(discrepancias)} diferencias"
+            if options['fix'] and discrepancias:
+                ajustes = Inventario.objects.conciliar_movimientos(sucursal_id, discrepancias)
+                mensaje += f", {len(ajustes)} movimientos de ajuste registrados"
+            self.stdout.write(self.style.SUCCESS(mensaje))
+
+        self.stdout.write(self.style.SUCCESS(f"  [OK] Reporte generado en {salida}"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from inventario.models import MovimientoDiario
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen diario de movimientos a partir de MovimientoInventario'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.all()
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            filas = MovimientoDiario.objects.reconstruir(empresa)
+            self.stdout.write(self.style.SUCCESS(f"  [OK] {empresa.nombre}: {filas} filas de resumen diario"))
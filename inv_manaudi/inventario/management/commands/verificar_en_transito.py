@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from inventario.models import StockEnTransito
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Compara los contadores de stock en tránsito con los traslados pendientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Corrige los contadores con los valores de los traslados pendientes',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.order_by('pk')
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            diferencias = StockEnTransito.objects.verificar(empresa, corregir=options['fix'])
+            for tipo, origen, destino, producto_id, contador, esperado in diferencias:
+                ruta = f"{origen} -> {destino}" if tipo == 'ruta' else f"destino {destino}"
+                self.stdout.write(self.style.WARNING(
+                    f"  [!] {empresa.nombre}: {ruta}, producto {producto_id}: contador {contador}, "
+                    f"traslados pendientes {esperado}"))
+            mensaje = f"  [OK] {empresa.nombre}: {len(diferencias)} diferencias"
+            if options['fix'] and diferencias:
+                mensaje += " corregidas"
+            self.stdout.write(self.style.SUCCESS(mensaje))
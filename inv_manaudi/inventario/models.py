@@ -1,22 +1,237 @@
-from django.db import models
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from itertools import chain, groupby
+
+from django.db import models, transaction, connection, IntegrityError
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from productos.models import Producto
+from usuarios.cache import obtener_version, incrementar_version
 from usuarios.models import Empresa, Sucursal
+from .almacenamiento import almacenamiento_documentos
+from .notificaciones import notificar_traslado
+
+
+def invalidar_cache_inventario(empresa_id, producto_ids):
+    """
+    Invalida los datos cacheados de la empresa (conteos de listados) y el resumen de los productos
+    afectados cuando la transacción en curso se confirma. Invalidar antes del commit permitiría que
+    otra petición cachee los datos viejos con la versión nueva.
+    """
+    producto_ids = set(producto_ids)
+
+    def invalidar():
+        incrementar_version('empresa', empresa_id)
+        for pk in producto_ids:
+            incrementar_version('producto', pk)
+
+    transaction.on_commit(invalidar)
+
+
+def saldos_agrupados(querysets, *campos):
+    """
+    Suma entradas menos salidas agrupando por ``campos`` sobre uno o más querysets de movimientos
+    (la tabla activa y el archivo tienen las mismas columnas).
+
+    :return: diccionario {valor del campo, o tupla si son varios: saldo}
+    """
+    saldos = defaultdict(int)
+    for movimientos in querysets:
+        for fila in movimientos.order_by().values(*campos).annotate(
+                entradas=Sum('cantidad', filter=Q(tipo_movimiento='entrada')),
+                salidas=Sum('cantidad', filter=Q(tipo_movimiento='salida'))):
+            clave = tuple(fila[campo] for campo in campos) if len(campos) > 1 else fila[campos[0]]
+            saldos[clave] += (fila['entradas'] or 0) - (fila['salidas'] or 0)
+    return saldos
+
+
+class ArchivoSoporteManager(models.Manager):
+    def ajustar_referencias(self, nombres, delta=1):
+        """
+        Suma ``delta`` a las referencias de cada archivo nombrado (los nombres repetidos cuentan
+        varias veces). Los archivos que quedan sin referencias se borran cuando la transacción se
+        confirma. Los nombres que no están en la tabla (archivos anteriores a la deduplicación)
+        se ignoran.
+        """
+        conteo = Counter(nombre for nombre in nombres if nombre)
+        for nombre, veces in conteo.items():
+            self.filter(nombre=nombre).update(referencias=F('referencias') + veces * delta)
+        if delta < 0 and conteo:
+            transaction.on_commit(lambda: self.depurar(list(conteo)))
+
+    def depurar(self, nombres=None):
+        """
+        Borra los archivos sin referencias, opcionalmente solo entre ``nombres``.
+
+        :return: tupla (archivos borrados, bytes liberados)
+        """
+        huerfanos = self.filter(referencias__lte=0)
+        if nombres is not None:
+            huerfanos = huerfanos.filter(nombre__in=nombres)
+        borrados = liberados = 0
+        for archivo in huerfanos:
+            # Solo si nadie lo volvió a referenciar entre la consulta y el borrado
+            if self.filter(pk=archivo.pk, referencias__lte=0).delete()[0]:
+                almacenamiento_documentos.delete(archivo.nombre)
+                borrados += 1
+                liberados += archivo.tamano
+        return borrados, liberados
+
+
+class ArchivoSoporte(models.Model):
+    """
+    Contenido único de los documentos de soporte, guardado una vez bajo su hash SHA-256 por
+    AlmacenamientoDeduplicado. ``referencias`` cuenta las filas cuyo documento_soporte apunta a él.
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    nombre = models.CharField(max_length=100, unique=True)
+    tamano = models.PositiveBigIntegerField()
+    referencias = models.IntegerField(default=0)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    objects = ArchivoSoporteManager()
+
+    def __str__(self):
+        return f'{self.nombre} ({self.referencias} referencias)'
+
+
+class InventarioManager(models.Manager):
+    def ajustar_cantidad(self, sucursal, producto, delta):
+        """
+        Aplica un delta de stock con un UPDATE condicional sobre la fila de inventario.
+
+        Las salidas solo se aplican si el stock alcanza (WHERE cantidad >= n), de modo que
+        dos salidas concurrentes nunca dejan el stock en negativo. Debe llamarse dentro de
+        ``transaction.atomic`` junto con el registro del movimiento.
+
+        :return: True si se aplicó el delta, False si el stock es insuficiente
+        """
+        inventario, _ = self.get_or_create(sucursal=sucursal, producto=producto,
+                                           defaults={'empresa_id': producto.empresa_id})
+        filas = self.filter(pk=inventario.pk)
+        if delta < 0:
+            filas = filas.filter(cantidad__gte=-delta)
+        if filas.update(cantidad=F('cantidad') + delta, ultima_actualizacion=timezone.now()) != 1:
+            return False
+        # La fila ya está bloqueada por el UPDATE, así que el valor leído es el que quedó
+        inventario.refresh_from_db(fields=['cantidad', 'stock_minimo'])
+        AlertaStock.objects.sincronizar([inventario], {inventario.pk: inventario.cantidad - delta})
+        EventoStock.objects.registrar([(inventario, delta)])
+        return True
+
+    def discrepancias(self, sucursal_id, tamano_bloque=1000):
+        """
+        Compara el stock de cada producto de la sucursal con el saldo neto de sus movimientos.
+
+        Recorre las filas de inventario por bloques de ``tamano_bloque`` productos y calcula el saldo
+        de cada bloque con una sola consulta agrupada. También incluye los productos que tienen
+        movimientos pero no fila de inventario (su stock se considera 0).
+
+        :return: generador de tuplas (producto_id, stock, saldo_movimientos) que no coinciden
+        """
+        def saldos(condicion):
+            # Movimientos activos más el resumen mensual de los meses archivados
+            saldos = saldos_agrupados(
+                [MovimientoInventario.objects.filter(condicion, sucursal_id=sucursal_id)], 'producto_id'
+            )
+            for fila in MovimientoMensual.objects.filter(condicion, sucursal_id=sucursal_id).values('producto_id') \
+                    .annotate(entradas=Sum('entradas'), salidas=Sum('salidas')).order_by():
+                saldos[fila['producto_id']] += fila['entradas'] - fila['salidas']
+            return saldos
+
+        ultimo = 0
+        while True:
+            bloque = list(self.filter(sucursal_id=sucursal_id, producto_id__gt=ultimo).order_by('producto_id')
+                          .values_list('producto_id', 'cantidad')[:tamano_bloque])
+            if not bloque:
+                break
+            ultimo = bloque[-1][0]
+            saldos_bloque = saldos(Q(producto_id__in=[producto_id for producto_id, _ in bloque]))
+            for producto_id, cantidad in bloque:
+                saldo = saldos_bloque.get(producto_id, 0)
+                if saldo != cantidad:
+                    yield producto_id, cantidad, saldo
+
+        sin_inventario = saldos(~Q(producto_id__in=self.filter(sucursal_id=sucursal_id).values('producto_id')))
+        for producto_id, saldo in sorted(sin_inventario.items()):
+            if saldo:
+                yield producto_id, 0, saldo
+
+    def conciliar_movimientos(self, sucursal_id, discrepancias, usuario=None):
+        """
+        Registra movimientos de ajuste para que el saldo de movimientos coincida con el stock.
+
+        El stock se toma como el valor correcto (proviene de conteos o de la carga masiva), por lo
+        que los ajustes se insertan en bloque sin pasar por ``ajustar_cantidad``.
+
+        :param discrepancias: tuplas (producto_id, stock, saldo_movimientos) de ``discrepancias``
+        :return: lista de movimientos de ajuste creados
+        """
+        productos = Producto.objects.in_bulk([producto_id for producto_id, _, _ in discrepancias])
+        lote = uuid.uuid4()
+        ajustes = []
+        for producto_id, cantidad, saldo in discrepancias:
+            diferencia = cantidad - saldo
+            ajustes.append(MovimientoInventario(
+                empresa_id=productos[producto_id].empresa_id,
+                sucursal_id=sucursal_id,
+                producto=productos[producto_id],
+                tipo_movimiento='entrada' if diferencia > 0 else 'salida',
+                tipo_documento='otros',
+                cantidad=abs(diferencia),
+                comentario=f'Ajuste de conciliación: stock {cantidad}, saldo de movimientos {saldo}',
+                usuario=usuario,
+                lote=lote,
+            ))
+        with transaction.atomic():
+            MovimientoInventario.objects.bulk_create(ajustes)
+            MovimientoDiario.objects.acumular(ajustes)
+            invalidar_cache_inventario(
+                Sucursal.objects.values_list('empresa_id', flat=True).get(pk=sucursal_id), productos)
+        return ajustes
 
 
 class Inventario(models.Model):
+    # Copia de producto.empresa para filtrar por empresa sin unir con productos
+    empresa = models.ForeignKey(Empresa, related_name='inventarios', on_delete=models.CASCADE, null=True, blank=True,
+                                editable=False)
     sucursal = models.ForeignKey(Sucursal, related_name='inventarios', on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, related_name='inventarios', on_delete=models.CASCADE)
     cantidad = models.IntegerField(default=0)
     stock_minimo = models.IntegerField(default=0)  # Nuevo campo para el stock mínimo
+    # Cantidad a reponer sugerida en el último cálculo de calcular_reposicion
+    cantidad_reposicion = models.IntegerField(default=0)
+    # Unidades de traslados pendientes en camino hacia esta sucursal (ver StockEnTransito)
+    en_transito = models.IntegerField(default=0)
     ultima_actualizacion = models.DateTimeField(auto_now=True)
 
+    objects = InventarioManager()
+
     class Meta:
         unique_together = ('sucursal', 'producto')
+        indexes = [
+            models.Index(fields=['empresa', 'sucursal']),
+        ]
 
     def __str__(self):
         return f'{self.producto.nombre} - {self.sucursal.nombre} - {self.cantidad} {self.producto.get_tipo_producto_display()}'
 
+    def save(self, *args, **kwargs):
+        if self.empresa_id is None:
+            self.empresa_id = self.producto.empresa_id
+        with transaction.atomic():
+            # Las ediciones directas de la cantidad (carga masiva, admin) también generan su evento
+            anterior = Inventario.objects.filter(pk=self.pk).values_list('cantidad', flat=True).first() \
+                if self.pk else None
+            super(Inventario, self).save(*args, **kwargs)
+            AlertaStock.objects.sincronizar([self])
+            if self.cantidad != (anterior or 0):
+                EventoStock.objects.registrar([(self, self.cantidad - (anterior or 0))])
+
     def is_stock_bajo(self):
         """Verifica si el stock actual está por debajo del stock mínimo."""
         return self.cantidad < self.stock_minimo
@@ -26,6 +241,291 @@ class Inventario(models.Model):
         return self.cantidad * self.producto.precio
 
 
+def estados_alerta(cantidad, stock_minimo):
+    """Tipos de AlertaStock que corresponden a una fila de inventario con esos valores."""
+    estados = set()
+    if cantidad <= stock_minimo:
+        estados.add('bajo')
+    if cantidad <= 0:
+        estados.add('agotado')
+    return estados
+
+
+class AlertaStockManager(models.Manager):
+    def sincronizar(self, inventarios, anteriores=None):
+        """
+        Crea o elimina las alertas de las filas de inventario según su cantidad y stock mínimo.
+
+        :param inventarios: filas de Inventario con cantidad y stock_minimo actuales
+        :param anteriores: diccionario opcional {id del inventario: cantidad anterior}; si se indica,
+            solo se tocan las filas cuya cantidad cruzó el stock mínimo o el cero, sin consultar
+            la tabla de alertas para las demás
+        """
+        if anteriores is not None:
+            inventarios = [inventario for inventario in inventarios
+                           if estados_alerta(anteriores[inventario.pk], inventario.stock_minimo)
+                           != estados_alerta(inventario.cantidad, inventario.stock_minimo)]
+        if not inventarios:
+            return
+
+        actuales = defaultdict(set)
+        for inventario_id, tipo in self.filter(inventario__in=[inventario.pk for inventario in inventarios]) \
+                .values_list('inventario_id', 'tipo'):
+            actuales[inventario_id].add(tipo)
+
+        sobrantes = Q()
+        nuevas = []
+        for inventario in inventarios:
+            esperados = estados_alerta(inventario.cantidad, inventario.stock_minimo)
+            for tipo in actuales[inventario.pk] - esperados:
+                sobrantes |= Q(inventario_id=inventario.pk, tipo=tipo)
+            nuevas.extend(
+                self.model(empresa_id=inventario.empresa_id, sucursal_id=inventario.sucursal_id,
+                           producto_id=inventario.producto_id, inventario_id=inventario.pk, tipo=tipo)
+                for tipo in esperados - actuales[inventario.pk]
+            )
+        if sobrantes:
+            self.filter(sobrantes).delete()
+        self.bulk_create(nuevas, ignore_conflicts=True)
+
+
+class AlertaStock(models.Model):
+    """
+    Filas de inventario en o bajo su stock mínimo (``bajo``) o sin stock (``agotado``).
+
+    Se mantiene al registrar movimientos, que solo escriben aquí cuando la cantidad cruza el
+    stock mínimo o el cero, para que los listados y conteos de alertas lean únicamente las
+    filas en alerta en lugar de comparar cantidad con stock_minimo en todo el inventario.
+    """
+    TIPO_CHOICES = [
+        ('bajo', 'Stock bajo'),
+        ('agotado', 'Agotado'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, related_name='alertas_stock', on_delete=models.CASCADE, null=True,
+                                blank=True)
+    sucursal = models.ForeignKey(Sucursal, related_name='alertas_stock', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='alertas_stock', on_delete=models.CASCADE)
+    inventario = models.ForeignKey(Inventario, related_name='alertas', on_delete=models.CASCADE)
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    desde = models.DateTimeField(auto_now_add=True)
+
+    objects = AlertaStockManager()
+
+    class Meta:
+        unique_together = ('inventario', 'tipo')
+        indexes = [
+            models.Index(fields=['empresa', 'tipo', 'sucursal']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_tipo_display()}: {self.producto.nombre} en {self.sucursal.nombre} desde {self.desde:%d/%m/%Y}'
+
+
+class EventoStockManager(models.Manager):
+    # Los eventos más recientes que esto no se entregan: una transacción que obtuvo un seq menor
+    # puede confirmarse después que otra con un seq mayor, y el consumidor ya habría avanzado el cursor
+    MARGEN_VISIBILIDAD = timedelta(seconds=5)
+
+    def registrar(self, cambios):
+        """
+        Agrega un evento por cambio de stock. Debe llamarse en la misma transacción que el cambio,
+        así el evento existe si y solo si el cambio se confirmó.
+
+        :param cambios: lista de tuplas (inventario con la cantidad resultante, delta aplicado)
+        """
+        self.bulk_create([
+            self.model(empresa_id=inventario.empresa_id, sucursal_id=inventario.sucursal_id,
+                       producto_id=inventario.producto_id, delta=delta, saldo=inventario.cantidad)
+            for inventario, delta in cambios
+        ])
+
+    def leer(self, empresa, despues=0, limite=1000, sucursal=None, margen=None):
+        """
+        Eventos de la empresa con seq mayor que ``despues``, en orden de seq.
+
+        :param despues: último seq procesado por el consumidor (su cursor)
+        :param margen: antigüedad mínima de los eventos entregados (default: MARGEN_VISIBILIDAD)
+        :return: lista de diccionarios con seq, sucursal, producto, delta, saldo y fecha
+        """
+        margen = self.MARGEN_VISIBILIDAD if margen is None else margen
+        eventos = self.filter(empresa=empresa, seq__gt=despues, fecha__lte=timezone.now() - margen)
+        if sucursal is not None:
+            eventos = eventos.filter(sucursal=sucursal)
+        return list(eventos.order_by('seq').values(
+            'seq', 'sucursal_id', 'producto_id', 'delta', 'saldo', 'fecha')[:limite])
+
+    def depurar(self, antes_de, tamano_bloque=10000):
+        """Elimina por bloques los eventos anteriores a ``antes_de``; devuelve la cantidad eliminada."""
+        eliminados = 0
+        while True:
+            pks = list(self.filter(fecha__lt=antes_de).order_by('seq').values_list('seq', flat=True)[:tamano_bloque])
+            if not pks:
+                return eliminados
+            eliminados += self.filter(seq__in=pks).delete()[0]
+
+
+class EventoStock(models.Model):
+    """
+    Bandeja de salida de cambios de stock para sincronizar sistemas externos (ERP, tienda en línea).
+
+    Cada cambio en Inventario.cantidad agrega un evento en la misma transacción. Los consumidores
+    guardan el último ``seq`` procesado y piden los siguientes (vista eventos_stock o comando
+    eventos_stock) en lugar de recorrer todo el inventario.
+    """
+    seq = models.BigAutoField(primary_key=True)
+    empresa = models.ForeignKey(Empresa, related_name='eventos_stock', on_delete=models.CASCADE, null=True, blank=True)
+    sucursal = models.ForeignKey(Sucursal, related_name='eventos_stock', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='eventos_stock', on_delete=models.CASCADE)
+    delta = models.IntegerField()
+    saldo = models.IntegerField()
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = EventoStockManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'seq']),
+        ]
+
+    def __str__(self):
+        return f'#{self.seq} {self.delta:+d} {self.producto.nombre} en {self.sucursal.nombre} (saldo {self.saldo})'
+
+
+class AvisoTrasladoManager(models.Manager):
+    # Los avisos solo sirven mientras los clientes esperan; los más antiguos se eliminan al publicar
+    RETENCION = timedelta(days=1)
+
+    def publicar(self, canales, datos):
+        """Agrega el aviso una vez por canal; cada fila tiene su propio id creciente."""
+        self.filter(fecha__lt=timezone.now() - self.RETENCION).delete()
+        self.bulk_create([self.model(canal=canal, datos=datos) for canal in canales])
+
+    def leer(self, canales, despues, limite=100):
+        """Avisos para alguno de los canales con id mayor que ``despues``, en orden de id."""
+        return [dict(datos, id=pk) for pk, datos in self.filter(canal__in=canales, pk__gt=despues)
+                .order_by('pk').values_list('pk', 'datos')[:limite]]
+
+    def ultimo(self):
+        return self.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+class AvisoTraslado(models.Model):
+    """Aviso de un traslado creado o confirmado para un canal (ver notificaciones.BrokerBaseDatos)."""
+    id = models.BigAutoField(primary_key=True)
+    canal = models.CharField(max_length=50)
+    datos = models.JSONField()
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = AvisoTrasladoManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['canal', 'id']),
+        ]
+
+    def __str__(self):
+        return f'#{self.id} {self.canal}: {self.datos}'
+
+
+class MovimientoInventarioManager(models.Manager):
+    def registrar_lote(self, lineas, empresa, usuario=None, todo_o_nada=False):
+        """
+        Registra varios movimientos en una sola transacción.
+
+        Valida todas las líneas en una pasada (sucursales, productos y stock disponible se leen
+        con una consulta cada uno), inserta los movimientos con ``bulk_create`` y aplica un único
+        delta neto por (sucursal, producto). Las salidas se evalúan en el orden recibido contra el
+        stock bloqueado, así que una línea sin stock suficiente se rechaza sin afectar a las demás.
+
+        :param lineas: lista de diccionarios con sucursal, producto (ids), tipo_movimiento,
+            tipo_documento, cantidad y opcionalmente comentario, documento_respaldo y documento_soporte
+        :param empresa: empresa a la que deben pertenecer sucursales y productos
+        :param todo_o_nada: si es True, cualquier error descarta el lote completo
+        :return: tupla (movimientos registrados, lista de (indice, mensaje) de las líneas rechazadas)
+        """
+        errores = []
+        sucursales = Sucursal.objects.filter(empresa=empresa).in_bulk({linea['sucursal'] for linea in lineas})
+        productos = Producto.objects.para_empresa(empresa).in_bulk({linea['producto'] for linea in lineas})
+
+        validas = []
+        for indice, linea in enumerate(lineas):
+            if linea['sucursal'] not in sucursales:
+                errores.append((indice, 'La sucursal no existe o no pertenece a la empresa.'))
+            elif linea['producto'] not in productos:
+                errores.append((indice, 'El producto no existe o no pertenece a la empresa.'))
+            else:
+                validas.append((indice, linea))
+
+        if errores and todo_o_nada:
+            return [], errores
+
+        lote = uuid.uuid4()
+        with transaction.atomic():
+            claves = {(linea['sucursal'], linea['producto']) for _, linea in validas}
+            Inventario.objects.bulk_create(
+                [Inventario(empresa=empresa, sucursal_id=s, producto_id=p) for s, p in claves], ignore_conflicts=True
+            )
+            inventarios = {
+                (inv.sucursal_id, inv.producto_id): inv
+                for inv in Inventario.objects.select_for_update().filter(
+                    sucursal_id__in={s for s, _ in claves}, producto_id__in={p for _, p in claves}
+                )
+            }
+            stock = {clave: inventario.cantidad for clave, inventario in inventarios.items()}
+
+            movimientos = []
+            deltas = defaultdict(int)
+            for indice, linea in validas:
+                movimiento = self.model(
+                    empresa=empresa,
+                    sucursal=sucursales[linea['sucursal']],
+                    producto=productos[linea['producto']],
+                    tipo_movimiento=linea['tipo_movimiento'],
+                    tipo_documento=linea['tipo_documento'],
+                    cantidad=linea['cantidad'],
+                    comentario=linea.get('comentario'),
+                    documento_respaldo=linea.get('documento_respaldo'),
+                    documento_soporte=linea.get('documento_soporte'),
+                    usuario=usuario,
+                    lote=lote,
+                )
+                clave = (linea['sucursal'], linea['producto'])
+                if stock[clave] + deltas[clave] + movimiento.delta() < 0:
+                    errores.append((indice, 'Stock insuficiente para la salida solicitada.'))
+                    continue
+                deltas[clave] += movimiento.delta()
+                movimientos.append(movimiento)
+
+            if errores and todo_o_nada:
+                transaction.set_rollback(True)
+                return [], sorted(errores)
+
+            self.bulk_create(movimientos)
+            ArchivoSoporte.objects.ajustar_referencias(movimiento.documento_soporte.name for movimiento in movimientos)
+            if movimientos and not connection.features.can_return_rows_from_bulk_insert:
+                # Dentro de un mismo INSERT los ids se asignan en orden, así que se recuperan por lote
+                pks = self.filter(lote=lote).order_by('pk').values_list('pk', flat=True)
+                for movimiento, pk in zip(movimientos, pks):
+                    movimiento.pk = pk
+
+            MovimientoDiario.objects.acumular(movimientos)
+            invalidar_cache_inventario(empresa.pk, (producto_id for _, producto_id in deltas))
+
+            ahora = timezone.now()
+            for (sucursal_id, producto_id), delta in deltas.items():
+                if delta:
+                    Inventario.objects.filter(sucursal_id=sucursal_id, producto_id=producto_id).update(
+                        cantidad=F('cantidad') + delta, ultima_actualizacion=ahora
+                    )
+                    inventarios[sucursal_id, producto_id].cantidad += delta
+            # Sin estados anteriores: las filas recién creadas con bulk_create todavía no tienen alertas
+            AlertaStock.objects.sincronizar([inventarios[clave] for clave in deltas])
+            EventoStock.objects.registrar([(inventarios[clave], delta) for clave, delta in deltas.items() if delta])
+
+        return movimientos, sorted(errores)
+
+
 class MovimientoInventario(models.Model):
     TIPO_MOVIMIENTO_CHOICES = [
         ('entrada', 'Entrada'),
@@ -40,6 +540,9 @@ class MovimientoInventario(models.Model):
         ('otros', 'Otros'),
     ]
 
+    # Copia de producto.empresa para filtrar por empresa sin unir con productos
+    empresa = models.ForeignKey(Empresa, related_name='movimientos', on_delete=models.CASCADE, null=True, blank=True,
+                                editable=False)
     sucursal = models.ForeignKey(Sucursal, related_name='movimientos', on_delete=models.CASCADE)
     producto = models.ForeignKey(Producto, related_name='movimientos', on_delete=models.CASCADE)
     tipo_movimiento = models.CharField(max_length=10, choices=TIPO_MOVIMIENTO_CHOICES)
@@ -48,25 +551,41 @@ class MovimientoInventario(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
     comentario = models.TextField(blank=True, null=True)
     documento_respaldo = models.TextField(blank=True, null=True)
-    documento_soporte = models.FileField(upload_to='documento_soporte/', blank=True, null=True)
+    documento_soporte = models.FileField(upload_to='documento_soporte/', storage=almacenamiento_documentos, blank=True,
+                                         null=True)
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    lote = models.UUIDField(blank=True, null=True, editable=False, db_index=True)
+
+    objects = MovimientoInventarioManager()
+
+    class Meta:
+        # Índices para los listados por empresa y sucursal paginados por cursor (fecha, id)
+        indexes = [
+            models.Index(fields=['empresa', 'fecha', 'id']),
+            models.Index(fields=['sucursal', 'fecha', 'id']),
+        ]
 
     def __str__(self):
         return f'{self.tipo_movimiento.capitalize()} de {self.cantidad} {self.producto.nombre} en {self.sucursal.nombre}'
 
     def save(self, *args, **kwargs):
-        if self.pk is None:  # Solo ejecutar si es un nuevo registro
-            inventario, created = Inventario.objects.get_or_create(sucursal=self.sucursal, producto=self.producto)
+        if self.empresa_id is None:
+            self.empresa_id = self.producto.empresa_id
+        if self.pk is not None:
+            super(MovimientoInventario, self).save(*args, **kwargs)
+            return
+
+        # El ajuste de stock y el registro del movimiento se confirman juntos o no se aplica ninguno
+        with transaction.atomic():
+            if not Inventario.objects.ajustar_cantidad(self.sucursal, self.producto, self.delta()):
+                raise ValueError('Stock insuficiente para la salida solicitada.')
+            super(MovimientoInventario, self).save(*args, **kwargs)
+            MovimientoDiario.objects.acumular([self])
+            invalidar_cache_inventario(self.empresa_id, [self.producto_id])
 
-            if self.tipo_movimiento == 'entrada':
-                inventario.cantidad += self.cantidad
-            elif self.tipo_movimiento == 'salida':
-                if inventario.cantidad >= self.cantidad:
-                    inventario.cantidad -= self.cantidad
-                else:
-                    raise ValueError('Stock insuficiente para la salida solicitada.')
-            inventario.save()
-        super(MovimientoInventario, self).save(*args, **kwargs)
+    def delta(self):
+        """Cantidad con signo que el movimiento aplica sobre el stock."""
+        return self.cantidad if self.tipo_movimiento == 'entrada' else -self.cantidad
 
 
 class Traslado(models.Model):
@@ -82,6 +601,9 @@ class Traslado(models.Model):
         ('otros', 'Otros'),
     ]
 
+    # Copia de producto.empresa para filtrar por empresa sin unir con productos
+    empresa = models.ForeignKey(Empresa, related_name='traslados', on_delete=models.CASCADE, null=True, blank=True,
+                                editable=False)
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     sucursal_origen = models.ForeignKey(Sucursal, related_name='transferencias_salida', on_delete=models.CASCADE)
     sucursal_destino = models.ForeignKey(Sucursal, related_name='transferencias_entrada', on_delete=models.CASCADE)
@@ -92,58 +614,824 @@ class Traslado(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     tipo_documento = models.CharField(max_length=20, choices=TIPO_DOCUMENTO_CHOICES)
     documento_respaldo = models.TextField(blank=True, null=True)
-    documento_soporte = models.FileField(upload_to='documento_soporte/', blank=True, null=True)
+    documento_soporte = models.FileField(upload_to='documento_soporte/', storage=almacenamiento_documentos, blank=True,
+                                         null=True)
     movimiento_salida = models.ForeignKey(MovimientoInventario, related_name='traslado_salida', on_delete=models.SET_NULL, null=True, blank=True)
     movimiento_entrada = models.ForeignKey(MovimientoInventario, related_name='traslado_entrada', on_delete=models.SET_NULL, null=True, blank=True)
+    documento = models.ForeignKey('TrasladoDocumento', related_name='lineas', on_delete=models.CASCADE, null=True, blank=True)
+    # Referencias a los movimientos cuando pasan al archivo (ver MovimientoInventarioArchivado)
+    movimiento_salida_archivado = models.ForeignKey('MovimientoInventarioArchivado', related_name='traslado_salida',
+                                                    on_delete=models.SET_NULL, null=True, blank=True)
+    movimiento_entrada_archivado = models.ForeignKey('MovimientoInventarioArchivado', related_name='traslado_entrada',
+                                                     on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        # Índices para los listados por empresa y sucursal paginados por cursor (fecha_creacion, id)
+        indexes = [
+            models.Index(fields=['empresa', 'fecha_creacion', 'id']),
+            models.Index(fields=['empresa', 'estado']),
+            models.Index(fields=['sucursal_origen', 'fecha_creacion', 'id']),
+            models.Index(fields=['sucursal_destino', 'fecha_creacion', 'id']),
+        ]
 
     def save(self, *args, **kwargs):
         # Validar que la sucursal de origen y destino no sean las mismas
         if self.sucursal_origen == self.sucursal_destino:
             raise ValueError('La sucursal de origen y destino no pueden ser las mismas.')
 
+        if self.empresa_id is None:
+            self.empresa_id = self.producto.empresa_id
+
         # Crear movimiento de salida al crear el traslado si es un nuevo registro
-        if not self.pk:
+        nuevo = not self.pk
+        with transaction.atomic():
+            if nuevo:
+                try:
+                    movimiento_salida = MovimientoInventario.objects.create(
+                        sucursal=self.sucursal_origen,
+                        producto=self.producto,
+                        tipo_movimiento='salida',
+                        cantidad=self.cantidad_entregada,
+                        comentario=f'Transferencia a {self.sucursal_destino.nombre}',
+                        tipo_documento=self.tipo_documento,
+                        documento_soporte=self.documento_soporte,
+                        documento_respaldo=self.documento_respaldo,
+                        usuario=self.usuario
+                    )
+                    self.movimiento_salida = movimiento_salida
+                except ValueError as e:
+                    raise ValueError(f'Error al crear movimiento de salida: {e}')
+            super(Traslado, self).save(*args, **kwargs)
+            if nuevo:
+                StockEnTransito.objects.ajustar(self.empresa_id, {
+                    (self.sucursal_origen_id, self.sucursal_destino_id, self.producto_id): self.cantidad_entregada
+                })
+                notificar_traslado('creado', self.empresa_id, self.sucursal_origen_id, self.sucursal_destino_id,
+                                   traslado=self.pk)
+            invalidar_cache_inventario(self.empresa_id, [self.producto_id])
+
+    @property
+    def salida(self):
+        """Movimiento de salida del traslado, esté en la tabla activa o en el archivo."""
+        return self.movimiento_salida or self.movimiento_salida_archivado
+
+    @property
+    def entrada(self):
+        """Movimiento de entrada del traslado, esté en la tabla activa o en el archivo."""
+        return self.movimiento_entrada or self.movimiento_entrada_archivado
+
+    def confirmar(self):
+        if self.estado != 'pendiente':
+            raise ValueError('Esta transferencia ya ha sido confirmada.')
+
+        # Validar la cantidad recibida (puede ser opcional, pero no debería exceder la cantidad entregada)
+        if self.cantidad_recibida is None or self.cantidad_recibida == 0:
+            raise ValueError('Debe ingresar una cantidad recibida antes de confirmar la transferencia.')
+
+        with transaction.atomic():
+            # Marcar el traslado como confirmado solo si sigue pendiente; evita dos confirmaciones concurrentes
+            if not Traslado.objects.filter(pk=self.pk, estado='pendiente').update(estado='confirmado'):
+                raise ValueError('Esta transferencia ya ha sido confirmada.')
+            StockEnTransito.objects.ajustar(self.empresa_id, {
+                (self.sucursal_origen_id, self.sucursal_destino_id, self.producto_id): -self.cantidad_entregada
+            })
+            notificar_traslado('confirmado', self.empresa_id, self.sucursal_origen_id, self.sucursal_destino_id,
+                               traslado=self.pk)
+
+            # Verificar que no haya errores de stock en la sucursal destino
             try:
-                movimiento_salida = MovimientoInventario.objects.create(
-                    sucursal=self.sucursal_origen,
+                movimiento_entrada = MovimientoInventario.objects.create(
+                    sucursal=self.sucursal_destino,
                     producto=self.producto,
-                    tipo_movimiento='salida',
-                    cantidad=self.cantidad_entregada,
-                    comentario=f'Transferencia a {self.sucursal_destino.nombre}',
+                    tipo_movimiento='entrada',
+                    cantidad=self.cantidad_recibida,
+                    comentario=f'Transferencia desde {self.sucursal_origen.nombre}',
                     tipo_documento=self.tipo_documento,
                     documento_soporte=self.documento_soporte,
                     documento_respaldo=self.documento_respaldo,
                     usuario=self.usuario
                 )
-                self.movimiento_salida = movimiento_salida
+                self.movimiento_entrada = movimiento_entrada
+                self.estado = 'confirmado'
+                self.save()
+
             except ValueError as e:
-                raise ValueError(f'Error al crear movimiento de salida: {e}')
-        super(Traslado, self).save(*args, **kwargs)
+                raise ValueError(f'Error al crear movimiento de entrada: {e}')
 
-    def confirmar(self):
-        if self.estado != 'pendiente':
-            raise ValueError('Esta transferencia ya ha sido confirmada.')
 
-        # Validar la cantidad recibida (puede ser opcional, pero no debería exceder la cantidad entregada)
-        if self.cantidad_recibida is None or self.cantidad_recibida == 0:
-            raise ValueError('Debe ingresar una cantidad recibida antes de confirmar la transferencia.')
+class TrasladoDocumento(models.Model):
+    """
+    Cabecera de un traslado con varias líneas (una guía de remisión con N productos).
+    Cada línea es un Traslado enlazado mediante ``documento``.
+    """
+    ESTADO_CHOICES = Traslado.ESTADO_CHOICES
+    TIPO_DOCUMENTO_CHOICES = Traslado.TIPO_DOCUMENTO_CHOICES
 
-        # Verificar que no haya errores de stock en la sucursal destino
-        try:
-            movimiento_entrada = MovimientoInventario.objects.create(
-                sucursal=self.sucursal_destino,
-                producto=self.producto,
-                tipo_movimiento='entrada',
-                cantidad=self.cantidad_recibida,
-                comentario=f'Transferencia desde {self.sucursal_origen.nombre}',
-                tipo_documento=self.tipo_documento,
-                documento_soporte=self.documento_soporte,
-                documento_respaldo=self.documento_respaldo,
-                usuario=self.usuario
-            )
-            self.movimiento_entrada = movimiento_entrada
-            self.estado = 'confirmado'
+    sucursal_origen = models.ForeignKey(Sucursal, related_name='documentos_traslado_salida', on_delete=models.CASCADE)
+    sucursal_destino = models.ForeignKey(Sucursal, related_name='documentos_traslado_entrada', on_delete=models.CASCADE)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_confirmacion = models.DateTimeField(blank=True, null=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    usuario_confirmacion = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='documentos_traslado_confirmados',
+                                             on_delete=models.SET_NULL, null=True, blank=True)
+    tipo_documento = models.CharField(max_length=20, choices=TIPO_DOCUMENTO_CHOICES)
+    documento_respaldo = models.TextField(blank=True, null=True)
+    documento_soporte = models.FileField(upload_to='documento_soporte/', storage=almacenamiento_documentos, blank=True,
+                                         null=True)
+
+    def __str__(self):
+        return f'{self.get_tipo_documento_display()} {self.documento_respaldo} ({self.sucursal_origen.nombre} -> {self.sucursal_destino.nombre})'
+
+    def despachar(self, lineas):
+        """
+        Guarda la cabecera y registra todas las líneas en una transacción: las salidas se
+        insertan como un lote de movimientos y las líneas de traslado con ``bulk_create``.
+
+        :param lineas: lista de tuplas (producto, cantidad_entregada)
+        :return: lista de traslados creados
+        """
+        if self.sucursal_origen == self.sucursal_destino:
+            raise ValueError('La sucursal de origen y destino no pueden ser las mismas.')
+        if not lineas:
+            raise ValueError('El documento de traslado debe tener al menos una línea.')
+
+        with transaction.atomic():
             self.save()
+            movimientos, errores = MovimientoInventario.objects.registrar_lote([
+                {
+                    'sucursal': self.sucursal_origen_id,
+                    'producto': producto.pk,
+                    'tipo_movimiento': 'salida',
+                    'tipo_documento': self.tipo_documento,
+                    'cantidad': cantidad,
+                    'comentario': f'Transferencia a {self.sucursal_destino.nombre}',
+                    'documento_respaldo': self.documento_respaldo,
+                    'documento_soporte': self.documento_soporte.name or None,
+                }
+                for producto, cantidad in lineas
+            ], self.sucursal_origen.empresa, usuario=self.usuario, todo_o_nada=True)
+            if errores:
+                raise ValueError('; '.join(f'Línea {indice + 1} ({lineas[indice][0].codigo}): {mensaje}'
+                                           for indice, mensaje in errores))
+
+            traslados = [
+                Traslado(
+                    documento=self,
+                    empresa_id=producto.empresa_id,
+                    producto=producto,
+                    sucursal_origen=self.sucursal_origen,
+                    sucursal_destino=self.sucursal_destino,
+                    cantidad_entregada=cantidad,
+                    usuario=self.usuario,
+                    tipo_documento=self.tipo_documento,
+                    documento_respaldo=self.documento_respaldo,
+                    documento_soporte=self.documento_soporte.name or None,
+                    movimiento_salida=movimiento,
+                )
+                for (producto, cantidad), movimiento in zip(lineas, movimientos)
+            ]
+            # bulk_create no invoca Traslado.save, que crearía otra salida por línea
+            Traslado.objects.bulk_create(traslados)
+            ArchivoSoporte.objects.ajustar_referencias(traslado.documento_soporte.name for traslado in traslados)
+            en_camino = defaultdict(int)
+            for producto, cantidad in lineas:
+                en_camino[self.sucursal_origen_id, self.sucursal_destino_id, producto.pk] += cantidad
+            StockEnTransito.objects.ajustar(self.sucursal_origen.empresa_id, en_camino)
+            notificar_traslado('creado', self.sucursal_origen.empresa_id, self.sucursal_origen_id,
+                               self.sucursal_destino_id, documento=self.pk)
+        return traslados
+
+    def confirmar(self, cantidades_recibidas, usuario=None):
+        """
+        Confirma todas las líneas pendientes del documento en una transacción. Las entradas
+        se registran como un lote de movimientos y las líneas se actualizan con ``bulk_update``.
+
+        :param cantidades_recibidas: diccionario {id de la línea: cantidad recibida}; una
+            cantidad de 0 marca la línea como no recibida y no genera movimiento
+        """
+        if self.estado != 'pendiente':
+            raise ValueError('Este documento de traslado ya ha sido confirmado.')
+
+        with transaction.atomic():
+            if not TrasladoDocumento.objects.filter(pk=self.pk, estado='pendiente').update(
+                    estado='confirmado', fecha_confirmacion=timezone.now(), usuario_confirmacion=usuario):
+                raise ValueError('Este documento de traslado ya ha sido confirmado.')
+
+            lineas = list(self.lineas.select_for_update().filter(estado='pendiente').order_by('pk'))
+            faltantes = [linea for linea in lineas if linea.pk not in cantidades_recibidas]
+            if faltantes:
+                raise ValueError(f'Debe ingresar la cantidad recibida de {len(faltantes)} línea(s).')
+
+            en_camino = defaultdict(int)
+            for linea in lineas:
+                linea.cantidad_recibida = cantidades_recibidas[linea.pk]
+                linea.estado = 'confirmado'
+                # Lo no recibido deja de estar en tránsito igual que lo recibido
+                en_camino[self.sucursal_origen_id, self.sucursal_destino_id, linea.producto_id] -= \
+                    linea.cantidad_entregada
+            StockEnTransito.objects.ajustar(self.sucursal_destino.empresa_id, en_camino)
+            notificar_traslado('confirmado', self.sucursal_destino.empresa_id, self.sucursal_origen_id,
+                               self.sucursal_destino_id, documento=self.pk)
+            recibidas = [linea for linea in lineas if linea.cantidad_recibida > 0]
+
+            movimientos, errores = MovimientoInventario.objects.registrar_lote([
+                {
+                    'sucursal': self.sucursal_destino_id,
+                    'producto': linea.producto_id,
+                    'tipo_movimiento': 'entrada',
+                    'tipo_documento': self.tipo_documento,
+                    'cantidad': linea.cantidad_recibida,
+                    'comentario': f'Transferencia desde {self.sucursal_origen.nombre}',
+                    'documento_respaldo': self.documento_respaldo,
+                    'documento_soporte': self.documento_soporte.name or None,
+                }
+                for linea in recibidas
+            ], self.sucursal_destino.empresa, usuario=usuario or self.usuario, todo_o_nada=True)
+            if errores:
+                raise ValueError('; '.join(mensaje for _, mensaje in errores))
+
+            for linea, movimiento in zip(recibidas, movimientos):
+                linea.movimiento_entrada = movimiento
+            Traslado.objects.bulk_update(lineas, ['cantidad_recibida', 'estado', 'movimiento_entrada'])
+            invalidar_cache_inventario(self.sucursal_destino.empresa_id, (linea.producto_id for linea in lineas))
+
+        self.estado = 'confirmado'
+        return lineas
+
+
+class StockEnTransitoManager(models.Manager):
+    def ajustar(self, empresa_id, deltas):
+        """
+        Suma las cantidades a los contadores de stock en tránsito de cada ruta y al ``en_transito``
+        de la fila de inventario de destino. Debe llamarse en la misma transacción que crea o
+        confirma los traslados.
+
+        :param deltas: diccionario {(sucursal_origen_id, sucursal_destino_id, producto_id): delta}
+        """
+        # Orden fijo de actualización para que dos transacciones no se bloqueen mutuamente
+        deltas = {clave: delta for clave, delta in sorted(deltas.items()) if delta}
+        if not deltas:
+            return
+
+        self.bulk_create([
+            self.model(empresa_id=empresa_id, sucursal_origen_id=origen, sucursal_destino_id=destino,
+                       producto_id=producto_id)
+            for origen, destino, producto_id in deltas
+        ], ignore_conflicts=True)
+        por_destino = defaultdict(int)
+        vaciadas = Q()
+        for (origen, destino, producto_id), delta in deltas.items():
+            rutas = self.filter(sucursal_origen_id=origen, sucursal_destino_id=destino, producto_id=producto_id)
+            rutas.update(cantidad=F('cantidad') + delta)
+            por_destino[destino, producto_id] += delta
+            if delta < 0:
+                vaciadas |= Q(sucursal_origen_id=origen, sucursal_destino_id=destino, producto_id=producto_id)
+        if vaciadas:
+            self.filter(vaciadas, cantidad=0).delete()
+
+        for (destino, producto_id), delta in por_destino.items():
+            if delta:
+                inventario, _ = Inventario.objects.get_or_create(sucursal_id=destino, producto_id=producto_id,
+                                                                 defaults={'empresa_id': empresa_id})
+                Inventario.objects.filter(pk=inventario.pk).update(en_transito=F('en_transito') + delta)
+
+    def verificar(self, empresa, corregir=False):
+        """
+        Compara los contadores con la suma de los traslados pendientes de la empresa.
+
+        :param corregir: si es True, deja los contadores con los valores de los traslados
+        :return: lista de tuplas (tipo, sucursal_origen_id, sucursal_destino_id, producto_id, contador,
+            esperado); tipo es ``ruta`` o ``destino`` (sin sucursal de origen)
+        """
+        with transaction.atomic():
+            pendientes = Traslado.objects.filter(empresa=empresa, estado='pendiente')
+            if corregir:
+                # Bloquea los pendientes para que no se confirmen mientras se corrigen los contadores
+                list(pendientes.select_for_update().values_list('pk', flat=True))
+
+            esperado_ruta = {
+                (origen, destino, producto_id): total
+                for origen, destino, producto_id, total in pendientes
+                .values('sucursal_origen_id', 'sucursal_destino_id', 'producto_id')
+                .annotate(total=Sum('cantidad_entregada')).order_by()
+                .values_list('sucursal_origen_id', 'sucursal_destino_id', 'producto_id', 'total')
+            }
+            esperado_destino = defaultdict(int)
+            for (_, destino, producto_id), total in esperado_ruta.items():
+                esperado_destino[destino, producto_id] += total
+
+            actual_ruta = {
+                (origen, destino, producto_id): cantidad
+                for origen, destino, producto_id, cantidad in self.filter(empresa=empresa).exclude(cantidad=0)
+                .values_list('sucursal_origen_id', 'sucursal_destino_id', 'producto_id', 'cantidad')
+            }
+            actual_destino = {
+                (destino, producto_id): cantidad
+                for destino, producto_id, cantidad in Inventario.objects.filter(empresa=empresa)
+                .exclude(en_transito=0).values_list('sucursal_id', 'producto_id', 'en_transito')
+            }
+
+            diferencias = [
+                ('ruta', *clave, actual_ruta.get(clave, 0), esperado_ruta.get(clave, 0))
+                for clave in sorted(set(actual_ruta) | set(esperado_ruta))
+                if actual_ruta.get(clave, 0) != esperado_ruta.get(clave, 0)
+            ] + [
+                ('destino', None, *clave, actual_destino.get(clave, 0), esperado_destino.get(clave, 0))
+                for clave in sorted(set(actual_destino) | set(esperado_destino))
+                if actual_destino.get(clave, 0) != esperado_destino.get(clave, 0)
+            ]
+
+            if corregir:
+                for tipo, origen, destino, producto_id, _, esperado in diferencias:
+                    if tipo == 'ruta':
+                        self.update_or_create(sucursal_origen_id=origen, sucursal_destino_id=destino,
+                                              producto_id=producto_id,
+                                              defaults={'empresa': empresa, 'cantidad': esperado})
+                    else:
+                        inventario, _ = Inventario.objects.get_or_create(sucursal_id=destino, producto_id=producto_id,
+                                                                         defaults={'empresa': empresa})
+                        Inventario.objects.filter(pk=inventario.pk).update(en_transito=esperado)
+                self.filter(empresa=empresa, cantidad=0).delete()
+        return diferencias
+
+
+class StockEnTransito(models.Model):
+    """
+    Unidades de traslados pendientes por ruta (origen, destino) y producto. Se suma al crear los
+    traslados y se resta al confirmarlos; el total por destino se mantiene en Inventario.en_transito.
+    """
+    empresa = models.ForeignKey(Empresa, related_name='stock_en_transito', on_delete=models.CASCADE)
+    sucursal_origen = models.ForeignKey(Sucursal, related_name='stock_en_transito_salida', on_delete=models.CASCADE)
+    sucursal_destino = models.ForeignKey(Sucursal, related_name='stock_en_transito_entrada', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='stock_en_transito', on_delete=models.CASCADE)
+    cantidad = models.IntegerField(default=0)
+
+    objects = StockEnTransitoManager()
+
+    class Meta:
+        unique_together = ('sucursal_origen', 'sucursal_destino', 'producto')
+
+    def __str__(self):
+        return f'{self.cantidad} {self.producto.nombre}: {self.sucursal_origen.nombre} -> {self.sucursal_destino.nombre}'
+
+
+class CostoRuta(models.Model):
+    """Costo por unidad de trasladar entre dos sucursales; pondera las propuestas de rebalanceo."""
+    empresa = models.ForeignKey(Empresa, related_name='costos_ruta', on_delete=models.CASCADE)
+    sucursal_origen = models.ForeignKey(Sucursal, related_name='costos_ruta_salida', on_delete=models.CASCADE)
+    sucursal_destino = models.ForeignKey(Sucursal, related_name='costos_ruta_entrada', on_delete=models.CASCADE)
+    costo = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('sucursal_origen', 'sucursal_destino')
+
+    def __str__(self):
+        return f'{self.sucursal_origen.nombre} -> {self.sucursal_destino.nombre}: {self.costo}'
+
+
+class PropuestaTrasladoManager(models.Manager):
+    def generar(self, empresa):
+        """
+        Reemplaza las propuestas pendientes de la empresa por las calculadas con el inventario actual.
+
+        :return: lista de propuestas creadas
+        """
+        from .rebalanceo import proponer_traslados
+
+        propuestas = proponer_traslados(empresa)
+        lote = uuid.uuid4()
+        for propuesta in propuestas:
+            propuesta.lote = lote
+        with transaction.atomic():
+            self.filter(empresa=empresa, estado='pendiente').delete()
+            self.bulk_create(propuestas, batch_size=1000)
+        return propuestas
+
+    def aceptar(self, propuestas, usuario=None):
+        """
+        Despacha las propuestas pendientes del queryset como documentos de traslado, uno por ruta. Cada
+        documento se registra en su propia transacción, así que una ruta sin stock suficiente no impide
+        las demás.
+
+        :return: tupla (documentos creados, lista de mensajes de error por ruta)
+        """
+        propuestas = propuestas.filter(estado='pendiente').select_related(
+            'producto', 'sucursal_origen', 'sucursal_destino'
+        ).order_by('sucursal_origen_id', 'sucursal_destino_id', 'pk')
+        documentos, errores = [], []
+        for (origen, destino), grupo in groupby(
+                propuestas, key=lambda propuesta: (propuesta.sucursal_origen, propuesta.sucursal_destino)):
+            grupo = list(grupo)
+            documento = TrasladoDocumento(sucursal_origen=origen, sucursal_destino=destino, tipo_documento='otros',
+                                          documento_respaldo=f'Rebalanceo {grupo[0].lote.hex[:8]}', usuario=usuario)
+            try:
+                with transaction.atomic():
+                    documento.despachar([(propuesta.producto, propuesta.cantidad) for propuesta in grupo])
+                    self.filter(pk__in=[propuesta.pk for propuesta in grupo], estado='pendiente').update(
+                        estado='aceptada', documento=documento, usuario_revision=usuario,
+                        fecha_revision=timezone.now()
+                    )
+                documentos.append(documento)
+            except ValueError as e:
+                errores.append(f'{origen.nombre} -> {destino.nombre}: {e}')
+        return documentos, errores
+
+
+class PropuestaTraslado(models.Model):
+    """Traslado sugerido por el rebalanceo entre sucursales, pendiente de revisión de un supervisor."""
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('aceptada', 'Aceptada'),
+        ('descartada', 'Descartada'),
+    ]
+
+    empresa = models.ForeignKey(Empresa, related_name='propuestas_traslado', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='propuestas_traslado', on_delete=models.CASCADE)
+    sucursal_origen = models.ForeignKey(Sucursal, related_name='propuestas_traslado_salida', on_delete=models.CASCADE)
+    sucursal_destino = models.ForeignKey(Sucursal, related_name='propuestas_traslado_entrada',
+                                         on_delete=models.CASCADE)
+    cantidad = models.IntegerField()
+    costo = models.PositiveIntegerField(default=0)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='pendiente')
+    lote = models.UUIDField(editable=False)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    documento = models.ForeignKey(TrasladoDocumento, related_name='propuestas', on_delete=models.SET_NULL, null=True,
+                                  blank=True)
+    usuario_revision = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_revision = models.DateTimeField(blank=True, null=True)
+
+    objects = PropuestaTrasladoManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'estado']),
+        ]
+
+    def __str__(self):
+        return f'{self.cantidad} {self.producto.nombre}: {self.sucursal_origen.nombre} -> {self.sucursal_destino.nombre}'
+
+
+class InventarioSnapshotManager(models.Manager):
+    def generar(self, empresa, fecha_corte):
+        """
+        Congela el stock de cada (sucursal, producto) de la empresa al instante ``fecha_corte``.
+
+        Parte del corte anterior más reciente y solo suma los movimientos registrados entre ambos
+        cortes, por lo que el costo depende de los movimientos de un período y no del historial
+        completo. Se guarda una fila por cada clave con historial, aunque su cantidad sea cero,
+        para que los cortes siguientes puedan partir de ella.
+
+        :return: cantidad de filas generadas
+        """
+        corte_anterior = self.filter(producto__empresa=empresa, fecha_corte__lt=fecha_corte) \
+            .aggregate(corte=Max('fecha_corte'))['corte']
+
+        saldos = defaultdict(int)
+        periodo = Q(empresa=empresa, fecha__lt=fecha_corte)
+        if corte_anterior:
+            for fila in self.filter(producto__empresa=empresa, fecha_corte=corte_anterior) \
+                    .values('sucursal_id', 'producto_id', 'cantidad'):
+                saldos[(fila['sucursal_id'], fila['producto_id'])] = fila['cantidad']
+            periodo &= Q(fecha__gte=corte_anterior)
+
+        movimientos = [modelo.objects.filter(periodo) for modelo in (MovimientoInventario, MovimientoInventarioArchivado)]
+        for clave, saldo in saldos_agrupados(movimientos, 'sucursal_id', 'producto_id').items():
+            saldos[clave] += saldo
+
+        precios = dict(Producto.objects.filter(pk__in={p for _, p in saldos}).values_list('pk', 'precio'))
+        with transaction.atomic():
+            self.filter(producto__empresa=empresa, fecha_corte=fecha_corte).delete()
+            self.bulk_create([
+                self.model(sucursal_id=sucursal_id, producto_id=producto_id, fecha_corte=fecha_corte,
+                           cantidad=cantidad, valor=cantidad * precios[producto_id])
+                for (sucursal_id, producto_id), cantidad in saldos.items()
+            ], batch_size=1000)
+        return len(saldos)
+
+    def stock_a_fecha(self, producto, fecha, sucursal=None):
+        """
+        Stock de un producto al instante ``fecha``: toma el corte más cercano anterior y le suma
+        solo los movimientos posteriores a ese corte.
+
+        :return: diccionario {id de sucursal: cantidad}, o la cantidad si se indica la sucursal
+        """
+        snapshots = self.filter(producto=producto, fecha_corte__lte=fecha)
+        periodo = Q(producto=producto, fecha__lt=fecha)
+        if sucursal is not None:
+            snapshots = snapshots.filter(sucursal=sucursal)
+            periodo &= Q(sucursal=sucursal)
+
+        saldos = defaultdict(int)
+        corte = snapshots.aggregate(corte=Max('fecha_corte'))['corte']
+        if corte:
+            for sucursal_id, cantidad in snapshots.filter(fecha_corte=corte).values_list('sucursal_id', 'cantidad'):
+                saldos[sucursal_id] = cantidad
+            periodo &= Q(fecha__gte=corte)
+
+        movimientos = [modelo.objects.filter(periodo) for modelo in (MovimientoInventario, MovimientoInventarioArchivado)]
+        for sucursal_id, saldo in saldos_agrupados(movimientos, 'sucursal_id').items():
+            saldos[sucursal_id] += saldo
+
+        if sucursal is not None:
+            return saldos[sucursal.pk]
+        return dict(saldos)
+
+
+class InventarioSnapshot(models.Model):
+    """
+    Stock congelado de una (sucursal, producto) en un corte de período (por ejemplo, cierre de mes).
+    Incluye los movimientos con fecha anterior a ``fecha_corte``.
+    """
+    sucursal = models.ForeignKey(Sucursal, related_name='snapshots', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='snapshots', on_delete=models.CASCADE)
+    fecha_corte = models.DateTimeField()
+    cantidad = models.IntegerField()
+    valor = models.DecimalField(max_digits=14, decimal_places=2)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    objects = InventarioSnapshotManager()
+
+    class Meta:
+        unique_together = ('sucursal', 'producto', 'fecha_corte')
+        indexes = [
+            models.Index(fields=['producto', 'fecha_corte']),
+        ]
+
+    def __str__(self):
+        return f'{self.producto.nombre} - {self.sucursal.nombre} al {self.fecha_corte:%Y-%m-%d}: {self.cantidad}'
+
+
+class MovimientoDiarioManager(models.Manager):
+    def acumular(self, movimientos):
+        """
+        Suma los movimientos recién registrados a sus filas del resumen diario.
+        Debe llamarse en la misma transacción que inserta los movimientos.
+        """
+        totales = defaultdict(lambda: [0, 0, 0, 0])
+        for movimiento in movimientos:
+            clave = (movimiento.empresa_id, movimiento.sucursal_id, movimiento.producto_id,
+                     movimiento.usuario_id, movimiento.tipo_documento, timezone.localdate(movimiento.fecha))
+            if movimiento.tipo_movimiento == 'entrada':
+                totales[clave][0] += movimiento.cantidad
+                totales[clave][2] += 1
+            else:
+                totales[clave][1] += movimiento.cantidad
+                totales[clave][3] += 1
+
+        for (empresa_id, sucursal_id, producto_id, usuario_id, tipo_documento, dia), valores in totales.items():
+            # Se busca por usuario_clave y no por usuario: la clave única no se cumple entre NULL
+            clave = dict(empresa_id=empresa_id, sucursal_id=sucursal_id, producto_id=producto_id,
+                         usuario_clave=usuario_id or 0, tipo_documento=tipo_documento, dia=dia)
+            incrementos = dict(entradas=F('entradas') + valores[0], salidas=F('salidas') + valores[1],
+                               num_entradas=F('num_entradas') + valores[2], num_salidas=F('num_salidas') + valores[3])
+            if self.filter(**clave).update(**incrementos):
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(usuario_id=usuario_id, entradas=valores[0], salidas=valores[1],
+                                num_entradas=valores[2], num_salidas=valores[3], **clave)
+            except IntegrityError:
+                # Otra transacción creó la fila entre el UPDATE y el INSERT
+                self.filter(**clave).update(**incrementos)
+
+    def reconstruir(self, empresa):
+        """
+        Regenera el resumen diario de la empresa a partir de los movimientos registrados,
+        incluidos los archivados (el archivo mueve meses completos, así que ningún día queda repartido).
+        """
+        filas = chain.from_iterable(
+            modelo.objects.filter(empresa=empresa).annotate(
+                dia=TruncDate('fecha', tzinfo=timezone.get_current_timezone())
+            ).values('sucursal_id', 'producto_id', 'usuario_id', 'tipo_documento', 'dia').annotate(
+                total_entradas=Sum('cantidad', filter=Q(tipo_movimiento='entrada')),
+                total_salidas=Sum('cantidad', filter=Q(tipo_movimiento='salida')),
+                total_num_entradas=Count('id', filter=Q(tipo_movimiento='entrada')),
+                total_num_salidas=Count('id', filter=Q(tipo_movimiento='salida')),
+            ).order_by().iterator(chunk_size=2000)
+            for modelo in (MovimientoInventario, MovimientoInventarioArchivado)
+        )
+
+        with transaction.atomic():
+            self.filter(empresa=empresa).delete()
+            self.bulk_create((
+                self.model(
+                    empresa=empresa, sucursal_id=fila['sucursal_id'], producto_id=fila['producto_id'],
+                    usuario_id=fila['usuario_id'], usuario_clave=fila['usuario_id'] or 0,
+                    tipo_documento=fila['tipo_documento'], dia=fila['dia'],
+                    entradas=fila['total_entradas'] or 0, salidas=fila['total_salidas'] or 0,
+                    num_entradas=fila['total_num_entradas'], num_salidas=fila['total_num_salidas'],
+                )
+                for fila in filas
+            ), batch_size=1000)
+        return self.filter(empresa=empresa).count()
+
+
+class MovimientoDiario(models.Model):
+    """
+    Resumen de entradas y salidas por día; se mantiene en la misma transacción que cada
+    movimiento y sirve a los reportes sin recorrer los movimientos individuales.
+    """
+    empresa = models.ForeignKey(Empresa, related_name='movimientos_diarios', on_delete=models.CASCADE)
+    sucursal = models.ForeignKey(Sucursal, related_name='movimientos_diarios', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='movimientos_diarios', on_delete=models.CASCADE)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    # Id del usuario, o 0 para los movimientos sin usuario; reemplaza a ``usuario`` en la clave única
+    # porque MySQL y SQLite no la hacen cumplir entre filas con NULL
+    usuario_clave = models.PositiveIntegerField(default=0)
+    tipo_documento = models.CharField(max_length=20)
+    dia = models.DateField()
+    entradas = models.IntegerField(default=0)
+    salidas = models.IntegerField(default=0)
+    num_entradas = models.IntegerField(default=0)
+    num_salidas = models.IntegerField(default=0)
+
+    objects = MovimientoDiarioManager()
+
+    class Meta:
+        unique_together = ('empresa', 'sucursal', 'producto', 'usuario_clave', 'tipo_documento', 'dia')
+        indexes = [
+            models.Index(fields=['empresa', 'dia']),
+            models.Index(fields=['producto', 'dia']),
+        ]
+
+    def __str__(self):
+        return f'{self.dia:%Y-%m-%d} {self.producto.nombre} - {self.sucursal.nombre}: +{self.entradas} / -{self.salidas}'
+
+
+class MovimientoInventarioArchivadoManager(models.Manager):
+    def archivar(self, empresa, limite, tamano_bloque=5000):
+        """
+        Mueve al archivo los movimientos de la empresa anteriores a ``limite`` (inicio de un mes),
+        por bloques de ``tamano_bloque`` filas y una transacción por bloque.
+
+        Cada bloque se copia conservando su id, se suma al resumen mensual, se repuntan los traslados
+        que lo referencian y recién entonces se borra de la tabla activa.
+
+        :return: cantidad de movimientos archivados
+        """
+        campos = [campo.attname for campo in MovimientoInventario._meta.concrete_fields]
+        total = 0
+        while True:
+            with transaction.atomic():
+                bloque = list(MovimientoInventario.objects.select_for_update()
+                              .filter(empresa=empresa, fecha__lt=limite).order_by('pk')[:tamano_bloque])
+                if not bloque:
+                    return total
+                pks = [movimiento.pk for movimiento in bloque]
+
+                self.bulk_create([
+                    self.model(**{campo: getattr(movimiento, campo) for campo in campos}) for movimiento in bloque
+                ])
+                # El borrado de la tabla activa descuenta las referencias de cada fila (ver inventario.signals)
+                ArchivoSoporte.objects.ajustar_referencias(movimiento.documento_soporte.name for movimiento in bloque)
+                MovimientoMensual.objects.acumular(bloque)
+                for lado in ('salida', 'entrada'):
+                    traslados = Traslado.objects.filter(**{f'movimiento_{lado}_id__in': pks})
+                    traslados.update(**{f'movimiento_{lado}_archivado_id': F(f'movimiento_{lado}_id')})
+                    traslados.update(**{f'movimiento_{lado}': None})
+                MovimientoInventario.objects.filter(pk__in=pks).delete()
+                invalidar_cache_inventario(empresa.pk, {movimiento.producto_id for movimiento in bloque})
+            total += len(bloque)
+
+
+class MovimientoInventarioArchivado(models.Model):
+    """
+    Movimientos de meses cerrados retirados de MovimientoInventario por ``archivar_movimientos``.
+    Conservan el id original; los saldos de esos meses quedan resumidos en MovimientoMensual.
+    """
+    id = models.IntegerField(primary_key=True)
+    empresa = models.ForeignKey(Empresa, related_name='movimientos_archivados', on_delete=models.CASCADE,
+                                null=True, blank=True)
+    sucursal = models.ForeignKey(Sucursal, related_name='movimientos_archivados', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='movimientos_archivados', on_delete=models.CASCADE)
+    tipo_movimiento = models.CharField(max_length=10, choices=MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+    tipo_documento = models.CharField(max_length=20, choices=MovimientoInventario.TIPO_DOCUMENTO_CHOICES)
+    cantidad = models.IntegerField()
+    fecha = models.DateTimeField()
+    comentario = models.TextField(blank=True, null=True)
+    documento_respaldo = models.TextField(blank=True, null=True)
+    documento_soporte = models.FileField(upload_to='documento_soporte/', storage=almacenamiento_documentos, blank=True,
+                                         null=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='movimientos_archivados',
+                                on_delete=models.SET_NULL, null=True, blank=True)
+    lote = models.UUIDField(blank=True, null=True, editable=False)
+    fecha_archivado = models.DateTimeField(auto_now_add=True)
+
+    objects = MovimientoInventarioArchivadoManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['empresa', 'fecha', 'id']),
+            models.Index(fields=['sucursal', 'fecha', 'id']),
+            models.Index(fields=['producto', 'fecha']),
+        ]
+
+    def __str__(self):
+        return f'{self.tipo_movimiento.capitalize()} de {self.cantidad} {self.producto.nombre} en {self.sucursal.nombre} (archivado)'
+
+
+class MovimientoMensualManager(models.Manager):
+    def acumular(self, movimientos):
+        """Suma los movimientos archivados a sus filas del resumen mensual."""
+        totales = defaultdict(lambda: [0, 0, 0, 0])
+        for movimiento in movimientos:
+            clave = (movimiento.empresa_id, movimiento.sucursal_id, movimiento.producto_id,
+                     timezone.localdate(movimiento.fecha).replace(day=1))
+            if movimiento.tipo_movimiento == 'entrada':
+                totales[clave][0] += movimiento.cantidad
+                totales[clave][2] += 1
+            else:
+                totales[clave][1] += movimiento.cantidad
+                totales[clave][3] += 1
+
+        for (empresa_id, sucursal_id, producto_id, mes), valores in totales.items():
+            clave = dict(empresa_id=empresa_id, sucursal_id=sucursal_id, producto_id=producto_id, mes=mes)
+            incrementos = dict(entradas=F('entradas') + valores[0], salidas=F('salidas') + valores[1],
+                               num_entradas=F('num_entradas') + valores[2], num_salidas=F('num_salidas') + valores[3])
+            if not self.filter(**clave).update(**incrementos):
+                self.create(entradas=valores[0], salidas=valores[1], num_entradas=valores[2],
+                            num_salidas=valores[3], **clave)
+
+    def limite_archivo(self, empresa):
+        """
+        Instante desde el cual los movimientos de la empresa siguen en la tabla activa
+        (inicio del mes siguiente al último archivado), o None si no hay nada archivado.
+        """
+        ultimo_mes = self.filter(empresa=empresa).aggregate(mes=Max('mes'))['mes']
+        if ultimo_mes is None:
+            return None
+        siguiente = (ultimo_mes + timedelta(days=32)).replace(day=1)
+        return timezone.make_aware(datetime.combine(siguiente, time.min))
+
+
+class MovimientoMensual(models.Model):
+    """
+    Resumen por (sucursal, producto, mes) de los movimientos archivados; permite calcular saldos
+    históricos sin recorrer el archivo.
+    """
+    empresa = models.ForeignKey(Empresa, related_name='movimientos_mensuales', on_delete=models.CASCADE,
+                                null=True, blank=True)
+    sucursal = models.ForeignKey(Sucursal, related_name='movimientos_mensuales', on_delete=models.CASCADE)
+    producto = models.ForeignKey(Producto, related_name='movimientos_mensuales', on_delete=models.CASCADE)
+    mes = models.DateField()
+    entradas = models.IntegerField(default=0)
+    salidas = models.IntegerField(default=0)
+    num_entradas = models.IntegerField(default=0)
+    num_salidas = models.IntegerField(default=0)
+
+    objects = MovimientoMensualManager()
+
+    class Meta:
+        unique_together = ('sucursal', 'producto', 'mes')
+        indexes = [
+            models.Index(fields=['empresa', 'mes']),
+        ]
+
+    def __str__(self):
+        return f'{self.mes:%Y-%m} {self.producto.nombre} - {self.sucursal.nombre}: +{self.entradas} / -{self.salidas}'
+
+
+def resumen_producto(producto):
+    """
+    Totales de movimientos y traslados de un producto para ``movimientos_por_producto``.
+
+    Se calcula con dos consultas de agregación condicional (una sobre el resumen diario y otra
+    sobre los traslados) y se cachea con la versión de datos del producto, que se incrementa
+    con cada movimiento o traslado que lo afecta.
+    """
+    clave = f'resumen_producto:{producto.pk}:{obtener_version("producto", producto.pk)}'
+    resumen = cache.get(clave)
+    if resumen is not None:
+        return resumen
+
+    acumulado = MovimientoDiario.objects.filter(producto=producto).aggregate(
+        entradas=Sum('entradas'), salidas=Sum('salidas')
+    )
+    traslados = Traslado.objects.filter(producto=producto).aggregate(
+        # Cantidades efectivamente movidas (traslados con su movimiento de salida/entrada)
+        traslados_salida=Sum('cantidad_entregada', filter=Q(movimiento_salida__isnull=False) |
+                             Q(movimiento_salida_archivado__isnull=False)),
+        traslados_entrada=Sum('cantidad_recibida', filter=Q(movimiento_entrada__isnull=False) |
+                              Q(movimiento_entrada_archivado__isnull=False)),
+        # Cantidades teóricas (lo que se declaró enviar/recibir)
+        traslados_teoricos_salida=Sum('cantidad_entregada'),
+        traslados_confirmados=Sum('cantidad_recibida', filter=Q(estado='confirmado')),
+        traslados_pendientes=Sum('cantidad_entregada', filter=Q(estado='pendiente')),
+    )
+    resumen = {clave_total: total or 0 for clave_total, total in traslados.items()}
+    resumen['traslados_teoricos_entrada'] = resumen['traslados_confirmados']
+
+    # Movimientos normales = todos los movimientos menos los generados por traslados
+    resumen['entradas'] = (acumulado['entradas'] or 0) - resumen['traslados_entrada']
+    resumen['salidas'] = (acumulado['salidas'] or 0) - resumen['traslados_salida']
+
+    # Total = Entradas normales + Traslados recibidos - Salidas normales - Traslados enviados
+    resumen['total_fisico'] = (
+        resumen['entradas'] + resumen['traslados_entrada'] - resumen['salidas'] - resumen['traslados_salida']
+    )
+    # Diferencia entre lo enviado y lo recibido en traslados
+    resumen['diferencia_traslados'] = resumen['traslados_teoricos_salida'] - resumen['traslados_teoricos_entrada']
 
-        except ValueError as e:
-            raise ValueError(f'Error al crear movimiento de entrada: {e}')
+    cache.set(clave, resumen, timeout=60 * 60 * 24)
+    return resumen
@@ -0,0 +1,162 @@
+"""
+Avisos de traslados a las sucursales por long-poll.
+
+Los modelos publican un aviso cuando se crea o confirma un traslado (al confirmarse la transacción)
+y la vista ``notificaciones_traslados`` espera en el broker hasta que llega uno para los canales
+del usuario o vence la espera. La espera solo se hace con el punto de entrada ASGI, donde cada una
+es una corrutina y no ocupa un hilo.
+
+El broker se elige con el ajuste NOTIFICACIONES_BROKER. ``BrokerBaseDatos`` guarda los avisos en
+AvisoTraslado, así que los ven todos los procesos del servidor y sus ids son globales.
+``BrokerMemoria`` solo ve los avisos publicados en su propio proceso y se usa en pruebas.
+"""
+import asyncio
+import threading
+from collections import deque
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+BROKER_DEFECTO = 'inventario.notificaciones.BrokerBaseDatos'
+
+
+def canal_sucursal(sucursal_id):
+    return f'sucursal:{sucursal_id}'
+
+
+def canal_empresa(empresa_id):
+    return f'empresa:{empresa_id}'
+
+
+class BrokerMemoria:
+    """
+    Publicación y espera de avisos entre hilos y corrutinas de un mismo proceso.
+
+    Guarda los últimos ``historial`` avisos numerados; un cliente que vuelve con el id del último
+    aviso recibido obtiene los que se publicaron mientras no estaba esperando.
+    """
+
+    def __init__(self, historial=1000):
+        self._bloqueo = threading.Lock()
+        self._avisos = deque(maxlen=historial)
+        self._ultimo = 0
+        self._suscriptores = set()
+
+    @property
+    def ultimo(self):
+        return self._ultimo
+
+    def publicar(self, canales, datos):
+        """Agrega un aviso para los canales y despierta a las esperas en curso. Seguro entre hilos."""
+        with self._bloqueo:
+            self._ultimo += 1
+            self._avisos.append((self._ultimo, frozenset(canales), datos))
+            suscriptores = list(self._suscriptores)
+        for bucle, evento in suscriptores:
+            try:
+                bucle.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                # El bucle de eventos de esa espera ya se cerró
+                pass
+
+    def avisos(self, canales, ultimo):
+        """Avisos posteriores a ``ultimo`` dirigidos a alguno de los canales."""
+        with self._bloqueo:
+            return [dict(datos, id=numero) for numero, destinos, datos in self._avisos
+                    if numero > ultimo and destinos & canales]
+
+    async def esperar(self, canales, ultimo, espera):
+        """
+        Devuelve los avisos posteriores a ``ultimo`` para los canales, esperando hasta ``espera``
+        segundos a que se publique alguno.
+
+        :return: lista de avisos (vacía si venció la espera)
+        """
+        canales = frozenset(canales)
+        bucle = asyncio.get_running_loop()
+        evento = asyncio.Event()
+        suscriptor = (bucle, evento)
+        with self._bloqueo:
+            self._suscriptores.add(suscriptor)
+        try:
+            limite = bucle.time() + espera
+            while True:
+                # Se limpia antes de revisar: un aviso publicado después vuelve a activar el evento
+                evento.clear()
+                avisos = self.avisos(canales, ultimo)
+                restante = limite - bucle.time()
+                if avisos or restante <= 0:
+                    return avisos
+                try:
+                    await asyncio.wait_for(evento.wait(), restante)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._bloqueo:
+                self._suscriptores.discard(suscriptor)
+
+
+class BrokerBaseDatos:
+    """
+    Avisos guardados en la tabla AvisoTraslado, compartida por todos los procesos. Las esperas
+    consultan la tabla cada ``intervalo`` segundos por el índice (canal, id).
+    """
+
+    def __init__(self, intervalo=2):
+        self.intervalo = intervalo
+
+    @property
+    def _avisos(self):
+        # Se resuelve al usarse: inventario.models importa este módulo
+        return apps.get_model('inventario', 'AvisoTraslado').objects
+
+    @property
+    def ultimo(self):
+        return self._avisos.ultimo()
+
+    def publicar(self, canales, datos):
+        self._avisos.publicar(canales, datos)
+
+    def avisos(self, canales, ultimo):
+        return self._avisos.leer(canales, ultimo)
+
+    async def esperar(self, canales, ultimo, espera):
+        """Igual que BrokerMemoria.esperar, consultando la base de datos cada ``intervalo`` segundos."""
+        bucle = asyncio.get_running_loop()
+        limite = bucle.time() + espera
+        while True:
+            avisos = await sync_to_async(self.avisos)(canales, ultimo)
+            restante = limite - bucle.time()
+            if avisos or restante <= 0:
+                return avisos
+            await asyncio.sleep(min(self.intervalo, restante))
+
+
+@lru_cache(maxsize=None)
+def obtener_broker():
+    """Broker configurado en NOTIFICACIONES_BROKER (una instancia por proceso)."""
+    return import_string(getattr(settings, 'NOTIFICACIONES_BROKER', BROKER_DEFECTO))()
+
+
+def servido_por_asgi(request):
+    """Con WSGI una espera larga ocuparía un hilo del servidor durante toda la espera."""
+    return isinstance(request, ASGIRequest)
+
+
+def notificar_traslado(tipo, empresa_id, sucursal_origen_id, sucursal_destino_id, **datos):
+    """
+    Publica un aviso de traslado ``creado`` o ``confirmado`` cuando se confirma la transacción en curso.
+
+    Llega a la sucursal destino y a los supervisores de la empresa; las confirmaciones también a la
+    sucursal de origen.
+    """
+    canales = {canal_empresa(empresa_id), canal_sucursal(sucursal_destino_id)}
+    if tipo == 'confirmado':
+        canales.add(canal_sucursal(sucursal_origen_id))
+    aviso = dict(datos, tipo=tipo, sucursal_origen=sucursal_origen_id, sucursal_destino=sucursal_destino_id)
+    transaction.on_commit(lambda: obtener_broker().publicar(canales, aviso))
@@ -0,0 +1,135 @@
+"""
+Propuestas de traslados entre sucursales para cubrir faltantes con excedentes de otras sucursales.
+
+Por producto, cada sucursal elegible (bodega o punto de venta) puede tener un excedente (stock por
+encima de su mínimo) o un faltante (mínimo menos stock y lo que ya viene en camino). El reparto se
+resuelve como un problema de transporte con flujo de costo mínimo: se cubre el mayor faltante
+posible y, entre los repartos que lo logran, el de menor costo según CostoRuta.
+"""
+from itertools import groupby
+
+from .models import AlertaStock, CostoRuta, Inventario, PropuestaTraslado
+
+TIPOS_ELEGIBLES = ('bodega', 'punto_venta')
+
+# Costo de las rutas que no tienen un CostoRuta registrado
+COSTO_DEFECTO = 1
+
+INFINITO = float('inf')
+
+
+def flujo_costo_minimo(ofertas, demandas, costo):
+    """
+    Resuelve el problema de transporte con caminos más cortos sucesivos (Bellman-Ford, porque las
+    aristas de retroceso del grafo residual tienen costo negativo).
+
+    :param ofertas: diccionario {origen: cantidad disponible}
+    :param demandas: diccionario {destino: cantidad requerida}
+    :param costo: función (origen, destino) -> costo por unidad, o None si la ruta no está permitida
+    :return: lista de tuplas (origen, destino, cantidad)
+    """
+    origenes, destinos = list(ofertas), list(demandas)
+    n = len(origenes) + len(destinos) + 2
+    fuente, sumidero = n - 2, n - 1
+    # Cada arista es [nodo destino, capacidad residual, costo, índice de la arista inversa]
+    grafo = [[] for _ in range(n)]
+
+    def agregar(u, v, capacidad, costo_unitario):
+        grafo[u].append([v, capacidad, costo_unitario, len(grafo[v])])
+        grafo[v].append([u, 0, -costo_unitario, len(grafo[u]) - 1])
+
+    for i, origen in enumerate(origenes):
+        agregar(fuente, i, ofertas[origen], 0)
+    for j, destino in enumerate(destinos):
+        agregar(len(origenes) + j, sumidero, demandas[destino], 0)
+    for i, origen in enumerate(origenes):
+        for j, destino in enumerate(destinos):
+            costo_unitario = costo(origen, destino)
+            if costo_unitario is not None:
+                agregar(i, len(origenes) + j, ofertas[origen], costo_unitario)
+
+    while True:
+        distancia = [INFINITO] * n
+        previo = [None] * n
+        distancia[fuente] = 0
+        for _ in range(n - 1):
+            cambio = False
+            for u in range(n):
+                if distancia[u] == INFINITO:
+                    continue
+                for k, (v, capacidad, costo_unitario, _) in enumerate(grafo[u]):
+                    if capacidad > 0 and distancia[u] + costo_unitario < distancia[v]:
+                        distancia[v] = distancia[u] + costo_unitario
+                        previo[v] = (u, k)
+                        cambio = True
+            if not cambio:
+                break
+        if distancia[sumidero] == INFINITO:
+            break
+
+        flujo, v = INFINITO, sumidero
+        while v != fuente:
+            u, k = previo[v]
+            flujo = min(flujo, grafo[u][k][1])
+            v = u
+        v = sumidero
+        while v != fuente:
+            u, k = previo[v]
+            arista = grafo[u][k]
+            arista[1] -= flujo
+            grafo[v][arista[3]][1] += flujo
+            v = u
+
+    envios = []
+    for i, origen in enumerate(origenes):
+        for v, _, _, inversa in grafo[i]:
+            # El flujo enviado por una arista es la capacidad acumulada en su inversa
+            if len(origenes) <= v < len(origenes) + len(destinos) and grafo[v][inversa][1] > 0:
+                envios.append((origen, destinos[v - len(origenes)], grafo[v][inversa][1]))
+    return envios
+
+
+def proponer_traslados(empresa, tamano_bloque=1000):
+    """
+    Calcula los traslados que cubren faltantes de stock mínimo con excedentes de otras sucursales
+    para todos los productos de la empresa.
+
+    Solo se revisan los productos con alguna alerta de stock bajo en una sucursal elegible.
+
+    :return: lista de PropuestaTraslado sin guardar
+    """
+    costos = {
+        (origen, destino): costo
+        for origen, destino, costo in CostoRuta.objects.filter(empresa=empresa)
+        .values_list('sucursal_origen_id', 'sucursal_destino_id', 'costo')
+    }
+    producto_ids = sorted(AlertaStock.objects.filter(
+        empresa=empresa, tipo='bajo', sucursal__tipo_sucursal__in=TIPOS_ELEGIBLES
+    ).values_list('producto_id', flat=True).distinct())
+
+    propuestas = []
+    for inicio in range(0, len(producto_ids), tamano_bloque):
+        bloque = producto_ids[inicio:inicio + tamano_bloque]
+        filas = Inventario.objects.filter(
+            empresa=empresa, producto_id__in=bloque, sucursal__tipo_sucursal__in=TIPOS_ELEGIBLES
+        ).order_by('producto_id').values_list('producto_id', 'sucursal_id', 'cantidad', 'en_transito', 'stock_minimo')
+
+        for producto_id, filas_producto in groupby(filas, key=lambda fila: fila[0]):
+            ofertas, demandas = {}, {}
+            for _, sucursal_id, cantidad, en_transito, stock_minimo in filas_producto:
+                faltante = stock_minimo - cantidad - en_transito
+                if faltante > 0:
+                    demandas[sucursal_id] = faltante
+                elif cantidad > stock_minimo:
+                    ofertas[sucursal_id] = cantidad - stock_minimo
+            if not ofertas or not demandas:
+                continue
+
+            for origen, destino, cantidad in flujo_costo_minimo(
+                    ofertas, demandas, lambda origen, destino: costos.get((origen, destino), COSTO_DEFECTO)):
+                propuestas.append(PropuestaTraslado(
+                    empresa=empresa, producto_id=producto_id, sucursal_origen_id=origen,
+                    sucursal_destino_id=destino, cantidad=cantidad,
+                    costo=cantidad * costos.get((origen, destino), COSTO_DEFECTO),
+                ))
+    return propuestas
@@ -0,0 +1,159 @@
+"""
+Cálculo de stock mínimo (punto de reorden) y cantidades de reposición sugeridas.
+
+Para cada fila de inventario de una empresa se estima el consumo diario y su variabilidad a partir de
+las salidas de MovimientoDiario, y el plazo de reposición de cada sucursal a partir de lo que tardan
+sus traslados entrantes desde que se crean hasta que se confirman:
+
+    stock de seguridad = z * sqrt(plazo * varianza_consumo + consumo² * varianza_plazo)
+    stock mínimo       = consumo * plazo + stock de seguridad
+    stock objetivo     = stock mínimo + consumo * periodo_revision
+
+Cuando el stock más lo que está en tránsito hacia la sucursal no supera el stock mínimo, se sugiere
+reponer hasta el stock objetivo. Todas las filas se calculan juntas con operaciones de NumPy.
+"""
+from datetime import datetime, time, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import AlertaStock, Inventario, MovimientoDiario, Traslado
+
+
+def _indices(claves_ordenadas, claves):
+    """Posición de cada clave en ``claves_ordenadas`` y máscara de las que existen."""
+    posiciones = np.searchsorted(claves_ordenadas, claves)
+    posiciones = np.minimum(posiciones, max(len(claves_ordenadas) - 1, 0))
+    existe = claves_ordenadas[posiciones] == claves if len(claves_ordenadas) else np.zeros(len(claves), bool)
+    return posiciones, existe
+
+
+def _plazos(empresa, desde, sucursales, plazo_defecto):
+    """
+    Media y varianza en días del plazo de los traslados confirmados por sucursal destino. Las
+    sucursales sin traslados usan ``plazo_defecto`` sin variabilidad.
+    """
+    filas = list(
+        Traslado.objects.filter(empresa=empresa, estado='confirmado',
+                                fecha_creacion__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+        .annotate(llegada=Coalesce('movimiento_entrada__fecha', 'movimiento_entrada_archivado__fecha'))
+        .exclude(llegada=None).values_list('sucursal_destino_id', 'fecha_creacion', 'llegada')
+    )
+    media = np.full(len(sucursales), float(plazo_defecto))
+    varianza = np.zeros(len(sucursales))
+    if not filas:
+        return media, varianza
+
+    destinos = np.array([destino for destino, _, _ in filas], dtype=np.int64)
+    dias = np.array([(llegada - creacion).total_seconds() / 86400 for _, creacion, llegada in filas])
+    posiciones, existe = _indices(sucursales, destinos)
+    posiciones, dias = posiciones[existe], dias[existe]
+
+    n = np.bincount(posiciones, minlength=len(sucursales))
+    suma = np.bincount(posiciones, weights=dias, minlength=len(sucursales))
+    suma2 = np.bincount(posiciones, weights=dias ** 2, minlength=len(sucursales))
+    con_datos = n > 0
+    media[con_datos] = suma[con_datos] / n[con_datos]
+    varias = n > 1
+    varianza[varias] = np.maximum(suma2[varias] - n[varias] * media[varias] ** 2, 0) / (n[varias] - 1)
+    return media, varianza
+
+
+def calcular_reposicion(empresa, dias=90, nivel_servicio=0.95, plazo_defecto=7, periodo_revision=7):
+    """
+    Calcula el stock mínimo y la cantidad de reposición sugeridos para todo el inventario de la empresa.
+
+    :param dias: días de historial de salidas considerados
+    :param nivel_servicio: probabilidad deseada de no quedar sin stock durante el plazo de reposición
+    :param plazo_defecto: plazo en días para las sucursales sin traslados confirmados en el período
+    :param periodo_revision: días de consumo que se reponen por encima del stock mínimo
+    :return: diccionario de arreglos alineados por fila de inventario: ``ids``, ``sucursales``,
+        ``productos``, ``cantidad``, ``en_transito``, ``consumo_diario``, ``stock_minimo`` y
+        ``cantidad_reposicion`` (actuales) y ``stock_minimo_sugerido`` y ``reposicion_sugerida``
+    """
+    desde = timezone.localdate() - timedelta(days=dias)
+    filas = np.array(list(
+        Inventario.objects.filter(empresa=empresa).order_by('sucursal_id', 'producto_id')
+        .values_list('pk', 'sucursal_id', 'producto_id', 'cantidad', 'en_transito', 'stock_minimo',
+                     'cantidad_reposicion')
+    ), dtype=np.int64).reshape(-1, 7)
+    ids, sucursales, productos, cantidad, en_transito, stock_minimo, cantidad_reposicion = filas.T
+
+    # Salidas por día de cada (sucursal, producto); los días sin salidas cuentan como consumo 0
+    salidas = np.array(list(
+        MovimientoDiario.objects.filter(empresa=empresa, dia__gte=desde, salidas__gt=0)
+        .values('sucursal_id', 'producto_id', 'dia').annotate(total=Sum('salidas'))
+        .values_list('sucursal_id', 'producto_id', 'total').order_by()
+    ), dtype=np.int64).reshape(-1, 3)
+
+    # (sucursal, producto) como un solo entero; las filas ya vienen ordenadas por esa clave
+    base = int(max(productos.max(initial=0), salidas[:, 1].max(initial=0))) + 1
+    claves = sucursales * base + productos
+    n = len(ids)
+
+    posiciones, existe = _indices(claves, salidas[:, 0] * base + salidas[:, 1])
+    diario = salidas[existe, 2].astype(float)
+    suma = np.bincount(posiciones[existe], weights=diario, minlength=n)
+    suma2 = np.bincount(posiciones[existe], weights=diario ** 2, minlength=n)
+    consumo = suma / dias
+    varianza_consumo = np.maximum(suma2 / dias - consumo ** 2, 0)
+
+    lista_sucursales = np.unique(sucursales)
+    media_plazo, varianza_plazo = _plazos(empresa, desde, lista_sucursales, plazo_defecto)
+    posiciones, _ = _indices(lista_sucursales, sucursales)
+    plazo, varianza_plazo = media_plazo[posiciones], varianza_plazo[posiciones]
+
+    z = NormalDist().inv_cdf(nivel_servicio)
+    seguridad = z * np.sqrt(plazo * varianza_consumo + consumo ** 2 * varianza_plazo)
+    punto_reorden = consumo * plazo + seguridad
+    sugerido = np.ceil(punto_reorden).astype(np.int64)
+    posicion = cantidad + en_transito
+    reposicion = np.where(
+        posicion <= sugerido, np.ceil(punto_reorden + consumo * periodo_revision - posicion), 0
+    ).astype(np.int64)
+    reposicion = np.maximum(reposicion, 0)
+
+    return {
+        'ids': ids,
+        'sucursales': sucursales,
+        'productos': productos,
+        'cantidad': cantidad,
+        'en_transito': en_transito,
+        'consumo_diario': consumo,
+        'stock_minimo': stock_minimo,
+        'cantidad_reposicion': cantidad_reposicion,
+        'stock_minimo_sugerido': sugerido,
+        'reposicion_sugerida': reposicion,
+    }
+
+
+def aplicar_reposicion(resultado, tamano_bloque=1000):
+    """
+    Guarda en Inventario los valores sugeridos que difieren de los actuales, con ``bulk_update`` por
+    bloques y una transacción por bloque, y actualiza las alertas de stock de esas filas.
+
+    :param resultado: diccionario devuelto por ``calcular_reposicion``
+    :return: cantidad de filas actualizadas
+    """
+    cambios = np.flatnonzero((resultado['stock_minimo_sugerido'] != resultado['stock_minimo'])
+                             | (resultado['reposicion_sugerida'] != resultado['cantidad_reposicion']))
+    sugeridos = {
+        int(resultado['ids'][i]): (int(resultado['stock_minimo_sugerido'][i]),
+                                   int(resultado['reposicion_sugerida'][i]))
+        for i in cambios
+    }
+    pks = list(sugeridos)
+    for inicio in range(0, len(pks), tamano_bloque):
+        with transaction.atomic():
+            # Se bloquean y releen las filas para que las alertas usen la cantidad vigente
+            inventarios = list(Inventario.objects.select_for_update()
+                               .filter(pk__in=pks[inicio:inicio + tamano_bloque]))
+            for inventario in inventarios:
+                inventario.stock_minimo, inventario.cantidad_reposicion = sugeridos[inventario.pk]
+            Inventario.objects.bulk_update(inventarios, ['stock_minimo', 'cantidad_reposicion'])
+            AlertaStock.objects.sincronizar(inventarios)
+    return len(pks)
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import ArchivoSoporte, MovimientoInventario, MovimientoInventarioArchivado, Traslado, \
+    TrasladoDocumento
+
+# Modelos cuyo documento_soporte usa AlmacenamientoDeduplicado. Las altas con bulk_create no emiten
+# señales: quien las hace debe llamar a ArchivoSoporte.objects.ajustar_referencias.
+MODELOS_CON_DOCUMENTO = (MovimientoInventario, MovimientoInventarioArchivado, Traslado, TrasladoDocumento)
+
+
+def recordar_documento_anterior(sender, instance, update_fields=None, **kwargs):
+    instance._documento_anterior = None
+    if not instance._state.adding and (update_fields is None or 'documento_soporte' in update_fields):
+        instance._documento_anterior = sender.objects.filter(pk=instance.pk) \
+            .values_list('documento_soporte', flat=True).first()
+
+
+def contar_referencia_documento(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields is not None and 'documento_soporte' not in update_fields:
+        return
+    nuevo = instance.documento_soporte.name or None
+    anterior = getattr(instance, '_documento_anterior', None) or None
+    if nuevo != anterior:
+        ArchivoSoporte.objects.ajustar_referencias([nuevo], 1)
+        ArchivoSoporte.objects.ajustar_referencias([anterior], -1)
+
+
+def descontar_referencia_documento(sender, instance, **kwargs):
+    ArchivoSoporte.objects.ajustar_referencias([instance.documento_soporte.name], -1)
+
+
+for modelo in MODELOS_CON_DOCUMENTO:
+    pre_save.connect(recordar_documento_anterior, sender=modelo)
+    post_save.connect(contar_referencia_documento, sender=modelo)
+    post_delete.connect(descontar_referencia_documento, sender=modelo)
@@ -1,3 +1,876 @@
-from django.test import TestCase
+import asyncio
+import io
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import openpyxl
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from productos.models import Producto
+from usuarios.models import Empresa, Sucursal, Usuario, UsuarioPerfil
+from usuarios.paginacion import paginar_por_cursor
+from .models import AlertaStock, ArchivoSoporte, CostoRuta, EventoStock, Inventario, MovimientoInventario, Traslado, \
+    TrasladoDocumento, InventarioSnapshot, MovimientoDiario, MovimientoInventarioArchivado, PropuestaTraslado, \
+    StockEnTransito, resumen_producto
+from .notificaciones import BrokerBaseDatos, BrokerMemoria, canal_sucursal, obtener_broker
+from .rebalanceo import flujo_costo_minimo
+from .reposicion import aplicar_reposicion, calcular_reposicion
+
+
+def crear_datos_base():
+    empresa = Empresa.objects.create(nombre='Empresa Prueba')
+    bodega = Sucursal.objects.create(empresa=empresa, nombre='Bodega', abreviatura='BOD', tipo_sucursal='bodega')
+    local = Sucursal.objects.create(empresa=empresa, nombre='Local', abreviatura='LOC', tipo_sucursal='punto_venta')
+    producto = Producto.objects.create(codigo='P001', nombre='Producto', precio=Decimal('10.00'), empresa=empresa)
+    return empresa, bodega, local, producto
+
+
+def crear_usuario(empresa, grupos=('Encargado', 'Auditor')):
+    usuario = Usuario.objects.create_user('encargado', password='clave')
+    for nombre in grupos:
+        usuario.groups.add(Group.objects.get_or_create(name=nombre)[0])
+    UsuarioPerfil.objects.create(usuario=usuario, empresa=empresa)
+    return usuario
+
+
+def saldo_segun_movimientos(sucursal, producto):
+    totales = MovimientoInventario.objects.filter(sucursal=sucursal, producto=producto).values('tipo_movimiento') \
+        .annotate(total=Sum('cantidad'))
+    totales = {fila['tipo_movimiento']: fila['total'] for fila in totales}
+    return totales.get('entrada', 0) - totales.get('salida', 0)
+
+
+class MovimientoInventarioTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def registrar(self, tipo, cantidad, sucursal=None):
+        return MovimientoInventario.objects.create(
+            sucursal=sucursal or self.bodega, producto=self.producto, tipo_movimiento=tipo,
+            tipo_documento='otros', cantidad=cantidad
+        )
+
+    def test_entrada_y_salida_actualizan_stock(self):
+        self.registrar('entrada', 10)
+        self.registrar('salida', 4)
+        inventario = Inventario.objects.get(sucursal=self.bodega, producto=self.producto)
+        self.assertEqual(inventario.cantidad, 6)
+
+    def test_salida_sin_stock_no_registra_movimiento(self):
+        self.registrar('entrada', 3)
+        with self.assertRaisesMessage(ValueError, 'Stock insuficiente'):
+            self.registrar('salida', 5)
+        self.assertEqual(MovimientoInventario.objects.count(), 1)
+        self.assertEqual(Inventario.objects.get(sucursal=self.bodega, producto=self.producto).cantidad, 3)
+
+    def test_traslado_no_se_confirma_dos_veces(self):
+        self.registrar('entrada', 5)
+        traslado = Traslado.objects.create(
+            producto=self.producto, sucursal_origen=self.bodega, sucursal_destino=self.local,
+            cantidad_entregada=5, tipo_documento='guia_remision'
+        )
+        traslado.cantidad_recibida = 5
+        traslado.confirmar()
+
+        # Una segunda instancia con el estado desactualizado no debe duplicar la entrada
+        copia = Traslado.objects.get(pk=traslado.pk)
+        copia.estado = 'pendiente'
+        with self.assertRaises(ValueError):
+            copia.confirmar()
+        self.assertEqual(Inventario.objects.get(sucursal=self.local, producto=self.producto).cantidad, 5)
+
+
+class RegistrarLoteTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def linea(self, tipo, cantidad, **extra):
+        datos = {
+            'sucursal': self.bodega.pk, 'producto': self.producto.pk, 'tipo_movimiento': tipo,
+            'tipo_documento': 'nota_venta', 'cantidad': cantidad, 'documento_respaldo': 'NV-1',
+        }
+        datos.update(extra)
+        return datos
+
+    def test_aplica_delta_neto_y_rechaza_lineas_sin_stock(self):
+        movimientos, errores = MovimientoInventario.objects.registrar_lote(
+            [self.linea('entrada', 10), self.linea('salida', 4), self.linea('salida', 7), self.linea('salida', 6)],
+            self.empresa
+        )
+        self.assertEqual(len(movimientos), 3)
+        self.assertEqual([indice for indice, _ in errores], [2])
+        self.assertTrue(all(movimiento.pk for movimiento in movimientos))
+        self.assertEqual(Inventario.objects.get(sucursal=self.bodega, producto=self.producto).cantidad, 0)
+        self.assertEqual(saldo_segun_movimientos(self.bodega, self.producto), 0)
+
+    def test_todo_o_nada_descarta_el_lote(self):
+        otra = Empresa.objects.create(nombre='Otra')
+        ajeno = Producto.objects.create(codigo='X1', nombre='Ajeno', precio=Decimal('1.00'), empresa=otra)
+        movimientos, errores = MovimientoInventario.objects.registrar_lote(
+            [self.linea('entrada', 10), self.linea('entrada', 1, producto=ajeno.pk)], self.empresa, todo_o_nada=True
+        )
+        self.assertEqual(movimientos, [])
+        self.assertEqual([indice for indice, _ in errores], [1])
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+
+class TrasladoDocumentoTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.otro = Producto.objects.create(codigo='P002', nombre='Otro', precio=Decimal('5.00'), empresa=self.empresa)
+        MovimientoInventario.objects.registrar_lote([
+            {'sucursal': self.bodega.pk, 'producto': producto.pk, 'tipo_movimiento': 'entrada',
+             'tipo_documento': 'factura', 'cantidad': 20}
+            for producto in (self.producto, self.otro)
+        ], self.empresa)
+
+    def nuevo_documento(self):
+        return TrasladoDocumento(sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                 tipo_documento='guia_remision', documento_respaldo='GR-1')
+
+    def stock(self, sucursal, producto):
+        return Inventario.objects.get(sucursal=sucursal, producto=producto).cantidad
+
+    def test_despachar_y_confirmar_todas_las_lineas(self):
+        documento = self.nuevo_documento()
+        lineas = documento.despachar([(self.producto, 5), (self.otro, 8)])
+        self.assertEqual(self.stock(self.bodega, self.producto), 15)
+        self.assertEqual(self.stock(self.bodega, self.otro), 12)
+        self.assertTrue(all(linea.movimiento_salida_id for linea in documento.lineas.all()))
+
+        cantidades = {linea.pk: 0 if linea.producto == self.otro else 5 for linea in documento.lineas.all()}
+        documento.confirmar(cantidades)
+        self.assertEqual(self.stock(self.local, self.producto), 5)
+        self.assertFalse(Inventario.objects.filter(sucursal=self.local, producto=self.otro, cantidad__gt=0).exists())
+        self.assertEqual(documento.lineas.filter(estado='confirmado').count(), len(lineas))
+        with self.assertRaises(ValueError):
+            TrasladoDocumento.objects.get(pk=documento.pk).confirmar(cantidades)
+
+    def test_linea_sin_stock_cancela_el_documento(self):
+        with self.assertRaisesMessage(ValueError, 'Stock insuficiente'):
+            self.nuevo_documento().despachar([(self.producto, 5), (self.otro, 50)])
+        self.assertFalse(TrasladoDocumento.objects.exists())
+        self.assertEqual(self.stock(self.bodega, self.producto), 20)
+
+
+class InventarioSnapshotTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.ahora = timezone.now()
+
+    def registrar(self, tipo, cantidad, dias_atras, sucursal=None):
+        movimiento = MovimientoInventario.objects.create(
+            sucursal=sucursal or self.bodega, producto=self.producto, tipo_movimiento=tipo,
+            tipo_documento='otros', cantidad=cantidad
+        )
+        MovimientoInventario.objects.filter(pk=movimiento.pk).update(fecha=self.ahora - timedelta(days=dias_atras))
+
+    def test_stock_a_fecha_parte_del_snapshot(self):
+        self.registrar('entrada', 10, 90)
+        self.registrar('salida', 3, 70)
+        self.registrar('entrada', 4, 40, sucursal=self.local)
+        self.registrar('salida', 2, 20)
+
+        InventarioSnapshot.objects.generar(self.empresa, self.ahora - timedelta(days=60))
+        InventarioSnapshot.objects.generar(self.empresa, self.ahora - timedelta(days=30))
+        self.assertEqual(InventarioSnapshot.objects.get(
+            sucursal=self.bodega, fecha_corte=self.ahora - timedelta(days=30)).valor, Decimal('70.00'))
+
+        self.assertEqual(InventarioSnapshot.objects.stock_a_fecha(self.producto, self.ahora - timedelta(days=80)),
+                         {self.bodega.pk: 10})
+        self.assertEqual(InventarioSnapshot.objects.stock_a_fecha(self.producto, self.ahora - timedelta(days=35)),
+                         {self.bodega.pk: 7, self.local.pk: 4})
+        self.assertEqual(InventarioSnapshot.objects.stock_a_fecha(self.producto, self.ahora, sucursal=self.bodega), 5)
+
+    def test_vista_stock_a_fecha_valida_parametros(self):
+        self.registrar('entrada', 10, 5)
+        self.client.force_login(crear_usuario(self.empresa))
+        url = reverse('stock_a_fecha')
+        datos = self.client.get(url, {'producto': self.producto.pk, 'fecha': timezone.localdate().isoformat()}).json()
+        self.assertEqual(datos['total'], 10)
+        self.assertEqual(self.client.get(url, {'producto': 'abc', 'fecha': '2024-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'producto': 999999, 'fecha': '2024-01-01'}).status_code, 404)
+
+
+class MovimientoDiarioTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def resumen(self):
+        return list(MovimientoDiario.objects.order_by('sucursal_id', 'tipo_documento').values_list(
+            'sucursal_id', 'tipo_documento', 'dia', 'entradas', 'salidas', 'num_entradas', 'num_salidas'))
+
+    def test_acumulado_coincide_con_reconstruccion(self):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='factura', cantidad=10)
+        MovimientoInventario.objects.registrar_lote([
+            {'sucursal': self.bodega.pk, 'producto': self.producto.pk, 'tipo_movimiento': tipo,
+             'tipo_documento': 'nota_venta', 'cantidad': cantidad}
+            for tipo, cantidad in [('salida', 2), ('salida', 3), ('entrada', 1)]
+        ], self.empresa)
+
+        incremental = self.resumen()
+        hoy = timezone.localdate()
+        self.assertEqual(incremental, [
+            (self.bodega.pk, 'factura', hoy, 10, 0, 1, 0),
+            (self.bodega.pk, 'nota_venta', hoy, 1, 5, 1, 2),
+        ])
+        MovimientoDiario.objects.reconstruir(self.empresa)
+        self.assertEqual(self.resumen(), incremental)
+
+    def test_clave_unica_sin_usuario(self):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='factura', cantidad=10)
+        fila = MovimientoDiario.objects.get()
+        self.assertEqual((fila.usuario_id, fila.usuario_clave), (None, 0))
+        # Una segunda fila para el mismo día y sin usuario viola la clave única en lugar de duplicar el resumen
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MovimientoDiario.objects.create(empresa=self.empresa, sucursal=self.bodega, producto=self.producto,
+                                            tipo_documento='factura', dia=fila.dia)
+
+
+class ResumenProductoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def test_resumen_y_invalidacion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto,
+                                                tipo_movimiento='entrada', tipo_documento='factura', cantidad=10)
+            traslado = Traslado.objects.create(sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                               producto=self.producto, cantidad_entregada=4)
+        resumen = resumen_producto(self.producto)
+        self.assertEqual(resumen['entradas'], 10)
+        self.assertEqual(resumen['traslados_salida'], 4)
+        self.assertEqual(resumen['traslados_pendientes'], 4)
+        self.assertEqual(resumen['total_fisico'], 6)
+        with self.assertNumQueries(0):
+            self.assertEqual(resumen_producto(self.producto), resumen)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            traslado.cantidad_recibida = 3
+            traslado.confirmar()
+        resumen = resumen_producto(self.producto)
+        self.assertEqual(resumen['traslados_pendientes'], 0)
+        self.assertEqual(resumen['traslados_entrada'], 3)
+        self.assertEqual(resumen['diferencia_traslados'], 1)
+        self.assertEqual(resumen['total_fisico'], 9)
+
+
+class ReconciliacionInventarioTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def test_detecta_y_corrige_diferencias(self):
+        for sucursal in (self.bodega, self.local):
+            MovimientoInventario.objects.create(sucursal=sucursal, producto=self.producto, tipo_movimiento='entrada',
+                                                tipo_documento='factura', cantidad=10)
+        # Deriva típica de la carga masiva: el stock se escribe sin registrar movimiento
+        Inventario.objects.filter(sucursal=self.bodega).update(cantidad=7)
+        Inventario.objects.filter(sucursal=self.local).delete()
+
+        self.assertEqual(list(Inventario.objects.discrepancias(self.bodega.pk, tamano_bloque=1)),
+                         [(self.producto.pk, 7, 10)])
+        self.assertEqual(list(Inventario.objects.discrepancias(self.local.pk)), [(self.producto.pk, 0, 10)])
+
+        with tempfile.NamedTemporaryFile(suffix='.csv') as reporte:
+            call_command('reconciliar_inventario', '--procesos', '1', '--salida', reporte.name, '--fix',
+                         stdout=io.StringIO())
+            with open(reporte.name, encoding='utf-8') as archivo:
+                self.assertEqual(len(archivo.readlines()), 3)
+
+        self.assertEqual(saldo_segun_movimientos(self.bodega, self.producto), 7)
+        self.assertEqual(saldo_segun_movimientos(self.local, self.producto), 0)
+        self.assertEqual(list(Inventario.objects.discrepancias(self.bodega.pk)), [])
+        self.assertEqual(list(Inventario.objects.discrepancias(self.local.pk)), [])
+
+
+class PaginacionCursorTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        MovimientoInventario.objects.registrar_lote([
+            {'sucursal': self.bodega.pk, 'producto': self.producto.pk, 'tipo_movimiento': 'entrada',
+             'tipo_documento': 'factura', 'cantidad': 1}
+            for _ in range(7)
+        ], self.empresa)
+        self.factory = RequestFactory()
+
+    def pagina(self, url=''):
+        return paginar_por_cursor(self.factory.get(url), MovimientoInventario.objects.all(), 'fecha', 'movimientos',
+                                  tamano=3)
+
+    def test_recorre_todas_las_filas_en_ambos_sentidos(self):
+        # Todas las filas comparten la fecha del lote, así que el desempate por id es el que ordena
+        paginas = [self.pagina()]
+        while paginas[-1]['url_siguiente']:
+            paginas.append(self.pagina(paginas[-1]['url_siguiente']))
+        ids = [m.pk for pagina in paginas for m in pagina['elementos']]
+        self.assertEqual(ids, sorted(MovimientoInventario.objects.values_list('pk', flat=True), reverse=True))
+        self.assertIsNone(paginas[0]['url_anterior'])
+
+        anterior = self.pagina(paginas[-1]['url_anterior'])
+        self.assertEqual(anterior['elementos'], paginas[-2]['elementos'])
+        self.assertEqual(self.pagina('?movimientos_despues=no-valido')['elementos'], paginas[0]['elementos'])
+
+
+class HistorialDatatableTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.client.force_login(crear_usuario(self.empresa))
+        with self.captureOnCommitCallbacks(execute=True):
+            for cantidad in (5, 7):
+                MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto,
+                                                    tipo_movimiento='entrada', tipo_documento='factura',
+                                                    cantidad=cantidad)
+            Traslado.objects.create(sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                    producto=self.producto, cantidad_entregada=2)
+
+    def consultar(self, nombre, **params):
+        return self.client.get(reverse(nombre), {'draw': 3, 'start': 0, 'length': 10, **params}).json()
+
+    def test_filtros_y_conteos(self):
+        datos = self.consultar('movimientos_datatable', sin_traslados='1', **{
+            'columns[0][data]': 'cantidad', 'order[0][column]': '0', 'order[0][dir]': 'asc'})
+        self.assertEqual((datos['draw'], datos['recordsTotal'], datos['recordsFiltered']), (3, 3, 2))
+        self.assertEqual([fila['cantidad'] for fila in datos['data']], [5, 7])
+
+        datos = self.consultar('traslados_datatable', sucursal=self.local.pk, estado='pendiente')
+        self.assertEqual(datos['recordsFiltered'], 1)
+        self.assertEqual(datos['data'][0]['cantidad_entregada'], 2)
+
+    def test_usuario_sin_empresa_recibe_tabla_vacia(self):
+        usuario = Usuario.objects.create_user('sin_perfil', password='clave')
+        usuario.groups.add(Group.objects.get(name='Encargado'))
+        self.client.force_login(usuario)
+        for nombre in ('movimientos_datatable', 'traslados_datatable'):
+            datos = self.consultar(nombre)
+            self.assertEqual((datos['draw'], datos['recordsTotal'], datos['recordsFiltered'], datos['data']),
+                             (3, 0, 0, []))
+
+    def test_conteo_cacheado_se_invalida_con_nuevos_movimientos(self):
+        self.assertEqual(self.consultar('movimientos_datatable')['recordsTotal'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            MovimientoInventario.objects.create(sucursal=self.local, producto=self.producto,
+                                                tipo_movimiento='entrada', tipo_documento='otros', cantidad=1)
+        self.assertEqual(self.consultar('movimientos_datatable')['recordsTotal'], 4)
+
+
+class ExportarMovimientosTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.client.force_login(crear_usuario(self.empresa))
+        for sucursal, cantidad in ((self.bodega, 5), (self.local, 3)):
+            MovimientoInventario.objects.create(sucursal=sucursal, producto=self.producto, tipo_movimiento='entrada',
+                                                tipo_documento='factura', cantidad=cantidad)
+
+    def test_csv_filtrado_en_streaming(self):
+        respuesta = self.client.get(reverse('exportar_movimientos', args=['csv']), {'sucursal': self.bodega.pk})
+        self.assertTrue(respuesta.streaming)
+        lineas = b''.join(respuesta.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertTrue(lineas[1].endswith(',Bodega,Entrada,Factura,,5,,'))
+
+    def test_xlsx(self):
+        respuesta = self.client.get(reverse('exportar_movimientos', args=['xlsx']))
+        libro = openpyxl.load_workbook(io.BytesIO(b''.join(respuesta.streaming_content)))
+        self.assertEqual([fila[7] for fila in libro.active.iter_rows(min_row=2, values_only=True)], [3, 5])
+
+    def test_usuario_sin_empresa(self):
+        usuario = Usuario.objects.create_user('sin_perfil', password='clave')
+        usuario.groups.add(Group.objects.get(name='Auditor'))
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get(reverse('exportar_movimientos', args=['csv'])).status_code, 404)
+
+
+class EmpresaDenormalizadaTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def test_empresa_se_copia_del_producto(self):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='factura', cantidad=5)
+        MovimientoInventario.objects.registrar_lote([
+            {'sucursal': self.local.pk, 'producto': self.producto.pk, 'tipo_movimiento': 'entrada',
+             'tipo_documento': 'factura', 'cantidad': 1},
+        ], self.empresa)
+        Traslado.objects.create(sucursal_origen=self.bodega, sucursal_destino=self.local, producto=self.producto,
+                                cantidad_entregada=2)
+        for modelo in (Inventario, MovimientoInventario, Traslado):
+            self.assertFalse(modelo.objects.exclude(empresa=self.empresa).exists(), modelo.__name__)
+
+    def test_comando_completa_filas_existentes(self):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='factura', cantidad=5)
+        for modelo in (Inventario, MovimientoInventario):
+            modelo.objects.update(empresa=None)
+        call_command('poblar_empresa_inventario', '--tamano-bloque', '1', stdout=io.StringIO())
+        for modelo in (Inventario, MovimientoInventario):
+            self.assertEqual(list(modelo.objects.values_list('empresa_id', flat=True)), [self.empresa.pk])
+
+
+class ArchivoMovimientosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.client.force_login(crear_usuario(self.empresa))
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='factura', cantidad=10)
+        self.traslado = Traslado.objects.create(sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                                producto=self.producto, cantidad_entregada=4)
+        self.antiguo = timezone.now() - timedelta(days=70)
+        MovimientoInventario.objects.update(fecha=self.antiguo)
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='salida',
+                                            tipo_documento='nota_venta', cantidad=1)
+
+    def test_archiva_y_conserva_saldos(self):
+        mes = timezone.localdate().replace(day=1)
+        call_command('archivar_movimientos', '--antes-de', f'{mes:%Y-%m}', '--tamano-bloque', '1',
+                     stdout=io.StringIO())
+
+        self.assertEqual(MovimientoInventario.objects.count(), 1)
+        self.assertEqual(MovimientoInventarioArchivado.objects.count(), 2)
+        self.traslado.refresh_from_db()
+        self.assertIsNone(self.traslado.movimiento_salida)
+        self.assertEqual(self.traslado.salida.cantidad, 4)
+
+        self.assertEqual(list(Inventario.objects.discrepancias(self.bodega.pk)), [])
+        self.assertEqual(InventarioSnapshot.objects.stock_a_fecha(self.producto, timezone.now(), self.bodega), 5)
+        self.assertEqual(resumen_producto(self.producto)['traslados_salida'], 4)
+
+        desde = timezone.localtime(self.antiguo).strftime('%Y-%m-%d')
+        datos = self.client.get(reverse('movimientos_datatable'), {'fecha_desde': desde}).json()
+        self.assertEqual((datos['recordsTotal'], datos['recordsFiltered']), (3, 3))
+        datos = self.client.get(reverse('movimientos_datatable')).json()
+        self.assertEqual((datos['recordsTotal'], datos['recordsFiltered']), (1, 1))
+
+
+class DocumentoSoporteDeduplicadoTests(TestCase):
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajuste = override_settings(MEDIA_ROOT=directorio.name)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def registrar(self, documento):
+        return MovimientoInventario.objects.create(
+            sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+            tipo_documento='factura', cantidad=1, documento_soporte=documento
+        )
+
+    def test_mismo_contenido_se_guarda_una_vez_y_se_borra_sin_referencias(self):
+        primero = self.registrar(SimpleUploadedFile('factura.pdf', b'%PDF contenido'))
+        segundo = self.registrar(SimpleUploadedFile('copia.PDF', b'%PDF contenido'))
+        self.assertEqual(primero.documento_soporte.name, segundo.documento_soporte.name)
+        archivo = ArchivoSoporte.objects.get()
+        self.assertEqual(archivo.referencias, 2)
+        self.assertTrue(default_storage.exists(archivo.nombre))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primero.delete()
+        self.assertEqual(ArchivoSoporte.objects.get().referencias, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            segundo.delete()
+        self.assertFalse(ArchivoSoporte.objects.exists())
+        self.assertFalse(default_storage.exists(archivo.nombre))
+
+    def test_comando_migra_archivos_existentes(self):
+        for nombre in ('documento_soporte/a.pdf', 'documento_soporte/b.pdf'):
+            default_storage.save(nombre, ContentFile(b'escaneo'))
+        self.registrar('documento_soporte/a.pdf')
+        self.registrar('documento_soporte/b.pdf')
+        self.assertFalse(ArchivoSoporte.objects.exists())
+
+        call_command('deduplicar_documentos_soporte', stdout=io.StringIO())
+
+        archivo = ArchivoSoporte.objects.get()
+        self.assertEqual(archivo.referencias, 2)
+        self.assertEqual(set(MovimientoInventario.objects.values_list('documento_soporte', flat=True)),
+                         {archivo.nombre})
+        self.assertFalse(default_storage.exists('documento_soporte/a.pdf'))
+        self.assertFalse(default_storage.exists('documento_soporte/b.pdf'))
+
+
+class AlertaStockTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.client.force_login(crear_usuario(self.empresa))
+        self.inventario = Inventario.objects.create(sucursal=self.bodega, producto=self.producto, stock_minimo=5)
+
+    def registrar(self, tipo, cantidad):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento=tipo,
+                                            tipo_documento='otros', cantidad=cantidad)
+
+    def alertas(self):
+        return set(AlertaStock.objects.filter(inventario=self.inventario).values_list('tipo', flat=True))
+
+    def test_alertas_siguen_los_cruces_de_stock_minimo_y_cero(self):
+        self.assertEqual(self.alertas(), {'bajo', 'agotado'})
+        self.registrar('entrada', 3)
+        self.assertEqual(self.alertas(), {'bajo'})
+        desde = AlertaStock.objects.get(tipo='bajo').desde
+
+        self.registrar('entrada', 1)
+        self.assertEqual(AlertaStock.objects.get(tipo='bajo').desde, desde)
+        self.registrar('entrada', 10)
+        self.assertEqual(self.alertas(), set())
+
+        MovimientoInventario.objects.registrar_lote([
+            {'sucursal': self.bodega.pk, 'producto': self.producto.pk, 'tipo_movimiento': 'salida',
+             'tipo_documento': 'otros', 'cantidad': 14},
+        ], self.empresa)
+        self.assertEqual(self.alertas(), {'bajo', 'agotado'})
+
+    def test_inicio_y_reporte_leen_las_alertas(self):
+        self.registrar('entrada', 5)
+        respuesta = self.client.get(reverse('inicio'))
+        self.assertEqual(respuesta.context['productos_bajo_stock'], 0)
+        self.assertEqual(respuesta.context['productos_agotados'], 0)
+        # En el mínimo: el reporte lo lista aunque el inicio solo cuenta los que están por debajo
+        respuesta = self.client.get(reverse('reporte_inventario_valorizado'))
+        self.assertEqual(list(respuesta.context['productos_stock_bajo']), [self.inventario])
+
+        self.registrar('salida', 5)
+        respuesta = self.client.get(reverse('inicio'))
+        self.assertEqual(respuesta.context['productos_bajo_stock'], 1)
+        self.assertEqual(respuesta.context['productos_agotados'], 1)
+
+    def test_comando_reconstruye_alertas(self):
+        AlertaStock.objects.all().delete()
+        Inventario.objects.filter(pk=self.inventario.pk).update(cantidad=2)
+        call_command('recalcular_alertas_stock', stdout=io.StringIO())
+        self.assertEqual(self.alertas(), {'bajo'})
+
+
+class ReposicionTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        hoy = timezone.localdate()
+        MovimientoDiario.objects.bulk_create([
+            MovimientoDiario(empresa=self.empresa, sucursal=sucursal, producto=self.producto, tipo_documento='otros',
+                             dia=hoy - timedelta(days=dia), salidas=cantidad, num_salidas=1)
+            for sucursal, cantidad in ((self.bodega, 5), (self.local, 2)) for dia in range(10)
+        ])
+
+    def test_sugiere_con_plazo_por_defecto_y_plazo_de_traslados(self):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='otros', cantidad=30)
+        Inventario.objects.create(sucursal=self.local, producto=self.producto)
+        # El plazo es de la sucursal destino; se mide con un traslado de otro producto
+        otro = Producto.objects.create(codigo='P002', nombre='Otro', precio=Decimal('1.00'), empresa=self.empresa)
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=otro, tipo_movimiento='entrada',
+                                            tipo_documento='otros', cantidad=6)
+        traslado = Traslado.objects.create(producto=otro, sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                           cantidad_entregada=6, tipo_documento='guia_remision')
+        traslado.cantidad_recibida = 6
+        traslado.confirmar()
+        Traslado.objects.filter(pk=traslado.pk).update(fecha_creacion=traslado.entrada.fecha - timedelta(days=3))
+
+        resultado = calcular_reposicion(self.empresa, dias=10, plazo_defecto=7, periodo_revision=7)
+        filas = {
+            sucursal: (sugerido, reposicion)
+            for sucursal, producto, sugerido, reposicion in zip(
+                resultado['sucursales'].tolist(), resultado['productos'].tolist(),
+                resultado['stock_minimo_sugerido'].tolist(), resultado['reposicion_sugerida'].tolist())
+            if producto == self.producto.pk
+        }
+        # Consumo constante: el stock mínimo es consumo diario por plazo, sin stock de seguridad
+        self.assertEqual(filas, {self.bodega.pk: (35, 40), self.local.pk: (6, 20)})
+
+        aplicar_reposicion(resultado)
+        self.assertEqual(Inventario.objects.get(sucursal=self.bodega, producto=self.producto).stock_minimo, 35)
+        self.assertTrue(AlertaStock.objects.filter(sucursal=self.bodega, producto=self.producto, tipo='bajo').exists())
+        self.assertEqual(aplicar_reposicion(calcular_reposicion(self.empresa, dias=10)), 0)
+
+
+class RebalanceoTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.norte = Sucursal.objects.create(empresa=self.empresa, nombre='Norte', abreviatura='NOR',
+                                             tipo_sucursal='punto_venta')
+        self.laboratorio = Sucursal.objects.create(empresa=self.empresa, nombre='Lab', abreviatura='LAB',
+                                                   tipo_sucursal='laboratorio')
+        for sucursal, cantidad, minimo in ((self.bodega, 20, 5), (self.norte, 12, 10), (self.local, 1, 8),
+                                           (self.laboratorio, 50, 0)):
+            Inventario.objects.create(sucursal=sucursal, producto=self.producto, cantidad=cantidad, stock_minimo=minimo)
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(empresa=self.empresa, sucursal=inventario.sucursal, producto=self.producto,
+                                 tipo_movimiento='entrada', tipo_documento='otros', cantidad=inventario.cantidad)
+            for inventario in Inventario.objects.all()
+        ])
+
+    def test_flujo_costo_minimo_prefiere_rutas_baratas(self):
+        costos = {('a', 'x'): 5, ('b', 'x'): 1, ('a', 'y'): 1, ('b', 'y'): 5}
+        envios = flujo_costo_minimo({'a': 4, 'b': 4}, {'x': 3, 'y': 6}, lambda o, d: costos[o, d])
+        self.assertEqual(sorted(envios), [('a', 'y', 4), ('b', 'x', 3), ('b', 'y', 1)])
+
+    def test_genera_y_acepta_propuestas_como_documentos(self):
+        # El norte está más cerca: cubre lo que puede de su excedente y la bodega el resto
+        CostoRuta.objects.create(empresa=self.empresa, sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                 costo=3)
+        propuestas = PropuestaTraslado.objects.generar(self.empresa)
+        envios = {(propuesta.sucursal_origen_id, propuesta.cantidad) for propuesta in propuestas}
+        self.assertEqual(envios, {(self.norte.pk, 2), (self.bodega.pk, 5)})
+
+        documentos, errores = PropuestaTraslado.objects.aceptar(PropuestaTraslado.objects.all())
+        self.assertEqual((len(documentos), errores), (2, []))
+        self.assertFalse(PropuestaTraslado.objects.filter(estado='pendiente').exists())
+        self.assertEqual(Inventario.objects.get(sucursal=self.bodega, producto=self.producto).cantidad, 15)
+        # Lo que viene en camino ya cubre el faltante
+        self.assertEqual(PropuestaTraslado.objects.generar(self.empresa), [])
+
+
+class StockEnTransitoTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='otros', cantidad=30)
+
+    def en_transito(self):
+        ruta = StockEnTransito.objects.filter(sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                              producto=self.producto).values_list('cantidad', flat=True).first()
+        return ruta or 0, Inventario.objects.get(sucursal=self.local, producto=self.producto).en_transito
+
+    def test_traslados_suman_y_confirmacion_resta(self):
+        traslados = [Traslado.objects.create(producto=self.producto, sucursal_origen=self.bodega,
+                                             sucursal_destino=self.local, cantidad_entregada=cantidad)
+                     for cantidad in (4, 6)]
+        self.assertEqual(self.en_transito(), (10, 10))
+
+        traslados[0].cantidad_recibida = 4
+        traslados[0].confirmar()
+        self.assertEqual(self.en_transito(), (6, 6))
+        documento = TrasladoDocumento(sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                      tipo_documento='guia_remision', documento_respaldo='GR-1')
+        documento.despachar([(self.producto, 5)])
+        self.assertEqual(self.en_transito(), (11, 11))
+
+        # Lo no recibido también deja de estar en tránsito
+        documento.confirmar({linea.pk: 3 for linea in documento.lineas.all()})
+        traslados[1].cantidad_recibida = 6
+        traslados[1].confirmar()
+        self.assertEqual(self.en_transito(), (0, 0))
+        self.assertFalse(StockEnTransito.objects.exists())
+
+    def test_verificar_detecta_y_corrige_desvios(self):
+        Traslado.objects.create(producto=self.producto, sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                cantidad_entregada=7)
+        self.assertEqual(StockEnTransito.objects.verificar(self.empresa), [])
+
+        StockEnTransito.objects.update(cantidad=2)
+        Inventario.objects.filter(sucursal=self.local).update(en_transito=0)
+        diferencias = StockEnTransito.objects.verificar(self.empresa, corregir=True)
+        self.assertEqual(diferencias, [
+            ('ruta', self.bodega.pk, self.local.pk, self.producto.pk, 2, 7),
+            ('destino', None, self.local.pk, self.producto.pk, 0, 7),
+        ])
+        self.assertEqual(self.en_transito(), (7, 7))
+
+    def test_stock_traslado_devuelve_disponible_y_en_transito(self):
+        Traslado.objects.create(producto=self.producto, sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                cantidad_entregada=5)
+        self.client.force_login(crear_usuario(self.empresa))
+        respuesta = self.client.get(reverse('stock_traslado'), {
+            'producto': self.producto.pk, 'sucursal_origen': self.bodega.pk, 'sucursal_destino': self.local.pk,
+        })
+        datos = respuesta.json()
+        self.assertEqual(datos['sucursal_origen'], {'disponible': 25, 'en_transito': 0, 'total': 25})
+        self.assertEqual(datos['sucursal_destino'], {'disponible': 0, 'en_transito': 5, 'total': 5})
+        self.assertEqual(datos['en_transito_ruta'], 5)
+        self.assertEqual(self.client.get(reverse('stock_traslado'), {'producto': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('stock_traslado'), {'producto': 999999}).status_code, 404)
+
+
+class EventoStockTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+
+    def eventos(self, despues=0):
+        return [(evento['sucursal_id'], evento['delta'], evento['saldo'])
+                for evento in EventoStock.objects.leer(self.empresa, despues, margen=timedelta(0))]
+
+    def test_cada_cambio_de_stock_agrega_un_evento(self):
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='otros', cantidad=10)
+        Traslado.objects.create(producto=self.producto, sucursal_origen=self.bodega, sucursal_destino=self.local,
+                                cantidad_entregada=4)
+        MovimientoInventario.objects.registrar_lote([
+            {'sucursal': self.bodega.pk, 'producto': self.producto.pk, 'tipo_movimiento': tipo,
+             'tipo_documento': 'otros', 'cantidad': cantidad}
+            for tipo, cantidad in (('entrada', 5), ('salida', 2))
+        ], self.empresa)
+        # Una salida rechazada no deja evento
+        with self.assertRaises(ValueError):
+            MovimientoInventario.objects.create(sucursal=self.local, producto=self.producto,
+                                                tipo_movimiento='salida', tipo_documento='otros', cantidad=1)
+        inventario = Inventario.objects.get(sucursal=self.bodega, producto=self.producto)
+        inventario.cantidad = 20
+        inventario.save()
+
+        self.assertEqual(self.eventos(), [(self.bodega.pk, 10, 10), (self.bodega.pk, -4, 6), (self.bodega.pk, 3, 9),
+                                          (self.bodega.pk, 11, 20)])
+        primero = EventoStock.objects.order_by('seq').first().seq
+        self.assertEqual(len(self.eventos(despues=primero)), 3)
+        # Los eventos recientes quedan fuera hasta superar el margen de visibilidad
+        self.assertEqual(EventoStock.objects.leer(self.empresa), [])
+
+    def test_endpoint_pagina_por_cursor(self):
+        for cantidad in (1, 2, 3):
+            MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto,
+                                                tipo_movimiento='entrada', tipo_documento='otros', cantidad=cantidad)
+        EventoStock.objects.update(fecha=timezone.now() - timedelta(minutes=1))
+        self.client.force_login(crear_usuario(self.empresa))
+
+        datos = self.client.get(reverse('eventos_stock'), {'limite': 2}).json()
+        self.assertEqual([evento['saldo'] for evento in datos['eventos']], [1, 3])
+        self.assertTrue(datos['hay_mas'])
+        datos = self.client.get(reverse('eventos_stock'), {'despues': datos['ultimo_seq'], 'limite': 2}).json()
+        self.assertEqual([evento['delta'] for evento in datos['eventos']], [3])
+        self.assertFalse(datos['hay_mas'])
+
+
+class NotificacionesTrasladoTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        MovimientoInventario.objects.create(sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+                                            tipo_documento='otros', cantidad=10)
+
+    def test_broker_despierta_la_espera_desde_otro_hilo(self):
+        memoria = BrokerMemoria()
+
+        async def esperar():
+            publicador = threading.Timer(0.05, memoria.publicar, ({'sucursal:2'}, {'tipo': 'creado'}))
+            publicador.start()
+            return await memoria.esperar({'sucursal:1', 'sucursal:2'}, 0, espera=5)
+
+        self.assertEqual(asyncio.run(esperar()), [{'tipo': 'creado', 'id': 1}])
+        # Un aviso para otro canal no corta la espera
+        memoria.publicar({'sucursal:3'}, {'tipo': 'creado'})
+        self.assertEqual(asyncio.run(memoria.esperar({'sucursal:1'}, 1, espera=0.05)), [])
+
+    def test_broker_base_datos_compartido_entre_procesos(self):
+        # Cada instancia representa otro proceso: los ids y los avisos salen de la misma tabla
+        publicador, lector = BrokerBaseDatos(), BrokerBaseDatos()
+        ultimo = lector.ultimo
+        publicador.publicar({'sucursal:1', 'empresa:1'}, {'tipo': 'creado'})
+        publicador.publicar({'sucursal:3'}, {'tipo': 'creado'})
+        avisos = lector.avisos({'sucursal:1'}, ultimo)
+        self.assertEqual([aviso['tipo'] for aviso in avisos], ['creado'])
+        self.assertGreater(avisos[0]['id'], ultimo)
+        self.assertEqual(publicador.ultimo, lector.ultimo)
+        self.assertIsInstance(obtener_broker(), BrokerBaseDatos)
+
+    def test_long_poll_avisa_traslados_de_la_sucursal(self):
+        usuario = crear_usuario(self.empresa, grupos=('Encargado',))
+        usuario.perfil.sucursal = self.local
+        usuario.perfil.save()
+        self.client.force_login(usuario)
+        url = reverse('notificaciones_traslados')
+
+        datos = self.client.get(url).json()
+        self.assertEqual((datos['eventos'], datos['pendientes']), ([], 0))
+        # Sin avisos nuevos no se recalcula el conteo de pendientes
+        self.assertNotIn('pendientes', self.client.get(url, {'ultimo': datos['ultimo']}).json())
+        with self.captureOnCommitCallbacks(execute=True):
+            traslado = Traslado.objects.create(producto=self.producto, sucursal_origen=self.bodega,
+                                               sucursal_destino=self.local, cantidad_entregada=4)
+        # Un aviso a otra sucursal no llega a este usuario
+        obtener_broker().publicar({canal_sucursal(self.bodega.pk)}, {'tipo': 'confirmado'})
+
+        datos = self.client.get(url, {'ultimo': datos['ultimo']}).json()
+        self.assertEqual([(aviso['tipo'], aviso['traslado']) for aviso in datos['eventos']], [('creado', traslado.pk)])
+        self.assertEqual(datos['pendientes'], 1)
+
+        traslado.cantidad_recibida = 4
+        with self.captureOnCommitCallbacks(execute=True):
+            traslado.confirmar()
+        datos = self.client.get(url, {'ultimo': datos['ultimo']}).json()
+        self.assertEqual([aviso['tipo'] for aviso in datos['eventos']], ['confirmado'])
+        self.assertEqual(datos['pendientes'], 0)
+
+    def test_long_poll_solo_con_asgi(self):
+        usuario = crear_usuario(self.empresa, grupos=('Encargado',))
+        usuario.perfil.sucursal = self.local
+        usuario.perfil.save()
+        self.client.force_login(usuario)
+        # El cliente de pruebas usa WSGI: la página no incluye la espera de avisos
+        self.assertNotContains(self.client.get(reverse('traslados_pendientes')), reverse('notificaciones_traslados'))
+
+
+@unittest.skipIf(connection.vendor == 'sqlite', 'SQLite serializa las escrituras; la prueba requiere MySQL.')
+class MovimientoInventarioConcurrenciaTests(TransactionTestCase):
+    """
+    Prueba de carga: varios hilos registran entradas y salidas del mismo producto a la vez y
+    al final el stock debe coincidir con la suma de los movimientos registrados.
+    """
+    HILOS = 8
+    MOVIMIENTOS_POR_HILO = 250
+
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        MovimientoInventario.objects.create(
+            sucursal=self.bodega, producto=self.producto, tipo_movimiento='entrada',
+            tipo_documento='otros', cantidad=100
+        )
+
+    def trabajador(self, semilla, resultados):
+        aleatorio = random.Random(semilla)
+        aplicados = rechazados = 0
+        try:
+            for _ in range(self.MOVIMIENTOS_POR_HILO):
+                tipo = aleatorio.choice(['entrada', 'salida', 'salida'])
+                try:
+                    MovimientoInventario.objects.create(
+                        sucursal=self.bodega, producto=self.producto, tipo_movimiento=tipo,
+                        tipo_documento='nota_venta', cantidad=aleatorio.randint(1, 5)
+                    )
+                    aplicados += 1
+                except ValueError:
+                    rechazados += 1
+        finally:
+            connection.close()
+        resultados.append((aplicados, rechazados))
+
+    def test_stock_coincide_con_movimientos_bajo_concurrencia(self):
+        resultados = []
+        hilos = [threading.Thread(target=self.trabajador, args=(semilla, resultados)) for semilla in range(self.HILOS)]
+
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        aplicados = sum(r[0] for r in resultados)
+        rechazados = sum(r[1] for r in resultados)
+        self.assertEqual(aplicados + rechazados, self.HILOS * self.MOVIMIENTOS_POR_HILO)
+
+        inventario = Inventario.objects.get(sucursal=self.bodega, producto=self.producto)
+        self.assertGreaterEqual(inventario.cantidad, 0)
+        self.assertEqual(inventario.cantidad, saldo_segun_movimientos(self.bodega, self.producto))
+        self.assertEqual(MovimientoInventario.objects.count(), aplicados + 1)
+
+        sys.stderr.write(
+            f'\n{aplicados + rechazados} movimientos en {duracion:.2f}s '
+            f'({(aplicados + rechazados) / duracion:.0f} movimientos/s, {rechazados} rechazados por stock)\n'
+        )
@@ -3,10 +3,21 @@ from inventario import views
 
 urlpatterns = [
     path('movimiento_inventario/', views.movimiento_inventario, name='movimiento_inventario'),
+    path('movimiento_inventario/lote/', views.registrar_movimientos_lote, name='registrar_movimientos_lote'),
     path('traslado/iniciar/', views.iniciar_traslado, name='iniciar_traslado'),
+    path('traslado/stock/', views.stock_traslado, name='stock_traslado'),
+    path('traslado/notificaciones/', views.notificaciones_traslados, name='notificaciones_traslados'),
+    path('traslado/documento/iniciar/', views.iniciar_traslado_documento, name='iniciar_traslado_documento'),
+    path('traslado/documento/confirmar/<int:pk>/', views.confirmar_traslado_documento, name='confirmar_traslado_documento'),
+    path('traslado/propuestas/', views.propuestas_traslado, name='propuestas_traslado'),
     path('traslados_pendientes/', views.traslados_pendientes, name='traslados_pendientes'),
     path('traslado/confirmar/<int:pk>/', views.confirmar_traslado, name='confirmar_traslado'),
     path('producto_movimientos/', views.movimientos_por_producto, name='movimientos_por_producto'),
     path('empresa_movimientos/', views.movimientos_por_empresa, name='movimientos_por_empresa'),
     path('sucursal_movimientos/', views.movimientos_por_sucursal, name='movimientos_por_sucursal'),
+    path('movimientos/datos/', views.movimientos_datatable, name='movimientos_datatable'),
+    path('movimientos/exportar/<str:formato>/', views.exportar_movimientos, name='exportar_movimientos'),
+    path('traslados/datos/', views.traslados_datatable, name='traslados_datatable'),
+    path('stock_a_fecha/', views.stock_a_fecha, name='stock_a_fecha'),
+    path('eventos_stock/', views.eventos_stock, name='eventos_stock'),
 ]
@@ -1,16 +1,41 @@
+import csv
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
 from django.db import models
+from django.db.models import Count, Q
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib import messages
+from django.utils import timezone
+from openpyxl import Workbook
 from productos.models import Producto
+from usuarios.cache import contar_cacheado
+from usuarios.idempotencia import idempotente
 from usuarios.models import Sucursal
+from usuarios.paginacion import paginar_por_cursor
 from usuarios.views import obtener_empresa
 from usuarios.templatetags.tags import control_acceso
-from .models import MovimientoInventario, Traslado
+from .models import EventoStock, Inventario, MovimientoInventario, Traslado, TrasladoDocumento, InventarioSnapshot, \
+    MovimientoInventarioArchivado, MovimientoMensual, PropuestaTraslado, StockEnTransito, resumen_producto
+from .notificaciones import canal_empresa, canal_sucursal, obtener_broker, servido_por_asgi
 from .forms import MovimientoInventarioForm, ProductoSelectForm, SucursalSelectForm, TrasladoForm, \
-    ConfirmarRecepcionForm
+    ConfirmarRecepcionForm, MovimientoLoteLineaForm, TrasladoDocumentoForm, TrasladoLineaFormSet, \
+    ConfirmarDocumentoForm
+
+# Máximo de eventos por llamada a eventos_stock
+LIMITE_EVENTOS_STOCK = 5000
+
+# Segundos que notificaciones_traslados espera un aviso antes de responder sin novedades
+ESPERA_NOTIFICACIONES = 25
 
 
 @control_acceso('Encargado')
+@idempotente
 def movimiento_inventario(request):
     empresa_actual = obtener_empresa(request)
 
@@ -34,7 +59,7 @@ def movimiento_inventario(request):
         form = MovimientoInventarioForm(user=request.user)
 
     # Mostrar solo los últimos 10 movimientos de la empresa del usuario logueado
-    movimientos = MovimientoInventario.objects.filter(producto__empresa=empresa_actual).order_by('-fecha')[:20]
+    movimientos = MovimientoInventario.objects.filter(empresa=empresa_actual).order_by('-fecha')[:20]
 
     return render(request, 'movimiento_inventario.html', {
         'form': form,
@@ -42,7 +67,58 @@ def movimiento_inventario(request):
     })
 
 
+@require_POST
+@control_acceso('Encargado')
+@idempotente
+def registrar_movimientos_lote(request):
+    """
+    Registra un lote de movimientos enviado como JSON:
+    {"todo_o_nada": false, "lineas": [{"sucursal": 1, "producto": 2, "tipo_movimiento": "salida", ...}]}
+
+    Devuelve los errores por línea; con todo_o_nada, cualquier error descarta el lote completo.
+    """
+    empresa_actual = obtener_empresa(request)
+    sucursal_usuario = getattr(request.user.perfil, 'sucursal', None)
+
+    try:
+        payload = json.loads(request.body)
+        lineas = payload['lineas']
+        todo_o_nada = bool(payload.get('todo_o_nada', False))
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'El cuerpo debe ser un JSON con la lista "lineas".'}, status=400)
+
+    if not isinstance(lineas, list) or not lineas:
+        return JsonResponse({'error': 'El lote no contiene líneas.'}, status=400)
+
+    errores = {}
+    validas = []
+    for indice, linea in enumerate(lineas):
+        form = MovimientoLoteLineaForm(linea if isinstance(linea, dict) else {})
+        if not form.is_valid():
+            errores[indice] = [error for lista in form.errors.values() for error in lista]
+        elif sucursal_usuario and form.cleaned_data['sucursal'] != sucursal_usuario.pk:
+            errores[indice] = ['Solo puede registrar movimientos en su sucursal.']
+        else:
+            validas.append((indice, form.cleaned_data))
+
+    movimientos = []
+    if validas and not (errores and todo_o_nada):
+        movimientos, rechazadas = MovimientoInventario.objects.registrar_lote(
+            [linea for _, linea in validas], empresa_actual, usuario=request.user, todo_o_nada=todo_o_nada
+        )
+        for posicion, mensaje in rechazadas:
+            errores.setdefault(validas[posicion][0], []).append(mensaje)
+
+    respuesta = {
+        'lote': str(movimientos[0].lote) if movimientos else None,
+        'registrados': len(movimientos),
+        'errores': [{'linea': indice, 'errores': errores[indice]} for indice in sorted(errores)],
+    }
+    return JsonResponse(respuesta, status=400 if errores and not movimientos else 200)
+
+
 @control_acceso('Encargado')
+@idempotente
 def iniciar_traslado(request):
     empresa_actual = obtener_empresa(request)
 
@@ -74,7 +150,7 @@ def iniciar_traslado(request):
         form.fields['sucursal_destino'].queryset = Sucursal.objects.filter(empresa=empresa_actual)
 
     # Obtener los últimos 10 traslados
-    traslados_recientes = Traslado.objects.filter(producto__empresa=empresa_actual).order_by('-fecha_creacion')[:10]
+    traslados_recientes = Traslado.objects.filter(empresa=empresa_actual).order_by('-fecha_creacion')[:10]
 
     return render(request, 'iniciar_traslado.html', {
         'form': form,
@@ -83,23 +159,228 @@ def iniciar_traslado(request):
 
 
 @control_acceso('Encargado')
-def traslados_pendientes(request):
+def stock_traslado(request):
+    """
+    Devuelve en JSON el stock disponible y en tránsito del producto en las sucursales de origen y
+    destino (?producto=<id>&sucursal_origen=<id>&sucursal_destino=<id>) para el formulario de traslado.
+    """
+    empresa_actual = obtener_empresa(request)
+    producto_id = request.GET.get('producto', '')
+    if not producto_id.isdigit():
+        return JsonResponse({'error': 'Debe indicar el id numérico del producto.'}, status=400)
+    producto = get_object_or_404(Producto.objects.para_empresa(empresa_actual), pk=producto_id)
+    sucursales = [pk for pk in (request.GET.get('sucursal_origen', ''), request.GET.get('sucursal_destino', ''))
+                  if pk.isdigit()]
+    inventarios = {
+        sucursal_id: (cantidad, en_transito)
+        for sucursal_id, cantidad, en_transito in Inventario.objects.filter(
+            empresa=empresa_actual, producto=producto, sucursal_id__in=sucursales
+        ).values_list('sucursal_id', 'cantidad', 'en_transito')
+    }
+
+    datos = {'producto': producto.codigo}
+    for campo in ('sucursal_origen', 'sucursal_destino'):
+        pk = request.GET.get(campo, '')
+        if pk.isdigit():
+            cantidad, en_transito = inventarios.get(int(pk), (0, 0))
+            datos[campo] = {'disponible': cantidad, 'en_transito': en_transito, 'total': cantidad + en_transito}
+    if 'sucursal_origen' in datos and 'sucursal_destino' in datos:
+        datos['en_transito_ruta'] = StockEnTransito.objects.filter(
+            empresa=empresa_actual, producto=producto, sucursal_origen_id=request.GET['sucursal_origen'],
+            sucursal_destino_id=request.GET['sucursal_destino']
+        ).values_list('cantidad', flat=True).first() or 0
+    return JsonResponse(datos)
+
+
+@control_acceso('Encargado')
+@idempotente
+def iniciar_traslado_documento(request):
+    """
+    Registra un documento de traslado con varias líneas; todas las salidas se aplican en una transacción.
+    """
+    empresa_actual = obtener_empresa(request)
+
+    if request.method == 'POST':
+        form = TrasladoDocumentoForm(request.POST, request.FILES, empresa=empresa_actual)
+        formset = TrasladoLineaFormSet(request.POST, form_kwargs={'empresa': empresa_actual})
+
+        if form.is_valid() and formset.is_valid():
+            documento = form.save(commit=False)
+            documento.usuario = request.user
+            lineas = [(linea.cleaned_data['producto'], linea.cleaned_data['cantidad_entregada'])
+                      for linea in formset if linea.cleaned_data]
+
+            try:
+                documento.despachar(lineas)
+                messages.success(request, f'Traslado iniciado exitosamente con {len(lineas)} líneas.')
+                return redirect('traslados_pendientes')
+            except ValueError as e:
+                form.add_error(None, str(e))
+        else:
+            messages.error(request, 'Por favor, corrige los errores indicados.')
+
+    else:
+        form = TrasladoDocumentoForm(empresa=empresa_actual)
+        formset = TrasladoLineaFormSet(form_kwargs={'empresa': empresa_actual})
+
+    documentos_recientes = TrasladoDocumento.objects.filter(
+        sucursal_origen__empresa=empresa_actual
+    ).select_related('sucursal_origen', 'sucursal_destino', 'usuario').annotate(
+        total_lineas=Count('lineas')
+    ).order_by('-fecha_creacion')[:10]
+
+    return render(request, 'iniciar_traslado_documento.html', {
+        'form': form,
+        'formset': formset,
+        'documentos_recientes': documentos_recientes,
+    })
+
+
+def _traslados_pendientes_usuario(request):
+    """
+    Traslados sueltos y documentos pendientes que el usuario puede confirmar, y los canales de
+    notificaciones_traslados en los que se avisan sus cambios.
+    """
     empresa_actual = obtener_empresa(request)
     sucursal_usuario = request.user.perfil.sucursal
 
+    # Las líneas de un documento se confirman juntas desde el documento
+    movimientos_pendientes = Traslado.objects.filter(
+        empresa=empresa_actual, estado='pendiente', documento__isnull=True
+    ).order_by('-fecha_creacion')
+    documentos_pendientes = TrasladoDocumento.objects.filter(
+        sucursal_destino__empresa=empresa_actual, estado='pendiente'
+    ).select_related('sucursal_origen', 'sucursal_destino').annotate(
+        total_lineas=Count('lineas')
+    ).order_by('-fecha_creacion')
+    canales = {canal_empresa(empresa_actual.pk if empresa_actual else None)}
+
     # Verificar si el usuario pertenece al grupo "Supervisor"
-    if request.user.groups.filter(name="Supervisor").exists():
-        # Si es supervisor, mostrar todos los traslados de la empresa actual
-        movimientos_pendientes = Traslado.objects.filter(producto__empresa=empresa_actual, estado='pendiente').order_by('-fecha_creacion')
-    else:
+    if not request.user.groups.filter(name="Supervisor").exists():
         # Si no es supervisor, mostrar solo los traslados asociados al usuario actual
-        movimientos_pendientes = Traslado.objects.filter(producto__empresa=empresa_actual, sucursal_destino=sucursal_usuario, estado='pendiente').order_by('-fecha_creacion')
-    return render(request, 'traslados_pendientes.html', {'movimientos_pendientes': movimientos_pendientes})
+        movimientos_pendientes = movimientos_pendientes.filter(sucursal_destino=sucursal_usuario)
+        documentos_pendientes = documentos_pendientes.filter(sucursal_destino=sucursal_usuario)
+        canales = {canal_sucursal(sucursal_usuario.pk if sucursal_usuario else None)}
+    return movimientos_pendientes, documentos_pendientes, canales
+
+
+@control_acceso('Encargado')
+def traslados_pendientes(request):
+    movimientos_pendientes, documentos_pendientes, _ = _traslados_pendientes_usuario(request)
+    return render(request, 'traslados_pendientes.html', {
+        'movimientos_pendientes': movimientos_pendientes,
+        'documentos_pendientes': documentos_pendientes,
+    })
+
+
+def _canales_notificaciones(request):
+    """Canales del usuario, o None si no puede recibir avisos de traslados."""
+    if not request.user.is_authenticated or not request.user.groups.filter(name='Encargado').exists():
+        return None
+    return _traslados_pendientes_usuario(request)[2]
+
+
+def _contar_traslados_pendientes(request):
+    movimientos_pendientes, documentos_pendientes, _ = _traslados_pendientes_usuario(request)
+    return movimientos_pendientes.count() + documentos_pendientes.count()
+
+
+async def notificaciones_traslados(request):
+    """
+    Long-poll de avisos de traslados creados o confirmados para la sucursal del usuario.
+
+    Sin ``?ultimo=`` responde de inmediato con la posición actual y el conteo de pendientes; con
+    ``?ultimo=<id>`` espera hasta ESPERA_NOTIFICACIONES segundos a que llegue un aviso posterior y
+    recalcula el conteo solo si llegó alguno. Con WSGI responde sin esperar, para no ocupar un hilo.
+    Es una vista asíncrona: el acceso a la base de datos y la sesión pasa por ``sync_to_async``.
+    """
+    canales = await sync_to_async(_canales_notificaciones)(request)
+    if canales is None:
+        return JsonResponse({'error': 'Acceso denegado.'}, status=403)
+
+    broker = obtener_broker()
+    ultimo_publicado = await sync_to_async(lambda: broker.ultimo)()
+    avisos = []
+    try:
+        ultimo = int(request.GET['ultimo'])
+    except (KeyError, ValueError):
+        ultimo, contar = ultimo_publicado, True
+    else:
+        if ultimo > ultimo_publicado:
+            # El historial del broker se reinició y la posición del cliente ya no corresponde
+            ultimo, contar = ultimo_publicado, True
+        else:
+            if servido_por_asgi(request):
+                avisos = await broker.esperar(canales, ultimo, ESPERA_NOTIFICACIONES)
+            else:
+                avisos = await sync_to_async(broker.avisos)(canales, ultimo)
+            contar = bool(avisos)
+
+    respuesta = {'eventos': avisos, 'ultimo': avisos[-1]['id'] if avisos else ultimo}
+    if contar:
+        respuesta['pendientes'] = await sync_to_async(_contar_traslados_pendientes)(request)
+    return JsonResponse(respuesta)
+
+
+@control_acceso('Supervisor')
+@idempotente
+def propuestas_traslado(request):
+    """
+    Propuestas de rebalanceo pendientes (ver proponer_traslados); el supervisor acepta las seleccionadas,
+    que se despachan como un documento de traslado por ruta, o las descarta.
+    """
+    empresa_actual = obtener_empresa(request)
+    pendientes = PropuestaTraslado.objects.filter(empresa=empresa_actual, estado='pendiente')
+
+    if request.method == 'POST':
+        seleccionadas = pendientes.filter(pk__in=[pk for pk in request.POST.getlist('propuestas') if pk.isdigit()])
+        if request.POST.get('accion') == 'aceptar':
+            documentos, errores = PropuestaTraslado.objects.aceptar(seleccionadas, request.user)
+            if documentos:
+                messages.success(request, f'Se generaron {len(documentos)} documentos de traslado.')
+            for error in errores:
+                messages.error(request, error)
+        else:
+            total = seleccionadas.update(estado='descartada', usuario_revision=request.user,
+                                         fecha_revision=timezone.now())
+            messages.info(request, f'Se descartaron {total} propuestas.')
+        return redirect('propuestas_traslado')
+
+    return render(request, 'propuestas_traslado.html', {
+        'propuestas': pendientes.select_related('producto', 'sucursal_origen', 'sucursal_destino').order_by(
+            'sucursal_origen__nombre', 'sucursal_destino__nombre', 'producto__nombre'),
+    })
+
+
+@control_acceso('Encargado')
+@idempotente
+def confirmar_traslado_documento(request, pk):
+    documento = get_object_or_404(TrasladoDocumento, pk=pk, estado='pendiente')
+    if documento.sucursal_destino != request.user.perfil.sucursal:
+        messages.error(request, 'No tienes permiso para confirmar este traslado.')
+        return redirect('traslados_pendientes')
+
+    lineas = documento.lineas.filter(estado='pendiente').select_related('producto').order_by('pk')
+    form = ConfirmarDocumentoForm(request.POST or None, lineas=lineas)
+
+    if request.method == 'POST' and form.is_valid():
+        try:
+            documento.confirmar(form.cantidades_recibidas(), usuario=request.user)
+            messages.success(request, 'Recepción confirmada exitosamente.')
+            return redirect('traslados_pendientes')
+        except ValueError as e:
+            messages.error(request, str(e))
+
+    return render(request, 'confirmar_traslado_documento.html', {
+        'form': form,
+        'documento': documento,
+    })
 
 
 @control_acceso('Encargado')
+@idempotente
 def confirmar_traslado(request, pk):
-    movimiento = get_object_or_404(Traslado, pk=pk, estado='pendiente')
+    movimiento = get_object_or_404(Traslado, pk=pk, estado='pendiente', documento__isnull=True)
     # Obtener la sucursal del usuario logueado (suponiendo que el perfil del usuario tiene el campo sucursal)
     sucursal_usuario = request.user.perfil.sucursal
     # Validar si la sucursal de destino es la misma que la sucursal del usuario
@@ -128,19 +409,19 @@ def confirmar_traslado(request, pk):
 @control_acceso('Encargado')
 def movimientos_por_empresa(request):
     """
-    Vista para mostrar todos los movimientos y traslados de una empresa.
+    Vista para mostrar todos los movimientos y traslados de una empresa, paginados por cursor.
     """
     empresa_actual = obtener_empresa(request)
 
     # Movimientos de inventario (entradas y salidas) - filtrar por empresa del producto
-    movimientos = MovimientoInventario.objects.filter(
-        producto__empresa=empresa_actual
-    ).select_related('producto', 'sucursal', 'usuario').order_by('-fecha')
+    movimientos = paginar_por_cursor(request, MovimientoInventario.objects.filter(
+        empresa=empresa_actual
+    ).select_related('producto', 'sucursal', 'usuario'), 'fecha', 'movimientos')
 
     # Traslados (todos los traslados de productos de la empresa)
-    traslados = Traslado.objects.filter(
-        producto__empresa=empresa_actual
-    ).select_related('producto', 'sucursal_origen', 'sucursal_destino', 'usuario').order_by('-fecha_creacion')
+    traslados = paginar_por_cursor(request, Traslado.objects.filter(
+        empresa=empresa_actual
+    ).select_related('producto', 'sucursal_origen', 'sucursal_destino', 'usuario'), 'fecha_creacion', 'traslados')
 
     return render(request, 'movimientos_por_empresa.html', {
         'movimientos': movimientos,
@@ -153,6 +434,7 @@ def movimientos_por_empresa(request):
 def movimientos_por_sucursal(request):
     """
     Vista que muestra los movimientos de inventario y traslados para una sucursal específica.
+    La sucursal buscada se mantiene en la URL para que los enlaces de paginación la conserven.
     """
     # Obtener la empresa del usuario actual
     empresa_actual = obtener_empresa(request)
@@ -161,25 +443,31 @@ def movimientos_por_sucursal(request):
     form = SucursalSelectForm(empresa=empresa_actual)
     movimientos = None
     traslados = None
+    sucursal = None
 
     if request.method == 'POST':
         form = SucursalSelectForm(request.POST, empresa=empresa_actual)
+        if form.is_valid():
+            return redirect(f"{reverse('movimientos_por_sucursal')}?sucursal={form.cleaned_data['sucursal'].pk}")
+    elif 'sucursal' in request.GET:
+        form = SucursalSelectForm(request.GET, empresa=empresa_actual)
         if form.is_valid():
             sucursal = form.cleaned_data['sucursal']
 
             # Filtrar solo los movimientos de la sucursal seleccionada
-            movimientos = MovimientoInventario.objects.filter(
+            movimientos = paginar_por_cursor(request, MovimientoInventario.objects.filter(
                 sucursal=sucursal
-            ).select_related('producto', 'usuario').order_by('-fecha')
+            ).select_related('producto', 'sucursal', 'usuario'), 'fecha', 'movimientos')
 
             # Filtrar los traslados donde la sucursal seleccionada es la de origen O destino
-            from django.db.models import Q
-            traslados = Traslado.objects.filter(
+            traslados = paginar_por_cursor(request, Traslado.objects.filter(
                 Q(sucursal_origen=sucursal) | Q(sucursal_destino=sucursal)
-            ).select_related('producto', 'sucursal_origen', 'sucursal_destino', 'usuario').order_by('-fecha_creacion')
+            ).select_related('producto', 'sucursal_origen', 'sucursal_destino', 'usuario'), 'fecha_creacion',
+                'traslados')
 
     return render(request, 'movimientos_por_sucursal.html', {
         'form': form,
+        'sucursal': sucursal,
         'movimientos': movimientos,
         'traslados': traslados,
     })
@@ -193,9 +481,7 @@ def movimientos_por_producto(request):
     # Inicializar el formulario con los productos filtrados por empresa
     form = ProductoSelectForm(empresa=empresa_actual)
 
-    entradas = None
-    salidas = None
-    traslados = None
+    producto = None
     resumen = {
         'entradas': 0,
         'salidas': 0,
@@ -214,68 +500,374 @@ def movimientos_por_producto(request):
         if form.is_valid():
             producto = form.cleaned_data['producto']
 
-            # Filtrar los movimientos por tipo (entrada y salida) excluyendo aquellos relacionados a traslados
-            entradas = MovimientoInventario.objects.filter(producto=producto, tipo_movimiento='entrada') \
-                .exclude(traslado_entrada__isnull=False).select_related('usuario', 'sucursal').order_by('-fecha')
-            salidas = MovimientoInventario.objects.filter(producto=producto, tipo_movimiento='salida') \
-                .exclude(traslado_salida__isnull=False).select_related('usuario', 'sucursal').order_by('-fecha')
-
-            # Traslados del producto
-            traslados = Traslado.objects.filter(producto=producto).select_related(
-                'usuario', 'sucursal_origen', 'sucursal_destino'
-            ).order_by('-fecha_creacion')
-            
-            # Calcular totales de movimientos normales (sin traslados)
-            resumen['entradas'] = entradas.aggregate(total=models.Sum('cantidad'))['total'] or 0
-            resumen['salidas'] = salidas.aggregate(total=models.Sum('cantidad'))['total'] or 0
-            
-            # Traslados realizados (movimientos de salida por traslados)
-            resumen['traslados_salida'] = MovimientoInventario.objects.filter(
-                traslado_salida__producto=producto
-            ).aggregate(total=models.Sum('cantidad'))['total'] or 0
-            
-            # Traslados recibidos (movimientos de entrada por traslados confirmados)
-            resumen['traslados_entrada'] = MovimientoInventario.objects.filter(
-                traslado_entrada__producto=producto
-            ).aggregate(total=models.Sum('cantidad'))['total'] or 0
-            
-            # Cantidades teóricas de traslados (lo que se declaró enviar/recibir)
-            resumen['traslados_teoricos_salida'] = Traslado.objects.filter(
-                producto=producto
-            ).aggregate(total=models.Sum('cantidad_entregada'))['total'] or 0
-            
-            resumen['traslados_teoricos_entrada'] = Traslado.objects.filter(
-                producto=producto, estado='confirmado'
-            ).aggregate(total=models.Sum('cantidad_recibida'))['total'] or 0
-            
-            # Traslados pendientes de confirmar
-            resumen['traslados_pendientes'] = Traslado.objects.filter(
-                producto=producto, estado='pendiente'
-            ).aggregate(total=models.Sum('cantidad_entregada'))['total'] or 0
-            
-            resumen['traslados_confirmados'] = Traslado.objects.filter(
-                producto=producto, estado='confirmado'
-            ).aggregate(total=models.Sum('cantidad_recibida'))['total'] or 0
-            
-            # CÁLCULO CORRECTO DEL TOTAL FÍSICO:
-            # Total = Entradas normales + Traslados recibidos - Salidas normales - Traslados enviados
-            resumen['total_fisico'] = (
-                resumen['entradas'] + 
-                resumen['traslados_entrada'] - 
-                resumen['salidas'] - 
-                resumen['traslados_salida']
-            )
-            
-            # Diferencia entre lo enviado y lo recibido en traslados
-            resumen['diferencia_traslados'] = (
-                resumen['traslados_teoricos_salida'] - 
-                resumen['traslados_teoricos_entrada']
-            )
+            # Totales del producto (agregación condicional cacheada por versión de datos);
+            # los historiales se cargan por página desde movimientos_datatable y traslados_datatable
+            resumen = resumen_producto(producto)
 
     return render(request, 'movimientos_por_producto.html', {
         'form': form,
-        'entradas': entradas,
-        'salidas': salidas,
-        'traslados': traslados,
+        'producto': producto,
         'resumen': resumen,
     })
+
+
+@control_acceso('Auditor')
+def eventos_stock(request):
+    """
+    Devuelve en JSON los cambios de stock de la empresa posteriores al cursor
+    (?despues=<seq>&limite=<n>&sucursal=<id>). El consumidor guarda ``ultimo_seq`` y lo envía como
+    ``despues`` en la siguiente llamada; ``hay_mas`` indica que puede pedir otra página de inmediato.
+    """
+    empresa_actual = obtener_empresa(request)
+    try:
+        despues = int(request.GET.get('despues', 0))
+        limite = min(int(request.GET.get('limite', 1000)), LIMITE_EVENTOS_STOCK)
+        sucursal = int(request.GET['sucursal']) if request.GET.get('sucursal') else None
+    except ValueError:
+        return JsonResponse({'error': 'despues, limite y sucursal deben ser números enteros.'}, status=400)
+
+    eventos = EventoStock.objects.leer(empresa_actual, despues, limite, sucursal=sucursal)
+    return JsonResponse({
+        'eventos': [
+            {'seq': evento['seq'], 'sucursal': evento['sucursal_id'], 'producto': evento['producto_id'],
+             'delta': evento['delta'], 'saldo': evento['saldo'], 'fecha': evento['fecha'].isoformat()}
+            for evento in eventos
+        ],
+        'ultimo_seq': eventos[-1]['seq'] if eventos else despues,
+        'hay_mas': len(eventos) == limite,
+    })
+
+
+@control_acceso('Auditor')
+def stock_a_fecha(request):
+    """
+    Devuelve en JSON el stock por sucursal de un producto al cierre del día indicado
+    (?producto=<id>&fecha=YYYY-MM-DD), partiendo del snapshot más cercano.
+    """
+    empresa_actual = obtener_empresa(request)
+    producto_id = request.GET.get('producto', '')
+    if not producto_id.isdigit():
+        return JsonResponse({'error': 'Debe indicar el id numérico del producto.'}, status=400)
+    producto = get_object_or_404(Producto.objects.para_empresa(empresa_actual), pk=producto_id)
+
+    try:
+        dia = datetime.strptime(request.GET.get('fecha', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'La fecha debe tener el formato YYYY-MM-DD.'}, status=400)
+
+    fin_dia = timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+    saldos = InventarioSnapshot.objects.stock_a_fecha(producto, fin_dia)
+    sucursales = dict(Sucursal.objects.filter(pk__in=saldos).values_list('pk', 'nombre'))
+
+    return JsonResponse({
+        'producto': producto.codigo,
+        'fecha': dia.isoformat(),
+        'total': sum(saldos.values()),
+        'sucursales': [
+            {'sucursal_id': sucursal_id, 'sucursal': sucursales[sucursal_id], 'cantidad': cantidad}
+            for sucursal_id, cantidad in sorted(saldos.items())
+        ],
+    })
+
+
+def _parametros_datatable(request, ordenables, orden_defecto):
+    """
+    Lee los parámetros del protocolo server-side de DataTables (draw/start/length/search/order).
+    El orden se toma del nombre de la columna (``columns[i][data]``) y solo si está en ``ordenables``.
+    """
+    try:
+        draw = int(request.GET.get('draw', 1))
+        start = max(int(request.GET.get('start', 0)), 0)
+        length = int(request.GET.get('length', 25))
+    except ValueError:
+        draw, start, length = 1, 0, 25
+    # Nunca se entrega el historial completo de una vez ("Todos" = -1)
+    length = min(length, 500) if length > 0 else 500
+
+    orden = [orden_defecto, '-id']
+    columna = request.GET.get(f"columns[{request.GET.get('order[0][column]', '')}][data]")
+    if columna in ordenables:
+        prefijo = '-' if request.GET.get('order[0][dir]') == 'desc' else ''
+        orden = [prefijo + ordenables[columna], prefijo + 'id']
+
+    return {
+        'draw': draw,
+        'start': start,
+        'length': length,
+        'search': request.GET.get('search[value]', '').strip(),
+        'orden': orden,
+    }
+
+
+def _filtrar_por_fechas(queryset, campo, params):
+    """Filtra por ``fecha_desde``/``fecha_hasta`` (YYYY-MM-DD, inclusive, en hora local)."""
+    for parametro, dias, operador in (('fecha_desde', 0, 'gte'), ('fecha_hasta', 1, 'lt')):
+        try:
+            dia = datetime.strptime(params.get(parametro, ''), '%Y-%m-%d').date()
+        except ValueError:
+            continue
+        limite = timezone.make_aware(datetime.combine(dia + timedelta(days=dias), time.min))
+        queryset = queryset.filter(**{f'{campo}__{operador}': limite})
+    return queryset
+
+
+def _filtrar_movimientos(movimientos, params):
+    """
+    Aplica los filtros del historial de movimientos: fecha_desde, fecha_hasta, tipo_movimiento,
+    tipo_documento, sucursal, usuario, producto y sin_traslados=1.
+    """
+    movimientos = _filtrar_por_fechas(movimientos, 'fecha', params)
+    for parametro in ('tipo_movimiento', 'tipo_documento'):
+        if params.get(parametro):
+            movimientos = movimientos.filter(**{parametro: params[parametro]})
+    for parametro in ('sucursal', 'usuario', 'producto'):
+        if params.get(parametro, '').isdigit():
+            movimientos = movimientos.filter(**{f'{parametro}_id': params[parametro]})
+    if params.get('sin_traslados') == '1':
+        movimientos = movimientos.filter(traslado_entrada__isnull=True, traslado_salida__isnull=True)
+    return movimientos
+
+
+def _historial_movimientos(empresa, params):
+    """
+    Movimientos de la empresa con los filtros de ``_filtrar_movimientos``. Retorna la tabla activa y,
+    solo si ``fecha_desde`` llega a meses ya archivados, también el archivo.
+    """
+    modelos = [MovimientoInventario]
+    try:
+        desde = datetime.strptime(params.get('fecha_desde', ''), '%Y-%m-%d')
+    except ValueError:
+        desde = None
+    if desde:
+        limite = MovimientoMensual.objects.limite_archivo(empresa)
+        if limite and timezone.make_aware(desde) < limite:
+            modelos.append(MovimientoInventarioArchivado)
+    return [_filtrar_movimientos(modelo.objects.filter(empresa=empresa), params) for modelo in modelos]
+
+
+def _unir(consultas, *campos):
+    """Une los querysets (tabla activa y archivo) en una sola consulta de ``values()``."""
+    primera, *resto = [consulta.values(*campos) for consulta in consultas]
+    return primera.union(*resto, all=True) if resto else primera
+
+
+def _datatable_vacio(params):
+    """Respuesta de DataTables sin filas, para usuarios sin empresa asignada."""
+    return JsonResponse({'draw': params['draw'], 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []})
+
+
+def _nombre_usuario(fila, prefijo='usuario'):
+    nombre = f"{fila[f'{prefijo}__first_name'] or ''} {fila[f'{prefijo}__last_name'] or ''}".strip()
+    return nombre or fila[f'{prefijo}__username'] or 'Sin usuario'
+
+
+@control_acceso('Encargado')
+def movimientos_datatable(request):
+    """
+    Historial de movimientos de la empresa para DataTables en modo server-side.
+
+    Filtros por query string: los de ``_filtrar_movimientos``. Solo se consulta la página visible
+    y los conteos se cachean hasta el siguiente movimiento.
+    """
+    empresa_actual = obtener_empresa(request)
+    params = _parametros_datatable(request, {
+        'fecha': 'fecha',
+        'producto_codigo': 'producto__codigo',
+        'producto_nombre': 'producto__nombre',
+        'sucursal': 'sucursal__nombre',
+        'cantidad': 'cantidad',
+        'tipo_movimiento': 'tipo_movimiento',
+        'tipo_documento': 'tipo_documento',
+        'usuario': 'usuario__first_name',
+    }, '-fecha')
+    if empresa_actual is None:
+        return _datatable_vacio(params)
+
+    consultas = _historial_movimientos(empresa_actual, request.GET)
+    # El total cuenta las mismas tablas que el filtrado, así que incluye el archivo solo si se consulta
+    total = sum(contar_cacheado(movimientos.model.objects.filter(empresa=empresa_actual), 'empresa', empresa_actual.pk)
+                for movimientos in consultas)
+    if params['search']:
+        consultas = [movimientos.filter(
+            Q(producto__codigo__icontains=params['search']) |
+            Q(producto__nombre__icontains=params['search']) |
+            Q(comentario__icontains=params['search']) |
+            Q(documento_respaldo__icontains=params['search'])
+        ) for movimientos in consultas]
+    filtrados = sum(contar_cacheado(movimientos, 'empresa', empresa_actual.pk) for movimientos in consultas)
+
+    tipos_movimiento = dict(MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+    tipos_documento = dict(MovimientoInventario.TIPO_DOCUMENTO_CHOICES)
+    filas = _unir(
+        consultas, 'id', 'fecha', 'producto__codigo', 'producto__nombre', 'sucursal__nombre', 'cantidad',
+        'tipo_movimiento', 'tipo_documento', 'documento_respaldo', 'comentario',
+        'usuario__first_name', 'usuario__last_name', 'usuario__username',
+    ).order_by(*params['orden'])[params['start']:params['start'] + params['length']]
+
+    return JsonResponse({
+        'draw': params['draw'],
+        'recordsTotal': total,
+        'recordsFiltered': filtrados,
+        'data': [{
+            'id': fila['id'],
+            'fecha': timezone.localtime(fila['fecha']).strftime('%d/%m/%Y %H:%M'),
+            'producto_codigo': fila['producto__codigo'],
+            'producto_nombre': fila['producto__nombre'],
+            'sucursal': fila['sucursal__nombre'],
+            'cantidad': fila['cantidad'],
+            'tipo_movimiento': fila['tipo_movimiento'],
+            'tipo_movimiento_display': tipos_movimiento.get(fila['tipo_movimiento'], fila['tipo_movimiento']),
+            'tipo_documento': fila['tipo_documento'],
+            'tipo_documento_display': tipos_documento.get(fila['tipo_documento'], fila['tipo_documento']),
+            'documento_respaldo': fila['documento_respaldo'] or '',
+            'comentario': fila['comentario'] or '',
+            'usuario': _nombre_usuario(fila),
+        } for fila in filas],
+    })
+
+
+@control_acceso('Encargado')
+def traslados_datatable(request):
+    """
+    Historial de traslados de la empresa para DataTables en modo server-side.
+
+    Filtros por query string: fecha_desde, fecha_hasta, estado, tipo_documento, sucursal (origen o
+    destino), usuario y producto.
+    """
+    empresa_actual = obtener_empresa(request)
+    params = _parametros_datatable(request, {
+        'fecha_creacion': 'fecha_creacion',
+        'producto_codigo': 'producto__codigo',
+        'producto_nombre': 'producto__nombre',
+        'sucursal_origen': 'sucursal_origen__nombre',
+        'sucursal_destino': 'sucursal_destino__nombre',
+        'cantidad_entregada': 'cantidad_entregada',
+        'cantidad_recibida': 'cantidad_recibida',
+        'estado': 'estado',
+        'usuario': 'usuario__first_name',
+    }, '-fecha_creacion')
+    if empresa_actual is None:
+        return _datatable_vacio(params)
+
+    traslados = Traslado.objects.filter(empresa=empresa_actual)
+    total = contar_cacheado(traslados, 'empresa', empresa_actual.pk)
+
+    traslados = _filtrar_por_fechas(traslados, 'fecha_creacion', request.GET)
+    for parametro in ('estado', 'tipo_documento'):
+        if request.GET.get(parametro):
+            traslados = traslados.filter(**{parametro: request.GET[parametro]})
+    for parametro in ('usuario', 'producto'):
+        if request.GET.get(parametro, '').isdigit():
+            traslados = traslados.filter(**{f'{parametro}_id': request.GET[parametro]})
+    if request.GET.get('sucursal', '').isdigit():
+        traslados = traslados.filter(
+            Q(sucursal_origen_id=request.GET['sucursal']) | Q(sucursal_destino_id=request.GET['sucursal'])
+        )
+    if params['search']:
+        traslados = traslados.filter(
+            Q(producto__codigo__icontains=params['search']) |
+            Q(producto__nombre__icontains=params['search']) |
+            Q(documento_respaldo__icontains=params['search'])
+        )
+    filtrados = contar_cacheado(traslados, 'empresa', empresa_actual.pk)
+
+    estados = dict(Traslado.ESTADO_CHOICES)
+    filas = traslados.order_by(*params['orden']).values(
+        'id', 'fecha_creacion', 'producto__codigo', 'producto__nombre', 'sucursal_origen__nombre',
+        'sucursal_destino__nombre', 'cantidad_entregada', 'cantidad_recibida', 'estado',
+        'usuario__first_name', 'usuario__last_name', 'usuario__username',
+    )[params['start']:params['start'] + params['length']]
+
+    return JsonResponse({
+        'draw': params['draw'],
+        'recordsTotal': total,
+        'recordsFiltered': filtrados,
+        'data': [{
+            'id': fila['id'],
+            'fecha_creacion': timezone.localtime(fila['fecha_creacion']).strftime('%d/%m/%Y %H:%M'),
+            'producto_codigo': fila['producto__codigo'],
+            'producto_nombre': fila['producto__nombre'],
+            'sucursal_origen': fila['sucursal_origen__nombre'],
+            'sucursal_destino': fila['sucursal_destino__nombre'],
+            'cantidad_entregada': fila['cantidad_entregada'],
+            'cantidad_recibida': fila['cantidad_recibida'],
+            'estado': fila['estado'],
+            'estado_display': estados.get(fila['estado'], fila['estado']),
+            'usuario': _nombre_usuario(fila),
+        } for fila in filas],
+    })
+
+
+class _Eco:
+    """Buffer mínimo para csv.writer: devuelve la línea escrita en lugar de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+@control_acceso('Auditor')
+def exportar_movimientos(request, formato):
+    """
+    Exporta el historial de movimientos de la empresa en CSV o XLSX con los filtros de ``_filtrar_movimientos``.
+
+    Las filas se leen con ``iterator()`` por bloques, así que la memoria del worker no depende del
+    tamaño del historial. El CSV se envía a medida que se genera; el XLSX se arma con el libro
+    write-only de openpyxl en un archivo temporal (un .xlsx es un zip y no puede enviarse hasta cerrarlo).
+    """
+    if formato not in ('csv', 'xlsx'):
+        raise Http404
+
+    empresa_actual = obtener_empresa(request)
+    if empresa_actual is None:
+        # Sin empresa no hay historial que exportar (filtrar por empresa=None traería filas sin empresa)
+        raise Http404
+    movimientos = _unir(
+        _historial_movimientos(empresa_actual, request.GET),
+        'fecha', 'producto__codigo', 'producto__nombre', 'sucursal__nombre', 'tipo_movimiento', 'tipo_documento',
+        'documento_respaldo', 'cantidad', 'usuario__first_name', 'usuario__last_name', 'usuario__username',
+        'comentario', 'id',
+    ).order_by('-fecha', '-id')
+
+    encabezado = ['Fecha', 'Código', 'Producto', 'Sucursal', 'Tipo Movimiento', 'Tipo Documento',
+                  'Documento Respaldo', 'Cantidad', 'Responsable', 'Comentario']
+    tipos_movimiento = dict(MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+    tipos_documento = dict(MovimientoInventario.TIPO_DOCUMENTO_CHOICES)
+
+    def filas():
+        for fila in movimientos.iterator(chunk_size=2000):
+            responsable = f"{fila['usuario__first_name'] or ''} {fila['usuario__last_name'] or ''}".strip()
+            yield [
+                timezone.localtime(fila['fecha']).replace(tzinfo=None), fila['producto__codigo'],
+                fila['producto__nombre'], fila['sucursal__nombre'],
+                tipos_movimiento.get(fila['tipo_movimiento'], fila['tipo_movimiento']),
+                tipos_documento.get(fila['tipo_documento'], fila['tipo_documento']),
+                fila['documento_respaldo'] or '', fila['cantidad'], responsable or fila['usuario__username'] or '',
+                fila['comentario'] or '',
+            ]
+
+    nombre_archivo = f'movimientos_{empresa_actual.pk}_{timezone.localtime():%Y%m%d_%H%M}.{formato}'
+
+    if formato == 'csv':
+        writer = csv.writer(_Eco())
+
+        def lineas():
+            # BOM para que Excel reconozca el archivo como UTF-8
+            yield '\ufeff' + writer.writerow(encabezado)
+            for fila in filas():
+                fila[0] = fila[0].strftime('%d/%m/%Y %H:%M')
+                yield writer.writerow(fila)
+
+        response = StreamingHttpResponse(lineas(), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename={nombre_archivo}'
+        return response
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Movimientos')
+    ws.append(encabezado)
+    for fila in filas():
+        ws.append(fila)
+    archivo = tempfile.TemporaryFile()
+    wb.save(archivo)
+    archivo.seek(0)
+    return FileResponse(archivo, as_attachment=True, filename=nombre_archivo,
+                        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
@@ -0,0 +1,60 @@
+"""
+Sugerencias de autocompletado por prefijo para el modelo, nombre y código de los productos.
+
+Por empresa y campo se arma una lista de los valores distintos ordenada por su forma normalizada
+(mayúsculas y sin tildes), y cada prefijo se resuelve con búsqueda binaria sobre esa lista. Las
+listas viven en memoria del proceso marcadas con la versión ``catalogo:<empresa>`` de
+usuarios.cache, que se incrementa al guardar o eliminar productos (ver productos.signals); la
+primera consulta después de un cambio vuelve a armarla con una sola consulta.
+"""
+import threading
+from bisect import bisect_left
+from itertools import islice, takewhile
+
+from usuarios.cache import obtener_version
+from .models import Producto, normalizar
+
+CAMPOS_AUTOCOMPLETADO = ('modelo', 'nombre', 'codigo')
+
+SUGERENCIAS_DEFECTO = 10
+MAXIMO_SUGERENCIAS = 50
+
+
+class IndiceAutocompletado:
+    """Listas ordenadas (claves normalizadas, valores) por empresa y campo, seguras entre hilos."""
+
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._listas = {}
+
+    def _lista(self, empresa_id, campo):
+        version = obtener_version('catalogo', empresa_id)
+        with self._bloqueo:
+            version_actual, claves, valores = self._listas.get((empresa_id, campo), (None, None, None))
+        if version_actual == version:
+            return claves, valores
+
+        # Se arma fuera del bloqueo para no detener las consultas de otras empresas
+        distintos = set(Producto.objects.filter(empresa_id=empresa_id).exclude(**{f'{campo}__isnull': True})
+                        .exclude(**{campo: ''}).order_by().values_list(campo, flat=True).distinct())
+        pares = sorted((normalizar(valor), valor) for valor in distintos)
+        claves, valores = [clave for clave, _ in pares], [valor for _, valor in pares]
+        with self._bloqueo:
+            self._listas[(empresa_id, campo)] = (version, claves, valores)
+        return claves, valores
+
+    def sugerir(self, empresa_id, campo, prefijo, limite=SUGERENCIAS_DEFECTO):
+        """
+        :return: hasta ``limite`` valores del campo que empiezan con ``prefijo`` (sin distinguir
+            mayúsculas ni tildes), en orden alfabético
+        """
+        prefijo = normalizar(prefijo.strip())
+        if not prefijo:
+            return []
+        claves, valores = self._lista(empresa_id, campo)
+        inicio = bisect_left(claves, prefijo)
+        coincidencias = takewhile(lambda posicion: claves[posicion].startswith(prefijo), range(inicio, len(claves)))
+        return [valores[posicion] for posicion in islice(coincidencias, limite)]
+
+
+indice_autocompletado = IndiceAutocompletado()
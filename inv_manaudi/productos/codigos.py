@@ -0,0 +1,125 @@
+"""
+Búsqueda de productos por código escaneado (codigo, codigo_auxiliar o codigo_ean).
+
+Los datos de cada código se guardan en una caché LRU en memoria del proceso, una por empresa.
+Cada caché está marcada con la versión ``catalogo:<empresa>`` de usuarios.cache, que se incrementa
+al guardar o eliminar productos y clasificaciones (ver productos.signals); así todos los procesos
+descartan sus entradas aunque el cambio ocurra en otro. Los códigos que no están en la caché se
+resuelven juntos con una sola consulta sobre columnas indexadas.
+"""
+import threading
+from collections import OrderedDict
+
+from django.db.models import Q
+
+from usuarios.cache import obtener_version
+from .models import Producto
+
+# Códigos recordados por empresa; los menos usados se descartan primero
+CAPACIDAD_POR_EMPRESA = 5000
+
+# Campos que se comparan con el código escaneado, en orden de prioridad
+CAMPOS_CODIGO = ('codigo', 'codigo_auxiliar', 'codigo_ean')
+
+CAMPOS_DATOS = ('id', 'codigo', 'codigo_auxiliar', 'codigo_ean', 'modelo', 'nombre', 'descripcion', 'precio',
+                'tipo_producto', 'clase_id', 'clase__nombre', 'clase__subcategoria__nombre',
+                'clase__subcategoria__categoria__nombre', 'estado')
+
+
+class CacheCodigos:
+    """LRU de {código: datos del producto o None} por empresa, segura entre hilos."""
+
+    def __init__(self, capacidad=CAPACIDAD_POR_EMPRESA):
+        self.capacidad = capacidad
+        self._bloqueo = threading.Lock()
+        self._empresas = {}
+
+    def _entradas(self, empresa_id, version):
+        version_actual, entradas = self._empresas.get(empresa_id, (None, None))
+        if version_actual != version:
+            entradas = OrderedDict()
+            self._empresas[empresa_id] = (version, entradas)
+        return entradas
+
+    def obtener(self, empresa_id, version, codigos):
+        """
+        :return: tupla (diccionario de los códigos en caché, lista de los que faltan)
+        """
+        encontrados, faltantes = {}, []
+        with self._bloqueo:
+            entradas = self._entradas(empresa_id, version)
+            for codigo in codigos:
+                if codigo in entradas:
+                    entradas.move_to_end(codigo)
+                    encontrados[codigo] = entradas[codigo]
+                else:
+                    faltantes.append(codigo)
+        return encontrados, faltantes
+
+    def guardar(self, empresa_id, version, datos):
+        with self._bloqueo:
+            entradas = self._entradas(empresa_id, version)
+            entradas.update(datos)
+            while len(entradas) > self.capacidad:
+                entradas.popitem(last=False)
+
+
+cache_codigos = CacheCodigos()
+
+
+def normalizar_codigo(codigo):
+    """Los códigos se guardan en mayúsculas (Producto.save); el escaneado se compara igual."""
+    return (codigo or '').strip().upper()
+
+
+def datos_producto(fila):
+    """Diccionario JSON de un producto a partir de una fila ``values(*CAMPOS_DATOS)``."""
+    return {
+        'id': fila['id'],
+        'codigo': fila['codigo'],
+        'codigo_auxiliar': fila['codigo_auxiliar'],
+        'codigo_ean': fila['codigo_ean'],
+        'modelo': fila['modelo'],
+        'nombre': fila['nombre'],
+        'descripcion': fila['descripcion'],
+        'precio': str(fila['precio']),  # Convertir Decimal a string para JSON
+        'tipo_producto': fila['tipo_producto'],
+        'clase_id': fila['clase_id'],
+        'clase_nombre': f"{fila['clase__subcategoria__categoria__nombre']} / {fila['clase__subcategoria__nombre']} / "
+                        f"{fila['clase__nombre']}" if fila['clase_id'] else None,
+        'estado': fila['estado'],
+    }
+
+
+def buscar_codigos(empresa, codigos):
+    """
+    Resuelve códigos escaneados contra codigo, codigo_auxiliar y codigo_ean de los productos de la
+    empresa. Si un código coincide con campos de productos distintos gana el de mayor prioridad
+    (ver CAMPOS_CODIGO).
+
+    :return: diccionario {código normalizado: datos del producto, o None si no existe}
+    """
+    codigos = list(dict.fromkeys(filter(None, map(normalizar_codigo, codigos))))
+    version = obtener_version('catalogo', empresa.pk)
+    resultado, faltantes = cache_codigos.obtener(empresa.pk, version, codigos)
+    if not faltantes:
+        return resultado
+
+    por_campo = {campo: {} for campo in CAMPOS_CODIGO}
+    filas = Producto.objects.para_empresa(empresa).filter(
+        Q(codigo__in=faltantes) | Q(codigo_auxiliar__in=faltantes) | Q(codigo_ean__in=faltantes)
+    ).values(*CAMPOS_DATOS)
+    for fila in filas:
+        for campo in CAMPOS_CODIGO:
+            if fila[campo]:
+                por_campo[campo].setdefault(normalizar_codigo(fila[campo]), fila)
+
+    nuevos = {}
+    for codigo in faltantes:
+        fila = next((por_campo[campo][codigo] for campo in CAMPOS_CODIGO if codigo in por_campo[campo]), None)
+        # Los códigos inexistentes también se recuerdan hasta el próximo cambio de productos
+        nuevos[codigo] = datos_producto(fila) if fila else None
+    cache_codigos.guardar(empresa.pk, version, nuevos)
+    resultado.update(nuevos)
+    return resultado
+
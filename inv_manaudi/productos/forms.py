@@ -45,9 +45,10 @@ class ProductoForm(forms.ModelForm):
             'modelo': forms.TextInput(attrs={
                 'class': 'form-control',
                 'list': 'modelos_list',
+                'autocomplete': 'off',
                 'placeholder': 'Ingrese el modelo del producto'
             }),
-            'nombre': forms.TextInput(attrs={'class': 'form-control'}),
+            'nombre': forms.TextInput(attrs={'class': 'form-control', 'list': 'nombres_list', 'autocomplete': 'off'}),
             'descripcion': forms.Textarea(attrs={'class': 'form-control', 'rows': 1}),
             'precio': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
             'tipo_producto': forms.Select(attrs={'class': 'form-control'}),
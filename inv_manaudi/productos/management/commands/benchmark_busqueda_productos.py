@@ -0,0 +1,97 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from productos.models import Producto, TerminoProducto
+from usuarios.models import Empresa
+
+PALABRAS = ['LENTE', 'MARCO', 'ARMAZON', 'MONOFOCAL', 'BIFOCAL', 'PROGRESIVO', 'ANTIRREFLEJO', 'FOTOCROMATICO',
+            'POLICARBONATO', 'CRISTAL', 'ACETATO', 'METAL', 'TITANIO', 'NEGRO', 'DORADO', 'PLATEADO', 'AZUL',
+            'ESTUCHE', 'PANO', 'LIQUIDO', 'LIMPIADOR', 'CORDON', 'ADULTO', 'INFANTIL', 'DEPORTIVO', 'SOLAR']
+
+
+def busqueda_icontains(productos, texto):
+    """La búsqueda anterior: LIKE '%texto%' sobre las seis columnas."""
+    return productos.filter(
+        Q(codigo__icontains=texto) | Q(codigo_auxiliar__icontains=texto) | Q(codigo_ean__icontains=texto) |
+        Q(modelo__icontains=texto) | Q(nombre__icontains=texto) | Q(descripcion__icontains=texto)
+    )
+
+
+class Command(BaseCommand):
+    help = ('Compara la búsqueda con icontains y la búsqueda indexada sobre un catálogo sintético; '
+            'los datos se crean en una transacción que se revierte al terminar')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--productos',
+            type=int,
+            default=100000,
+            help='Cantidad de productos sintéticos (default: 100000)',
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Veces que se ejecuta cada consulta; se informa la mediana (default: 5)',
+        )
+        parser.add_argument(
+            '--consultas',
+            nargs='+',
+            default=['PROGRESIVO', 'lente titanio', 'P0004', 'antirr', '7801234'],
+            help='Textos a buscar',
+        )
+
+    def medir(self, consulta, repeticiones):
+        """Mediana en milisegundos de contar los resultados y leer la primera página de 10."""
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            total = consulta.count()
+            list(consulta[:10])
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return sorted(tiempos)[len(tiempos) // 2], total
+
+    def handle(self, *args, **options):
+        aleatorio = random.Random(1)
+        with transaction.atomic():
+            empresa = Empresa.objects.create(nombre='Benchmark búsqueda')
+            creados = 0
+            while creados < options['productos']:
+                bloque = Producto.objects.bulk_create([
+                    Producto(
+                        empresa=empresa,
+                        codigo=f'P{numero:07d}',
+                        codigo_auxiliar=f'AUX-{aleatorio.randrange(10 ** 6):06d}',
+                        codigo_ean=f'780{aleatorio.randrange(10 ** 10):010d}',
+                        modelo=f'M{aleatorio.randrange(500):03d}',
+                        nombre=' '.join(aleatorio.sample(PALABRAS, 3)),
+                        descripcion=' '.join(aleatorio.sample(PALABRAS, 8)),
+                        precio=Decimal('10.00'),
+                    )
+                    for numero in range(creados, min(creados + 1000, options['productos']))
+                ])
+                if not bloque[0].pk:
+                    bloque = list(Producto.objects.para_empresa(empresa).order_by('-pk')[:len(bloque)])
+                TerminoProducto.objects.indexar(bloque)
+                creados += len(bloque)
+            self.stdout.write(self.style.SUCCESS(
+                f"  [OK] {creados} productos y {TerminoProducto.objects.filter(empresa=empresa).count()} "
+                f"términos creados"))
+
+            productos = Producto.objects.para_empresa(empresa)
+            for texto in options['consultas']:
+                anterior, total_anterior = self.medir(busqueda_icontains(productos, texto).order_by('codigo'),
+                                                      options['repeticiones'])
+                indexada, total_indexada = self.medir(Producto.objects.buscar(empresa, texto),
+                                                      options['repeticiones'])
+                self.stdout.write(
+                    f"  '{texto}': icontains {anterior:.1f} ms ({total_anterior} resultados), "
+                    f"índice {indexada:.1f} ms ({total_indexada} resultados)"
+                )
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("  [OK] Datos del benchmark revertidos"))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from productos.models import Producto, TerminoProducto
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda (TerminoProducto) de los productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=1000,
+            help='Productos indexados por transacción (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.order_by('pk')
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            ultimo = total = 0
+            while True:
+                bloque = list(Producto.objects.para_empresa(empresa).filter(pk__gt=ultimo)
+                              .order_by('pk')[:options['tamano_bloque']])
+                if not bloque:
+                    break
+                TerminoProducto.objects.indexar(bloque)
+                ultimo = bloque[-1].pk
+                total += len(bloque)
+            terminos = TerminoProducto.objects.filter(empresa=empresa).count()
+            self.stdout.write(self.style.SUCCESS(
+                f"  [OK] {empresa.nombre}: {total} productos indexados, {terminos} términos"))
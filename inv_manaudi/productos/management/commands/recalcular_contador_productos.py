@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from productos.models import ContadorProductos
+from usuarios.models import Empresa
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el total de productos por empresa que usa el listado de productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empresa',
+            type=int,
+            help='ID de la empresa a procesar (default: todas)',
+        )
+
+    def handle(self, *args, **options):
+        empresas = Empresa.objects.order_by('pk')
+        if options['empresa']:
+            empresas = empresas.filter(pk=options['empresa'])
+
+        for empresa in empresas:
+            total = ContadorProductos.objects.recalcular(empresa)
+            self.stdout.write(self.style.SUCCESS(f"  [OK] {empresa.nombre}: {total} productos"))
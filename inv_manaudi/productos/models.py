@@ -1,12 +1,116 @@
-from django.db import models
+import re
+import unicodedata
+from functools import reduce
+from operator import add, or_
+
+from django.db import models, transaction
+from django.db.models import Case, F, Max, Q, When
 from categorias.models import Clase
+from usuarios.cache import incrementar_version
 from usuarios.models import Empresa
 
+# Peso de cada campo en el puntaje de búsqueda; los códigos pesan más que los textos
+PESOS_BUSQUEDA = {
+    'codigo': 8,
+    'codigo_auxiliar': 6,
+    'codigo_ean': 6,
+    'modelo': 4,
+    'nombre': 3,
+    'descripcion': 1,
+}
+CAMPOS_CODIGO = ('codigo', 'codigo_auxiliar', 'codigo_ean')
+LARGO_TERMINO = 50
+
+
+def normalizar(texto):
+    """Texto en mayúsculas y sin tildes, como se guarda en el índice de búsqueda."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(caracter for caracter in texto if not unicodedata.combining(caracter)).upper()
+
+
+def palabras(texto):
+    """Palabras alfanuméricas normalizadas del texto, recortadas al largo del índice."""
+    return [palabra[:LARGO_TERMINO] for palabra in re.findall(r'[A-Z0-9]+', normalizar(texto))]
+
+
+def rango_prefijo(prefijo):
+    """
+    Condición de "empieza con ``prefijo``" como rango [prefijo, siguiente), que usa el índice en
+    cualquier motor (SQLite no usa índices con LIKE). Los términos solo tienen [0-9A-Z], con los
+    dígitos antes que las letras tanto en binario como en las colaciones de MySQL.
+    """
+    condicion = {'gte': prefijo}
+    base = prefijo.rstrip('Z')
+    if base:
+        ultimo = base[-1]
+        condicion['lt'] = base[:-1] + ('A' if ultimo == '9' else chr(ord(ultimo) + 1))
+    return condicion
+
+
+def terminos_producto(producto):
+    """
+    Términos de búsqueda del producto con el mayor peso entre los campos en que aparece.
+    Los códigos también se indexan sin separadores, para encontrar "ABC-123" buscando "ABC123".
+
+    :return: diccionario {termino: peso}
+    """
+    terminos = {}
+    for campo, peso in PESOS_BUSQUEDA.items():
+        valor = getattr(producto, campo)
+        candidatos = palabras(valor)
+        if campo in CAMPOS_CODIGO and len(candidatos) > 1:
+            candidatos.append(''.join(candidatos)[:LARGO_TERMINO])
+        for termino in candidatos:
+            terminos[termino] = max(peso, terminos.get(termino, 0))
+    return terminos
+
+
+def invalidar_catalogo(empresa_id):
+    """
+    Invalida los datos cacheados del catálogo de la empresa (códigos escaneados, conteos del
+    listado) cuando la transacción en curso se confirma.
+    """
+    transaction.on_commit(lambda: incrementar_version('catalogo', empresa_id))
+
 
 class ProductoManager(models.Manager):
     def para_empresa(self, empresa):
         return self.filter(empresa=empresa)
 
+    def buscar(self, empresa, texto):
+        """
+        Productos de la empresa en los que cada palabra de ``texto`` es prefijo de algún término
+        indexado, ordenados por puntaje (peso del campo, doble si la palabra coincide completa).
+
+        Usa el índice (empresa, termino) de TerminoProducto en lugar de recorrer los productos
+        con LIKE '%texto%' sobre cada columna.
+
+        :return: queryset de Producto anotado con ``puntaje``
+        """
+        consulta = list(dict.fromkeys(palabras(texto)))
+        if not consulta:
+            return self.none()
+
+        prefijos = [{f'terminos__termino__{operador}': valor for operador, valor in rango_prefijo(palabra).items()}
+                    for palabra in consulta]
+        productos = self.para_empresa(empresa).filter(
+            reduce(or_, (Q(**prefijo) for prefijo in prefijos)),
+            terminos__empresa=empresa,
+        )
+        coincidencias = {
+            f'coincidencia_{indice}': Max(Case(
+                When(terminos__termino=palabra, then=F('terminos__peso') * 2),
+                When(**prefijo, then=F('terminos__peso')),
+                default=0,
+            ))
+            for indice, (palabra, prefijo) in enumerate(zip(consulta, prefijos))
+        }
+        return productos.annotate(**coincidencias).filter(
+            **{f'{alias}__gt': 0 for alias in coincidencias}
+        ).annotate(
+            puntaje=reduce(add, (F(alias) for alias in coincidencias))
+        ).order_by('-puntaje', 'codigo')
+
 
 class Producto(models.Model):
     TIPO_PRODUCTO_CHOICES = [
@@ -36,6 +140,11 @@ class Producto(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['codigo', 'empresa'], name='unique_codigo_empresa')
         ]
+        # Búsqueda por código escaneado (productos.codigos); codigo ya está cubierto por la restricción
+        indexes = [
+            models.Index(fields=['empresa', 'codigo_auxiliar']),
+            models.Index(fields=['empresa', 'codigo_ean']),
+        ]
     objects = ProductoManager()
 
     def save(self, *args, **kwargs):
@@ -50,7 +159,83 @@ class Producto(models.Model):
             self.nombre = self.nombre.upper()
         if self.descripcion:
             self.descripcion = self.descripcion.upper()
-        super(Producto, self).save(*args, **kwargs)
+        campos = kwargs.get('update_fields')
+        with transaction.atomic():
+            super(Producto, self).save(*args, **kwargs)
+            if campos is None or set(campos) & set(PESOS_BUSQUEDA):
+                TerminoProducto.objects.indexar([self])
     
     def __str__(self):
         return f'{self.codigo} - {self.nombre} ({self.get_tipo_producto_display()})'
+
+
+class TerminoProductoManager(models.Manager):
+    def indexar(self, productos):
+        """Reemplaza los términos de búsqueda de los productos por los de sus valores actuales."""
+        productos = list(productos)
+        if not productos:
+            return
+        with transaction.atomic():
+            self.filter(producto__in=[producto.pk for producto in productos]).delete()
+            self.bulk_create([
+                self.model(empresa_id=producto.empresa_id, producto_id=producto.pk, termino=termino, peso=peso)
+                for producto in productos
+                for termino, peso in terminos_producto(producto).items()
+            ], batch_size=1000)
+
+
+class TerminoProducto(models.Model):
+    """
+    Índice de búsqueda de productos: una fila por palabra normalizada de los códigos, modelo,
+    nombre y descripción de cada producto. Se mantiene en Producto.save; las cargas que no pasan
+    por save deben llamar a ``TerminoProducto.objects.indexar`` (o al comando indexar_productos).
+    """
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='terminos_producto')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='terminos')
+    termino = models.CharField(max_length=LARGO_TERMINO)
+    peso = models.PositiveSmallIntegerField()
+
+    objects = TerminoProductoManager()
+
+    class Meta:
+        unique_together = ('producto', 'termino')
+        indexes = [
+            models.Index(fields=['empresa', 'termino']),
+        ]
+
+    def __str__(self):
+        return f'{self.termino} ({self.peso}) -> {self.producto_id}'
+
+
+class ContadorProductosManager(models.Manager):
+    def total(self, empresa):
+        """Cantidad de productos de la empresa; el contador se crea contándolos la primera vez."""
+        total = self.filter(empresa=empresa).values_list('total', flat=True).first()
+        if total is None:
+            contador, _ = self.get_or_create(empresa=empresa,
+                                             defaults={'total': Producto.objects.para_empresa(empresa).count()})
+            total = contador.total
+        return total
+
+    def ajustar(self, empresa_id, delta):
+        """Suma ``delta`` al contador si existe; si no, se creará con el conteo real al leerlo."""
+        self.filter(empresa_id=empresa_id).update(total=F('total') + delta)
+
+    def recalcular(self, empresa):
+        total = Producto.objects.para_empresa(empresa).count()
+        self.update_or_create(empresa=empresa, defaults={'total': total})
+        return total
+
+
+class ContadorProductos(models.Model):
+    """
+    Total de productos por empresa, mantenido al crear y eliminar productos (productos.signals)
+    para que el listado no ejecute COUNT(*) sobre todo el catálogo en cada página.
+    """
+    empresa = models.OneToOneField(Empresa, on_delete=models.CASCADE, related_name='contador_productos')
+    total = models.IntegerField(default=0)
+
+    objects = ContadorProductosManager()
+
+    def __str__(self):
+        return f'{self.empresa}: {self.total} productos'
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+
+from categorias.models import Categoria, Clase, Subcategoria
+from .models import ContadorProductos, Producto, invalidar_catalogo
+
+# Cómo obtener la empresa de cada modelo cuyos datos forman parte de la caché del catálogo
+EMPRESA_POR_MODELO = {
+    Producto: lambda instancia: instancia.empresa_id,
+    Categoria: lambda instancia: instancia.empresa_id,
+    Subcategoria: lambda instancia: Categoria.objects.filter(pk=instancia.categoria_id)
+    .values_list('empresa_id', flat=True).first(),
+    Clase: lambda instancia: Subcategoria.objects.filter(pk=instancia.subcategoria_id)
+    .values_list('categoria__empresa_id', flat=True).first(),
+}
+
+
+def invalidar_cache_catalogo(sender, instance, **kwargs):
+    empresa_id = EMPRESA_POR_MODELO[sender](instance)
+    if empresa_id is not None:
+        invalidar_catalogo(empresa_id)
+
+
+def contar_producto_creado(sender, instance, created, **kwargs):
+    if created:
+        ContadorProductos.objects.ajustar(instance.empresa_id, 1)
+
+
+def descontar_producto_eliminado(sender, instance, **kwargs):
+    ContadorProductos.objects.ajustar(instance.empresa_id, -1)
+
+
+for modelo in EMPRESA_POR_MODELO:
+    post_save.connect(invalidar_cache_catalogo, sender=modelo)
+    post_delete.connect(invalidar_cache_catalogo, sender=modelo)
+post_save.connect(contar_producto_creado, sender=Producto)
+post_delete.connect(descontar_producto_eliminado, sender=Producto)
@@ -1,3 +1,214 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from inventario.tests import crear_datos_base, crear_usuario
+from usuarios.models import Usuario
+from usuarios.paginacion import codificar_clave
+from .autocompletado import indice_autocompletado
+from .codigos import buscar_codigos
+from .models import ContadorProductos, Producto, TerminoProducto
+
+
+class BusquedaProductoTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.lente = Producto.objects.create(codigo='LEN-2040', nombre='Lente progresivo', modelo='Visión',
+                                             descripcion='Cristal de piña', precio=Decimal('20.00'),
+                                             empresa=self.empresa)
+        self.marco = Producto.objects.create(codigo='MAR-1', nombre='Marco', descripcion='Para lente progresivo',
+                                             precio=Decimal('30.00'), empresa=self.empresa)
+
+    def codigos(self, texto):
+        return [producto.codigo for producto in Producto.objects.buscar(self.empresa, texto)]
+
+    def test_busqueda_por_prefijos_ordenada_por_relevancia(self):
+        # El nombre pesa más que la descripción; el orden de las palabras no importa
+        self.assertEqual(self.codigos('progres lente'), ['LEN-2040', 'MAR-1'])
+        self.assertEqual(self.codigos('vision pina'), ['LEN-2040'])
+        self.assertEqual(self.codigos('len2040'), ['LEN-2040'])
+        self.assertEqual(self.codigos('---'), [])
+
+        self.marco.nombre = 'Armazón'
+        self.marco.save()
+        self.assertEqual(self.codigos('marco'), [])
+        self.assertEqual(self.codigos('armazon'), ['MAR-1'])
+        self.marco.delete()
+        self.assertFalse(TerminoProducto.objects.filter(producto_id=self.marco.pk).exists())
+
+    def test_lista_productos_filtra_con_el_indice(self):
+        self.client.force_login(crear_usuario(self.empresa))
+        datos = self.client.get(reverse('lista_productos'), {
+            'draw': 1, 'search[value]': 'lente', 'order[0][column]': 0, 'order[0][dir]': 'desc',
+        }).json()
+        self.assertEqual((datos['recordsTotal'], datos['recordsFiltered']), (3, 2))
+        self.assertEqual([fila[0] for fila in datos['data']], ['MAR-1', 'LEN-2040'])
+
+
+class BusquedaCodigoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.producto.codigo_ean = '7801234567890'
+        self.producto.codigo_auxiliar = 'aux-9'
+        self.producto.save()
+        # Su código auxiliar coincide con el código principal del primero: gana el código principal
+        self.otro = Producto.objects.create(codigo='P002', codigo_auxiliar='P001', nombre='Otro',
+                                            precio=Decimal('5.00'), empresa=self.empresa)
+
+    def test_resuelve_los_tres_codigos_y_usa_la_cache(self):
+        with self.assertNumQueries(1):
+            resultado = buscar_codigos(self.empresa, ['7801234567890', ' aux-9 ', 'p001', 'NO-EXISTE'])
+        self.assertEqual({codigo: datos and datos['id'] for codigo, datos in resultado.items()}, {
+            '7801234567890': self.producto.pk, 'AUX-9': self.producto.pk, 'P001': self.producto.pk,
+            'NO-EXISTE': None,
+        })
+        with self.assertNumQueries(0):
+            buscar_codigos(self.empresa, ['P001', 'NO-EXISTE'])
+
+        # Guardar un producto invalida la caché de la empresa en todos los procesos
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(codigo='NO-EXISTE', nombre='Nuevo', precio=Decimal('1.00'), empresa=self.empresa)
+        self.assertEqual(buscar_codigos(self.empresa, ['NO-EXISTE'])['NO-EXISTE']['nombre'], 'NUEVO')
+
+    def test_endpoint_por_lote(self):
+        self.client.force_login(crear_usuario(self.empresa))
+        respuesta = self.client.post(reverse('bsq_por_codigos'), {'codigos': ['7801234567890', 'P002', 'X']},
+                                     content_type='application/json')
+        datos = respuesta.json()
+        self.assertEqual(sorted(datos['productos']), ['7801234567890', 'P002'])
+        self.assertEqual(datos['no_encontrados'], ['X'])
+        self.assertEqual(self.client.get(reverse('bsq_por_codigo'), {'codigo': 'AUX-9'}).json()['id'],
+                         self.producto.pk)
+
+
+class ConteoProductosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.client.force_login(crear_usuario(self.empresa))
+
+    def listar(self, **parametros):
+        return self.client.get(reverse('lista_productos'), dict({'draw': 1}, **parametros)).json()
+
+    def test_contador_se_mantiene_al_crear_y_eliminar(self):
+        self.assertEqual(ContadorProductos.objects.total(self.empresa), 1)
+        otro = Producto.objects.create(codigo='P002', nombre='Otro', precio=Decimal('1.00'), empresa=self.empresa)
+        self.assertEqual(ContadorProductos.objects.total(self.empresa), 2)
+        otro.delete()
+        self.assertEqual(self.listar()['recordsTotal'], 1)
+
+    def test_usuario_sin_empresa_recibe_tabla_vacia(self):
+        usuario = Usuario.objects.create_user('sin_perfil', password='clave')
+        usuario.groups.add(Group.objects.get(name='Auditor'))
+        self.client.force_login(usuario)
+        datos = self.listar(**{'search[value]': 'producto'})
+        self.assertEqual((datos['recordsTotal'], datos['recordsFiltered'], datos['data']), (0, 0, []))
+
+    def test_conteo_filtrado_cacheado_y_estimado(self):
+        Producto.objects.bulk_create([
+            Producto(codigo=f'L{numero:03d}', nombre='Lente', precio=Decimal('1.00'), empresa=self.empresa)
+            for numero in range(5)
+        ])
+        TerminoProducto.objects.indexar(Producto.objects.filter(nombre='Lente'))
+        self.assertEqual(self.listar(**{'search[value]': 'lente'})['recordsFiltered'], 5)
+        # Sin cambios en los productos la versión del catálogo es la misma y se reutiliza el conteo
+        TerminoProducto.objects.filter(producto__codigo='L000').delete()
+        self.assertEqual(self.listar(**{'search[value]': 'lente'})['recordsFiltered'], 5)
+
+        with patch('productos.views.LIMITE_CONTEO_ESTIMADO', 3):
+            datos = self.listar(**{'search[value]': 'lente', 'conteo': 'estimado'})
+        self.assertEqual((datos['recordsFiltered'], datos['recordsFilteredEstimado']), (3, True))
+
+
+class PaginacionListaProductosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        # Modelos repetidos y vacíos para que la clave de orden necesite el id como desempate
+        Producto.objects.bulk_create([
+            Producto(codigo=f'P1{numero:02d}', nombre='Otro', modelo=[None, 'A', 'B'][numero % 3],
+                     precio=Decimal('1.00'), empresa=self.empresa)
+            for numero in range(7)
+        ])
+        self.client.force_login(crear_usuario(self.empresa))
+
+    def listar(self, **parametros):
+        return self.client.get(reverse('lista_productos'), dict({'draw': 1, 'length': 3}, **parametros)).json()
+
+    def test_paginas_por_cursor_coinciden_con_offset(self):
+        orden = {'order[0][column]': 3, 'order[0][dir]': 'desc'}
+        esperado = [fila[0] for fila in self.listar(length=-1, **orden)['data']]
+        self.assertEqual(len(esperado), 8)
+
+        paginas, datos = [], self.listar(**orden)
+        while datos['data']:
+            paginas.append([fila[0] for fila in datos['data']])
+            datos = self.listar(start=3 * len(paginas), despues=datos['cursorFin'], **orden)
+        self.assertEqual(sum(paginas, []), esperado)
+
+        # Retroceder desde la última página devuelve la penúltima
+        ultima = self.listar(start=6, **orden)
+        anterior = self.listar(start=3, antes=ultima['cursorInicio'], **orden)
+        self.assertEqual([fila[0] for fila in anterior['data']], esperado[3:6])
+
+        # Un cursor de otro orden se ignora y se usa OFFSET
+        otro = self.listar(start=3, despues=ultima['cursorFin'], **{'order[0][column]': 0})
+        self.assertEqual(otro['data'][0][0], 'P102')
+
+    def test_cursor_alterado_usa_offset(self):
+        esperado = [fila[0] for fila in self.listar(start=3)['data']]
+        for clave in ([0, 'asc', 'a', 'b'], [0, 'asc', 'x', {'a': 1}], [0, 'asc', ['x'], 1], [0, 'asc', 'x', True],
+                      [6, 'asc', 'no-es-numero', 1], [6, 'asc', 'NaN', 1], [6, 'asc', '1e30', 1], [6, 'asc', None, 1]):
+            orden = {'order[0][column]': clave[0], 'order[0][dir]': clave[1]}
+            datos = self.listar(start=3, despues=codificar_clave(clave), **orden)
+            self.assertEqual(len(datos['data']), 3, clave)
+            if clave[0] == 0:
+                self.assertEqual([fila[0] for fila in datos['data']], esperado)
+        # Un precio válido como texto sí se usa como posición
+        datos = self.listar(despues=codificar_clave([6, 'asc', '1.00', 0]), **{'order[0][column]': 6})
+        self.assertEqual(len(datos['data']), 3)
+
+    def test_filas_con_valores_sin_formato(self):
+        fila = self.listar(**{'search[value]': 'producto'})['data'][0]
+        self.assertEqual(fila, ['P001', None, None, None, 'PRODUCTO', None, '10.00', 'unidad', None, 'activo',
+                                self.producto.pk])
+
+
+class AutocompletadoProductoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        for codigo, modelo in [('A1', 'Visión 20'), ('A2', 'Visión 20'), ('A3', 'Visor'), ('A4', 'Vital'), ('A5', '')]:
+            Producto.objects.create(codigo=codigo, nombre=f'Lente {codigo}', modelo=modelo, precio=Decimal('1.00'),
+                                    empresa=self.empresa)
+
+    def test_sugerencias_por_prefijo_con_invalidacion(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(indice_autocompletado.sugerir(self.empresa.pk, 'modelo', 'vis'), ['VISIÓN 20', 'VISOR'])
+        with self.assertNumQueries(0):
+            self.assertEqual(indice_autocompletado.sugerir(self.empresa.pk, 'modelo', 'vi', limite=1), ['VISIÓN 20'])
+            self.assertEqual(indice_autocompletado.sugerir(self.empresa.pk, 'modelo', 'x'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(codigo='A6', nombre='Otro', modelo='Visa', precio=Decimal('1.00'),
+                                    empresa=self.empresa)
+        self.assertEqual(indice_autocompletado.sugerir(self.empresa.pk, 'modelo', 'vis'), ['VISA', 'VISIÓN 20', 'VISOR'])
+
+    def test_endpoint(self):
+        self.client.force_login(crear_usuario(self.empresa, grupos=('Supervisor',)))
+        url = reverse('autocompletar_producto')
+        self.assertEqual(self.client.get(url, {'campo': 'nombre', 'q': 'lente a', 'limite': 2}).json(),
+                         {'sugerencias': ['LENTE A1', 'LENTE A2']})
+        self.assertEqual(self.client.get(url, {'campo': 'codigo', 'q': 'p0'}).json(), {'sugerencias': ['P001']})
+        self.assertEqual(self.client.get(url, {'campo': 'precio', 'q': '1'}).status_code, 400)
 
-# Create your tests here.
+        # Un usuario sin empresa asignada no recibe sugerencias
+        usuario = Usuario.objects.create_user('sin_perfil', password='clave')
+        usuario.groups.add(Group.objects.get(name='Supervisor'))
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get(url, {'campo': 'nombre', 'q': 'lente'}).json(), {'sugerencias': []})
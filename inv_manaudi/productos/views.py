@@ -1,14 +1,80 @@
+import json
+from decimal import Decimal, InvalidOperation
+
 from django.db import IntegrityError, DataError
-from django.db.models import Q
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from categorias.models import Subcategoria, Categoria, Clase
+from usuarios.cache import contar_cacheado
+from usuarios.paginacion import codificar_clave, decodificar_clave, filtrar_despues_de
 from usuarios.templatetags.tags import control_acceso
 from usuarios.views import obtener_empresa
-from .models import Producto
+from .autocompletado import CAMPOS_AUTOCOMPLETADO, MAXIMO_SUGERENCIAS, SUGERENCIAS_DEFECTO, indice_autocompletado
+from .codigos import buscar_codigos, normalizar_codigo
+from .models import ContadorProductos, Producto
 from .forms import ProductoForm
 
+# Máximo de códigos por llamada a bsq_por_codigos
+LIMITE_CODIGOS_LOTE = 1000
+
+# Filas que cuenta como máximo la búsqueda de lista_productos en modo estimado
+LIMITE_CONTEO_ESTIMADO = 10000
+
+# Expresión de orden de cada columna de la tabla de lista_productos. Las columnas opcionales se
+# comparan como texto vacío para que la clave (valor, id) de una fila nunca tenga NULL.
+COLUMNAS_ORDEN_PRODUCTOS = [
+    F('codigo'),
+    Coalesce('codigo_auxiliar', Value('')),
+    Coalesce('codigo_ean', Value('')),
+    Coalesce('modelo', Value('')),
+    F('nombre'),
+    Coalesce('descripcion', Value('')),
+    F('precio'),
+    F('tipo_producto'),
+    Coalesce('clase__codigo', Value('')),
+    F('estado'),
+]
+
+# Columna del precio en COLUMNAS_ORDEN_PRODUCTOS (la única numérica) y su límite según el campo
+COLUMNA_PRECIO = 6
+PRECIO_MAXIMO = Decimal(10) ** (Producto._meta.get_field('precio').max_digits
+                                - Producto._meta.get_field('precio').decimal_places)
+
+# Columnas que lee lista_productos por fila; las dos últimas forman la clave del cursor
+CAMPOS_LISTA_PRODUCTOS = ('codigo', 'codigo_auxiliar', 'codigo_ean', 'modelo', 'nombre', 'descripcion', 'precio',
+                          'tipo_producto', 'clase__subcategoria__categoria__codigo', 'clase__subcategoria__codigo',
+                          'clase__codigo', 'estado', 'pk', 'orden')
+
+
+def _posicion_cursor(clave, order_column, order_dir):
+    """
+    Valida la clave de cursor que envía el cliente: debe ser del orden pedido, con un id entero y
+    un valor del tipo de la columna (texto, o un número decimal para el precio).
+
+    :return: tupla (valor, id) para ``filtrar_despues_de``, o None si la clave no es válida
+    """
+    if not clave or len(clave) != 4 or clave[:2] != [order_column, order_dir]:
+        return None
+    valor, pk = clave[2], clave[3]
+    if type(pk) is not int:
+        return None
+    if order_column == COLUMNA_PRECIO:
+        if type(valor) not in (str, int):
+            return None
+        try:
+            valor = Decimal(str(valor))
+        except InvalidOperation:
+            return None
+        if not valor.is_finite() or abs(valor) >= PRECIO_MAXIMO:
+            return None
+    elif type(valor) is not str:
+        return None
+    return valor, pk
+
 
 @control_acceso('Supervisor')
 def crear_producto(request):
@@ -69,74 +135,83 @@ def lista_productos(request):
         order_column = int(request.GET.get('order[0][column]', 0))
         order_dir = request.GET.get('order[0][dir]', 'asc')
         
-        # Mapeo de columnas para ordenamiento
-        columns = ['codigo', 'codigo_auxiliar', 'codigo_ean', 'modelo', 'nombre', 'descripcion', 'precio', 
-                  'tipo_producto', 'clase', 'estado']
+        # Sin empresa asignada no hay productos ni contador que consultar
+        if empresa_actual is None:
+            return JsonResponse({'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0,
+                                 'recordsFilteredEstimado': False, 'data': []})
         
         # Query base
-        productos = Producto.objects.para_empresa(empresa_actual).select_related(
-            'clase__subcategoria__categoria'
-        )
+        productos = Producto.objects.para_empresa(empresa_actual)
         
-        # Total de registros sin filtrar
-        total_records = productos.count()
+        # Total de registros sin filtrar, desde el contador de la empresa
+        total_records = ContadorProductos.objects.total(empresa_actual)
+        filtered_records = total_records
+        estimado = False
         
-        # Aplicar búsqueda si existe
+        # Aplicar búsqueda si existe (índice de términos; el orden lo define la columna elegida)
         if search_value:
-            productos = productos.filter(
-                Q(codigo__icontains=search_value) |
-                Q(codigo_auxiliar__icontains=search_value) |
-                Q(codigo_ean__icontains=search_value) |
-                Q(modelo__icontains=search_value) |
-                Q(nombre__icontains=search_value) |
-                Q(descripcion__icontains=search_value)
-            )
+            encontrados = Producto.objects.buscar(empresa_actual, search_value)
+            # Conteo cacheado hasta el próximo cambio del catálogo; en modo estimado se deja de
+            # contar al superar LIMITE_CONTEO_ESTIMADO
+            limite = LIMITE_CONTEO_ESTIMADO if request.GET.get('conteo') == 'estimado' else None
+            filtered_records = contar_cacheado(encontrados, 'catalogo', empresa_actual.pk, limite=limite)
+            if limite is not None and filtered_records > limite:
+                filtered_records, estimado = limite, True
+            productos = productos.filter(pk__in=encontrados.values('pk'))
         
-        # Total de registros filtrados
-        filtered_records = productos.count()
+        # Ordenamiento por la columna elegida y el id, que desempata y hace estable la posición
+        if not 0 <= order_column < len(COLUMNAS_ORDEN_PRODUCTOS):
+            order_column = 0
+        descendente = order_dir == 'desc'
+        productos = productos.annotate(orden=COLUMNAS_ORDEN_PRODUCTOS[order_column])
+        orden, invertido = ['orden', 'pk'], ['-orden', '-pk']
+        if descendente:
+            orden, invertido = invertido, orden
         
-        # Ordenamiento
-        if order_column < len(columns):
-            order_by = columns[order_column]
-            if order_dir == 'desc':
-                order_by = '-' + order_by
-            productos = productos.order_by(order_by)
-        
-        # Paginación
-        productos = productos[start:start + length]
+        # Paginación: al avanzar o retroceder una página el cliente envía la clave de la última
+        # (despues) o primera (antes) fila que ya tiene, y la página se lee desde esa posición en
+        # lugar de saltar ``start`` filas con OFFSET. Los saltos a otras páginas usan OFFSET.
+        despues = decodificar_clave(request.GET.get('despues', ''))
+        antes = decodificar_clave(request.GET.get('antes', '')) if not despues else None
+        clave = _posicion_cursor(despues or antes, order_column, order_dir)
+        productos = productos.values_list(*CAMPOS_LISTA_PRODUCTOS)
+        if clave and despues:
+            productos = filtrar_despues_de(productos, 'orden', *clave, descendente).order_by(*orden)
+        elif clave:
+            # La página anterior se lee en orden inverso desde la primera fila actual
+            productos = filtrar_despues_de(productos, 'orden', *clave, not descendente).order_by(*invertido)
+        else:
+            productos = productos.order_by(*orden)[start:]
+        filas = list(productos[:length] if length > 0 else productos)
+        if clave and antes:
+            filas.reverse()
         
-        # Preparar datos para DataTables
-        data = []
-        for producto in productos:
-            data.append([
-                producto.codigo,
-                producto.codigo_auxiliar or '-',
-                producto.codigo_ean or '-',
-                producto.modelo or '-',
-                producto.nombre,
-                producto.descripcion or 'Sin descripción',
-                f'${producto.precio}',
-                producto.get_tipo_producto_display(),
-                f"{producto.clase.subcategoria.categoria.codigo} / {producto.clase.subcategoria.codigo} / {producto.clase.codigo}" if producto.clase else 'Sin clasificación',
-                f'<span class="badge bg-{"success" if producto.estado == "activo" else "secondary"}">{producto.get_estado_display()}</span>',
-                f'''<div class="btn-group btn-group-sm" role="group">
-                    <a href="/productos/editar/{producto.pk}/" class="btn btn-info" title="Editar">
-                        <i class="fa fa-edit"></i>
-                    </a>
-                </div>'''
-            ])
+        # Filas para DataTables con los valores crudos; el formato y el HTML los aplica la tabla
+        data = [
+            [codigo, codigo_auxiliar, codigo_ean, modelo, nombre, descripcion, str(precio), tipo_producto,
+             [categoria, subcategoria, codigo_clase] if codigo_clase else None, estado, pk]
+            for (codigo, codigo_auxiliar, codigo_ean, modelo, nombre, descripcion, precio, tipo_producto,
+                 categoria, subcategoria, codigo_clase, estado, pk, _) in filas
+        ]
         
         response = {
             'draw': draw,
             'recordsTotal': total_records,
             'recordsFiltered': filtered_records,
-            'data': data
+            'recordsFilteredEstimado': estimado,
+            'data': data,
+            'cursorInicio': codificar_clave([order_column, order_dir, filas[0][-1], filas[0][-2]]) if filas else None,
+            'cursorFin': codificar_clave([order_column, order_dir, filas[-1][-1], filas[-1][-2]]) if filas else None,
         }
         
         return JsonResponse(response)
     
     # Para la carga inicial de la página (no AJAX)
-    return render(request, 'lista_productos.html', {'empresa_actual': empresa_actual})
+    return render(request, 'lista_productos.html', {
+        'empresa_actual': empresa_actual,
+        'tipos_producto': dict(Producto.TIPO_PRODUCTO_CHOICES),
+        'estados_producto': dict(Producto.ESTADO_PRODUCTO_CHOICES),
+    })
 
 
 @control_acceso('Encargado')
@@ -148,16 +223,9 @@ def busqueda_producto(request):
     # Empezar con todos los productos de la empresa
     productos = Producto.objects.para_empresa(empresa_actual)
     
-    # Aplicar filtro de búsqueda por texto si existe
+    # Aplicar filtro de búsqueda por texto si existe, ordenado por relevancia
     if query:
-        productos = productos.filter(
-            Q(codigo__icontains=query) | 
-            Q(codigo_auxiliar__icontains=query) | 
-            Q(codigo_ean__icontains=query) | 
-            Q(modelo__icontains=query) |
-            Q(nombre__icontains=query) | 
-            Q(descripcion__icontains=query)
-        )
+        productos = Producto.objects.buscar(empresa_actual, query)
     
     # Aplicar filtro por categoría si existe
     if categoria_id:
@@ -231,33 +299,44 @@ def editar_producto(request, pk=None):
 @control_acceso('Auditor')
 def bsq_por_codigo(request):
     """
-    Vista para buscar un producto por su código y devolver sus datos en JSON.
+    Vista para buscar un producto por su código (codigo, codigo_auxiliar o codigo_ean) y devolver
+    sus datos en JSON.
     """
-    codigo = request.GET.get('codigo')
+    codigo = normalizar_codigo(request.GET.get('codigo'))
     # Obtener la empresa del usuario logueado
     empresa_actual = obtener_empresa(request)
 
-    try:
-        producto = Producto.objects.para_empresa(empresa_actual).get(codigo=codigo)
-        # Devolver todos los datos del producto en JSON
-        data = {
-            'id': producto.pk,
-            'codigo': producto.codigo,
-            'codigo_auxiliar': producto.codigo_auxiliar,
-            'codigo_ean': producto.codigo_ean,
-            'modelo': producto.modelo,
-            'nombre': producto.nombre,
-            'descripcion': producto.descripcion,
-            'precio': str(producto.precio),  # Convertir Decimal a string para JSON
-            'tipo_producto': producto.tipo_producto,
-            'clase_id': producto.clase.pk if producto.clase else None,
-            'clase_nombre': f"{producto.clase.subcategoria.categoria.nombre} / {producto.clase.subcategoria.nombre} / {producto.clase.nombre}" if producto.clase else None,
-            'estado': producto.estado
-        }
-        return JsonResponse(data)
-    except Producto.DoesNotExist:
+    data = buscar_codigos(empresa_actual, [codigo]).get(codigo)
+    if data is None:
         # Si no se encuentra el producto, devolver un error
         return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+    return JsonResponse(data)
+
+
+@require_POST
+@control_acceso('Auditor')
+def bsq_por_codigos(request):
+    """
+    Resuelve en una sola llamada un lote de códigos escaneados enviado como JSON:
+    {"codigos": ["7801234567890", "P001", ...]}
+
+    Devuelve los datos de cada código encontrado y la lista de los que no existen.
+    """
+    empresa_actual = obtener_empresa(request)
+    try:
+        codigos = json.loads(request.body)['codigos']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'El cuerpo debe ser un JSON con la lista "codigos".'}, status=400)
+    if not isinstance(codigos, list) or not all(isinstance(codigo, str) for codigo in codigos):
+        return JsonResponse({'error': '"codigos" debe ser una lista de textos.'}, status=400)
+    if len(codigos) > LIMITE_CODIGOS_LOTE:
+        return JsonResponse({'error': f'El lote no puede tener más de {LIMITE_CODIGOS_LOTE} códigos.'}, status=400)
+
+    resultado = buscar_codigos(empresa_actual, codigos)
+    return JsonResponse({
+        'productos': {codigo: datos for codigo, datos in resultado.items() if datos is not None},
+        'no_encontrados': [codigo for codigo, datos in resultado.items() if datos is None],
+    })
 
 
 @control_acceso('Manaudi')
@@ -292,19 +371,22 @@ def activar_producto(request, pk):
 
 
 @control_acceso('Supervisor')
-def obtener_modelos_unicos(request):
+def autocompletar_producto(request):
     """
-    Vista para obtener modelos únicos de productos para autocompletado.
+    Vista de autocompletado para el modelo, nombre o código de los productos: devuelve en JSON los
+    valores de la empresa que empiezan con ``q``, hasta ``limite`` (máximo MAXIMO_SUGERENCIAS), como
+    {"sugerencias": [...]}.
     """
     empresa_actual = obtener_empresa(request)
-    
-    # Obtener modelos únicos no nulos de la empresa actual
-    modelos = (Producto.objects.para_empresa(empresa_actual)
-               .exclude(modelo__isnull=True)
-               .exclude(modelo__exact='')
-               .values_list('modelo', flat=True)
-               .distinct()
-               .order_by('modelo'))
-    
-    return JsonResponse(list(modelos), safe=False)
+    campo = request.GET.get('campo', 'modelo')
+    if campo not in CAMPOS_AUTOCOMPLETADO:
+        return JsonResponse({'error': f'Campo no válido: {campo}'}, status=400)
+    if empresa_actual is None:
+        return JsonResponse({'sugerencias': []})
+    try:
+        limite = min(max(int(request.GET.get('limite', SUGERENCIAS_DEFECTO)), 1), MAXIMO_SUGERENCIAS)
+    except ValueError:
+        limite = SUGERENCIAS_DEFECTO
 
+    sugerencias = indice_autocompletado.sugerir(empresa_actual.pk, campo, request.GET.get('q', ''), limite)
+    return JsonResponse({'sugerencias': sugerencias})
@@ -1,10 +1,10 @@
 from django.db.models import Sum, F, Count, DecimalField, ExpressionWrapper
-from django.utils.timezone import now
+from django.utils.timezone import now, localtime
 from datetime import timedelta
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.http import HttpResponse
-from inventario.models import MovimientoInventario, Inventario
+from inventario.models import MovimientoInventario, Inventario, MovimientoDiario
 from productos.models import Producto, Clase
 from categorias.models import Categoria, Subcategoria
 from usuarios.models import Sucursal
@@ -23,32 +23,36 @@ def reporte_movimientos_dia(request):
     # Obtener empresa del usuario
     empresa_actual = obtener_empresa(request)
     
-    # Obtener la fecha de hoy
-    fecha = now() - timedelta(days=0)
+    # Obtener la fecha de hoy (día local de la empresa)
+    fecha = localtime(now())
     inicio_dia = fecha.replace(hour=0, minute=0, second=0, microsecond=0)
     fin_dia = fecha.replace(hour=23, minute=59, second=59, microsecond=999999)
 
-    # Filtrar los movimientos del día actual por empresa
-    movimientos = MovimientoInventario.objects.filter(
-        fecha__gte=inicio_dia, 
-        fecha__lte=fin_dia,
-        producto__empresa=empresa_actual
-    )
+    # Los resúmenes salen del acumulado diario, que crece con días x claves y no con los movimientos
+    resumen_dia = MovimientoDiario.objects.filter(empresa=empresa_actual, dia=fecha.date())
 
     # Agrupar movimientos por usuario y resumir cantidades
-    resumen_por_usuario = movimientos.values('usuario__username').annotate(
-        total_cantidad=Sum('cantidad'),
-        total_movimientos=Count('id')
-    )
+    resumen_por_usuario = resumen_dia.values('usuario__username').annotate(
+        total_cantidad=Sum(F('entradas') + F('salidas')),
+        total_movimientos=Sum(F('num_entradas') + F('num_salidas'))
+    ).order_by('usuario__username')
 
     # Agrupar movimientos por tipo y resumir cantidades
-    resumen_por_tipo = movimientos.values('tipo_movimiento').annotate(
-        total_cantidad=Sum('cantidad'),
-        total_movimientos=Count('id')
+    totales = resumen_dia.aggregate(
+        entradas=Sum('entradas'), salidas=Sum('salidas'),
+        num_entradas=Sum('num_entradas'), num_salidas=Sum('num_salidas')
     )
+    resumen_por_tipo = [
+        {'tipo_movimiento': tipo, 'total_cantidad': totales[f'{tipo}s'], 'total_movimientos': totales[f'num_{tipo}s']}
+        for tipo in ('entrada', 'salida') if totales[f'num_{tipo}s']
+    ]
 
     # Detalles completos para la tabla
-    detalles_movimientos = movimientos.select_related('producto', 'sucursal').order_by('-fecha')
+    detalles_movimientos = MovimientoInventario.objects.filter(
+        fecha__gte=inicio_dia, 
+        fecha__lte=fin_dia,
+        empresa=empresa_actual
+    ).select_related('producto', 'sucursal', 'usuario').order_by('-fecha')
 
     return render(request, 'reporte_movimientos_dia.html', {
         'fecha_hoy': fecha,
@@ -69,7 +73,7 @@ def reporte_inventario_valorizado(request):
     
     # Obtener inventarios con stock > 0
     inventarios = Inventario.objects.filter(
-        producto__empresa=empresa_actual,
+        empresa=empresa_actual,
         cantidad__gt=0
     ).select_related(
         'producto', 
@@ -128,10 +132,10 @@ def reporte_inventario_valorizado(request):
         )
     ).order_by('-valor_total')[:10]
     
-    # Productos con stock bajo
+    # Productos con stock bajo (en o bajo el mínimo), leídos desde las alertas de stock
     productos_stock_bajo = Inventario.objects.filter(
-        producto__empresa=empresa_actual,
-        cantidad__lte=F('stock_minimo')
+        alertas__empresa=empresa_actual,
+        alertas__tipo='bajo'
     ).select_related('producto', 'sucursal').order_by('cantidad')
     
     # Calcular totales generales
@@ -0,0 +1,48 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+def _clave_version(espacio, clave):
+    return f'version:{espacio}:{clave}'
+
+
+def obtener_version(espacio, clave):
+    """
+    Retorna la versión actual de los datos identificados por ``espacio`` y ``clave``.
+    Las entradas de caché que dependen de esos datos incluyen la versión en su clave,
+    así que incrementarla las invalida sin tener que borrarlas.
+
+    :param espacio: tipo de dato versionado (por ejemplo, 'producto' o 'catalogo')
+    :param clave: identificador dentro del espacio (por ejemplo, el id del producto)
+    :return: versión actual
+    """
+    # Se parte de un valor basado en el reloj para no reutilizar una versión anterior si la clave expira
+    return cache.get_or_set(_clave_version(espacio, clave), time.time_ns(), timeout=None)
+
+
+def incrementar_version(espacio, clave):
+    """
+    Invalida todas las entradas de caché construidas con la versión actual de ``espacio:clave``.
+    """
+    try:
+        cache.incr(_clave_version(espacio, clave))
+    except ValueError:
+        cache.set(_clave_version(espacio, clave), time.time_ns(), timeout=None)
+
+
+def contar_cacheado(queryset, espacio, clave, timeout=60 * 60, limite=None):
+    """
+    Retorna ``queryset.count()`` cacheado con la versión de ``espacio:clave``.
+    La consulta SQL forma parte de la clave, así que cada combinación de filtros tiene su propio conteo.
+
+    :param limite: si se indica, se cuentan como máximo ``limite + 1`` filas; un resultado mayor
+        que ``limite`` significa "más de ``limite``"
+    """
+    consulta = hashlib.md5(str(queryset.query).encode()).hexdigest()
+    llave = f'conteo:{espacio}:{clave}:{obtener_version(espacio, clave)}:{consulta}'
+    if limite is None:
+        return cache.get_or_set(llave, queryset.count, timeout=timeout)
+    return cache.get_or_set(f'{llave}:{limite}', lambda: queryset.order_by().values('pk')[:limite + 1].count(),
+                            timeout=timeout)
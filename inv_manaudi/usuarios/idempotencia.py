@@ -0,0 +1,93 @@
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+# Tiempo durante el cual una clave protege contra reintentos; luego la depura depurar_claves_idempotencia
+VIGENCIA = timedelta(hours=24)
+
+
+def obtener_clave(request):
+    """Clave enviada en la cabecera Idempotency-Key o en el campo oculto del formulario."""
+    return (request.headers.get('Idempotency-Key') or request.POST.get('clave_idempotencia', '')).strip()[:64]
+
+
+def _respuesta_guardada(request, registro):
+    if registro.ubicacion:
+        messages.info(request, 'La solicitud ya había sido procesada; no se volvió a aplicar.')
+    respuesta = HttpResponse(bytes(registro.contenido), status=registro.estado, content_type=registro.tipo_contenido)
+    if registro.ubicacion:
+        respuesta['Location'] = registro.ubicacion
+    return respuesta
+
+
+def _registrar(request, clave, ahora):
+    """
+    Registra la clave como solicitud en curso.
+
+    :return: tupla (registro, creado); si la clave ya existía, el registro existente (o None si se
+        eliminó mientras tanto) y False
+    """
+    try:
+        with transaction.atomic():
+            return ClaveIdempotencia.objects.create(usuario=request.user, clave=clave, ruta=request.path,
+                                                    expira=ahora + VIGENCIA), True
+    except IntegrityError:
+        return ClaveIdempotencia.objects.filter(usuario=request.user, clave=clave).first(), False
+
+
+def idempotente(view_func):
+    """
+    Protege una vista POST contra la repetición de la misma solicitud (doble clic, reintento del
+    navegador o de la red).
+
+    La primera solicitud con una clave la registra antes de ejecutar la vista y guarda su respuesta;
+    las repeticiones reciben esa misma respuesta sin ejecutar la vista, y mientras la original sigue
+    en curso reciben 409. Las solicitudes sin clave se procesan como siempre.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        clave = obtener_clave(request) if request.method == 'POST' else ''
+        if not clave:
+            return view_func(request, *args, **kwargs)
+
+        ahora = timezone.now()
+        registro, creado = _registrar(request, clave, ahora)
+        if not creado and registro is not None and registro.expira <= ahora:
+            # Clave vencida: se elimina solo si sigue vencida (otra solicitud concurrente puede haberla
+            # eliminado y registrado de nuevo) y se intenta registrar una única vez más
+            ClaveIdempotencia.objects.filter(pk=registro.pk, expira__lte=ahora).delete()
+            registro, creado = _registrar(request, clave, ahora)
+        if not creado:
+            if registro is None:
+                # Otra solicitud liberó la clave entre el INSERT y la lectura
+                return JsonResponse({'error': 'La solicitud ya se está procesando.'}, status=409)
+            if registro.ruta != request.path:
+                return JsonResponse({'error': 'La clave de idempotencia ya se usó en otra operación.'}, status=422)
+            if registro.estado is None:
+                return JsonResponse({'error': 'La solicitud ya se está procesando.'}, status=409)
+            return _respuesta_guardada(request, registro)
+
+        try:
+            respuesta = view_func(request, *args, **kwargs)
+        except Exception:
+            # La operación no se completó: la clave queda libre para reintentar
+            registro.delete()
+            raise
+
+        if respuesta.status_code >= 500 or respuesta.streaming:
+            registro.delete()
+            return respuesta
+
+        registro.estado = respuesta.status_code
+        registro.tipo_contenido = respuesta.get('Content-Type', '')
+        registro.ubicacion = respuesta.get('Location', '')
+        registro.contenido = respuesta.content
+        registro.save(update_fields=['estado', 'tipo_contenido', 'ubicacion', 'contenido'])
+        return respuesta
+    return _wrapped_view
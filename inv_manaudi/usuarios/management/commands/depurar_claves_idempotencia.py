@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from usuarios.models import ClaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = 'Elimina las claves de idempotencia vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tamano-bloque',
+            type=int,
+            default=5000,
+            help='Claves eliminadas por consulta (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        ahora = timezone.now()
+        vencidas = ClaveIdempotencia.objects.filter(expira__lt=ahora)
+        total = 0
+        while True:
+            ids = list(vencidas.values_list('pk', flat=True)[:options['tamano_bloque']])
+            if not ids:
+                break
+            total += ClaveIdempotencia.objects.filter(pk__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f"  [OK] {total} claves de idempotencia eliminadas"))
@@ -51,3 +51,26 @@ class UsuarioPerfil(models.Model):
 
     def __str__(self):
         return f'{self.usuario.username} - {self.empresa.nombre} ({self.sucursal.nombre if self.sucursal else "Sin Sucursal"})'
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Resultado de un POST identificado por una clave de idempotencia (ver usuarios/idempotencia.py).
+    Si la misma solicitud se repite, se devuelve la respuesta guardada sin volver a ejecutarla.
+    ``estado`` queda vacío mientras la solicitud original se está procesando.
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='claves_idempotencia')
+    clave = models.CharField(max_length=64)
+    ruta = models.CharField(max_length=255)
+    estado = models.PositiveSmallIntegerField(null=True, blank=True)
+    tipo_contenido = models.CharField(max_length=100, blank=True)
+    ubicacion = models.CharField(max_length=500, blank=True)
+    contenido = models.BinaryField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('usuario', 'clave')
+
+    def __str__(self):
+        return f'{self.usuario} - {self.clave} ({self.ruta})'
@@ -0,0 +1,102 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+TAMANO_PAGINA = 50
+
+
+def codificar_cursor(fecha, pk):
+    """Codifica la posición (fecha, id) de una fila como un texto apto para la URL."""
+    return base64.urlsafe_b64encode(f'{fecha.isoformat()}|{pk}'.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    """
+    Decodifica un cursor generado por ``codificar_cursor``.
+
+    :return: tupla (fecha, id), o None si el cursor no es válido
+    """
+    try:
+        fecha, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def codificar_clave(valores):
+    """Codifica una lista de valores serializables a JSON (p. ej. columna de orden e id) como texto apto para la URL."""
+    return base64.urlsafe_b64encode(json.dumps(valores, cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decodificar_clave(cursor):
+    """
+    Decodifica un cursor generado por ``codificar_clave``.
+
+    :return: lista de valores, o None si el cursor no es válido
+    """
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    return valores if isinstance(valores, list) and valores else None
+
+
+def filtrar_despues_de(queryset, campo, valor, pk, descendente=False):
+    """Filas que siguen a la posición (valor, pk) en el orden (campo, pk), ascendente o descendente."""
+    operador = 'lt' if descendente else 'gt'
+    return queryset.filter(Q(**{f'{campo}__{operador}': valor}) | Q(**{campo: valor, f'pk__{operador}': pk}))
+
+
+def _url_con_cursor(request, prefijo, parametro, cursor):
+    params = request.GET.copy()
+    params.pop(f'{prefijo}_despues', None)
+    params.pop(f'{prefijo}_antes', None)
+    params[f'{prefijo}_{parametro}'] = cursor
+    return f'?{params.urlencode()}'
+
+
+def paginar_por_cursor(request, queryset, campo_fecha, prefijo, tamano=TAMANO_PAGINA):
+    """
+    Pagina un queryset de la fila más reciente a la más antigua usando (campo_fecha, id) como cursor.
+
+    A diferencia de OFFSET, cada página filtra desde la posición del cursor, así que con un índice
+    sobre (campo_fecha, id) la página N cuesta lo mismo que la primera. Los cursores se leen de
+    ``<prefijo>_despues`` (página siguiente) y ``<prefijo>_antes`` (página anterior) en la query
+    string, lo que permite paginar varias tablas en la misma vista.
+
+    :return: diccionario con ``elementos``, ``url_siguiente`` y ``url_anterior`` (None si no hay más)
+    """
+    despues = decodificar_cursor(request.GET.get(f'{prefijo}_despues', ''))
+    antes = decodificar_cursor(request.GET.get(f'{prefijo}_antes', '')) if not despues else None
+
+    if antes:
+        fecha, pk = antes
+        filas = list(queryset.filter(
+            Q(**{f'{campo_fecha}__gt': fecha}) | Q(**{campo_fecha: fecha, 'pk__gt': pk})
+        ).order_by(campo_fecha, 'pk')[:tamano + 1])
+        hay_anteriores, hay_siguientes = len(filas) > tamano, True
+        elementos = filas[:tamano][::-1]
+    else:
+        if despues:
+            fecha, pk = despues
+            queryset = queryset.filter(
+                Q(**{f'{campo_fecha}__lt': fecha}) | Q(**{campo_fecha: fecha, 'pk__lt': pk})
+            )
+        filas = list(queryset.order_by(f'-{campo_fecha}', '-pk')[:tamano + 1])
+        hay_anteriores, hay_siguientes = despues is not None, len(filas) > tamano
+        elementos = filas[:tamano]
+
+    pagina = {'elementos': elementos, 'url_siguiente': None, 'url_anterior': None}
+    if elementos and hay_siguientes:
+        ultimo = elementos[-1]
+        pagina['url_siguiente'] = _url_con_cursor(
+            request, prefijo, 'despues', codificar_cursor(getattr(ultimo, campo_fecha), ultimo.pk))
+    if elementos and hay_anteriores:
+        primero = elementos[0]
+        pagina['url_anterior'] = _url_con_cursor(
+            request, prefijo, 'antes', codificar_cursor(getattr(primero, campo_fecha), primero.pk))
+    return pagina
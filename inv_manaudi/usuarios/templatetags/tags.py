@@ -1,8 +1,11 @@
+import uuid
 from functools import wraps
 
 from django import template
 from django.contrib.auth.decorators import user_passes_test
 from django.shortcuts import render
+from django.utils.html import format_html
+from inventario.notificaciones import servido_por_asgi
 
 register = template.Library()
 
@@ -12,6 +15,18 @@ def pertenece_grupo(user, group_name):
     return user.groups.filter(name=group_name).exists()
 
 
+@register.filter(name='servido_por_asgi')
+def filtro_servido_por_asgi(request):
+    """Si la petición llegó por el punto de entrada ASGI (ver inventario/notificaciones.py)."""
+    return servido_por_asgi(request)
+
+
+@register.simple_tag
+def clave_idempotencia():
+    """Campo oculto con una clave nueva por formulario renderizado (ver usuarios/idempotencia.py)."""
+    return format_html('<input type="hidden" name="clave_idempotencia" value="{}">', uuid.uuid4().hex)
+
+
 def control_acceso(grupo_requerido):
     def decorador(view_func):
         @wraps(view_func)
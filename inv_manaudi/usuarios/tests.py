@@ -1,3 +1,52 @@
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from inventario.models import Inventario, MovimientoInventario
+from inventario.tests import crear_datos_base, crear_usuario
+from .models import ClaveIdempotencia
+
+
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        self.empresa, self.bodega, self.local, self.producto = crear_datos_base()
+        self.client.force_login(crear_usuario(self.empresa))
+        self.datos = {
+            'sucursal': self.bodega.pk, 'producto': self.producto.pk, 'tipo_movimiento': 'entrada',
+            'tipo_documento': 'otros', 'cantidad': 5, 'documento_respaldo': 'DOC-1',
+            'clave_idempotencia': 'abc123',
+        }
+
+    def test_reenvio_con_la_misma_clave_no_duplica_el_movimiento(self):
+        primera = self.client.post(reverse('movimiento_inventario'), self.datos)
+        segunda = self.client.post(reverse('movimiento_inventario'), self.datos)
+        self.assertEqual(primera.status_code, 302)
+        self.assertEqual(segunda.status_code, 302)
+        self.assertEqual(segunda['Location'], primera['Location'])
+        self.assertEqual(MovimientoInventario.objects.count(), 1)
+        self.assertEqual(Inventario.objects.get(sucursal=self.bodega, producto=self.producto).cantidad, 5)
+
+        # Una clave nueva es otra operación
+        self.client.post(reverse('movimiento_inventario'), dict(self.datos, clave_idempotencia='def456'))
+        self.assertEqual(Inventario.objects.get(sucursal=self.bodega, producto=self.producto).cantidad, 10)
+
+    def test_clave_vencida_se_depura_y_permite_reintentar(self):
+        self.client.post(reverse('movimiento_inventario'), self.datos)
+        ClaveIdempotencia.objects.update(expira=timezone.now() - timedelta(minutes=1))
+        call_command('depurar_claves_idempotencia', stdout=io.StringIO())
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+        self.client.post(reverse('movimiento_inventario'), self.datos)
+        self.assertEqual(MovimientoInventario.objects.count(), 2)
+
+    def test_clave_vencida_sin_depurar_se_reutiliza(self):
+        self.client.post(reverse('movimiento_inventario'), self.datos)
+        ClaveIdempotencia.objects.update(expira=timezone.now() - timedelta(minutes=1))
 
-# Create your tests here.
+        self.client.post(reverse('movimiento_inventario'), self.datos)
+        self.assertEqual(MovimientoInventario.objects.count(), 2)
+        self.assertGreater(ClaveIdempotencia.objects.get().expira, timezone.now())
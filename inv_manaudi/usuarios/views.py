@@ -7,7 +7,7 @@ from django.db.models import F, Sum
 from productos.models import Producto
 from .forms import EmpresaForm, SucursalForm
 from .templatetags.tags import control_acceso
-from inventario.models import MovimientoInventario, Inventario
+from inventario.models import AlertaStock, MovimientoInventario, Inventario
 from .models import Empresa, Sucursal
 
 
@@ -20,21 +20,29 @@ def inicio(request):
     # Si el usuario tiene sucursal específica, muestra solo los datos de su sucursal
     if sucursal_usuario:
         total_productos = Producto.objects.filter(empresa=empresa_usuario, inventarios__sucursal=sucursal_usuario).distinct().count()
-        total_stock = Inventario.objects.filter(producto__empresa=empresa_usuario, sucursal=sucursal_usuario).aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-        productos_bajo_stock = Inventario.objects.filter(producto__empresa=empresa_usuario, sucursal=sucursal_usuario, cantidad__lt=F('stock_minimo')).count()
-        productos_agotados = Inventario.objects.filter(producto__empresa=empresa_usuario, sucursal=sucursal_usuario, cantidad=0).count()
-        movimientos_recientes = MovimientoInventario.objects.filter(producto__empresa=empresa_usuario, sucursal=sucursal_usuario).order_by('-fecha')
+        totales = Inventario.objects.filter(empresa=empresa_usuario, sucursal=sucursal_usuario).aggregate(Sum('cantidad'), Sum('en_transito'))
+        total_stock = totales['cantidad__sum'] or 0
+        total_en_transito = totales['en_transito__sum'] or 0
+        alertas = AlertaStock.objects.filter(empresa=empresa_usuario, sucursal=sucursal_usuario)
+        productos_bajo_stock = alertas.filter(tipo='bajo', inventario__cantidad__lt=F('inventario__stock_minimo')).count()
+        productos_agotados = alertas.filter(tipo='agotado').count()
+        movimientos_recientes = MovimientoInventario.objects.filter(empresa=empresa_usuario, sucursal=sucursal_usuario).order_by('-fecha')
     else:
         # Si el usuario no tiene sucursal (admin/supervisor), mostrar datos de toda la empresa
         if empresa_usuario:
             total_productos = Producto.objects.filter(empresa=empresa_usuario).distinct().count()
-            total_stock = Inventario.objects.filter(producto__empresa=empresa_usuario).aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-            productos_bajo_stock = Inventario.objects.filter(producto__empresa=empresa_usuario, cantidad__lt=F('stock_minimo')).count()
-            productos_agotados = Inventario.objects.filter(producto__empresa=empresa_usuario, cantidad=0).count()
-            movimientos_recientes = MovimientoInventario.objects.filter(producto__empresa=empresa_usuario).order_by('-fecha')
+            totales = Inventario.objects.filter(empresa=empresa_usuario).aggregate(Sum('cantidad'), Sum('en_transito'))
+            total_stock = totales['cantidad__sum'] or 0
+            total_en_transito = totales['en_transito__sum'] or 0
+            # Las alertas de stock solo contienen filas en o bajo el mínimo; la comparación se hace sobre ellas
+            alertas = AlertaStock.objects.filter(empresa=empresa_usuario)
+            productos_bajo_stock = alertas.filter(tipo='bajo', inventario__cantidad__lt=F('inventario__stock_minimo')).count()
+            productos_agotados = alertas.filter(tipo='agotado').count()
+            movimientos_recientes = MovimientoInventario.objects.filter(empresa=empresa_usuario).order_by('-fecha')
         else:
             total_productos = 0
             total_stock = 0
+            total_en_transito = 0
             productos_bajo_stock = 0
             productos_agotados = 0
             movimientos_recientes = []
@@ -42,6 +50,7 @@ def inicio(request):
     return render(request, 'inicio.html', {
         'total_productos': total_productos,
         'total_stock': total_stock,
+        'total_en_transito': total_en_transito,
         'productos_bajo_stock': productos_bajo_stock,
         'productos_agotados': productos_agotados,
         'movimientos_recientes': movimientos_recientes,